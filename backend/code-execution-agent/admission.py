@@ -0,0 +1,227 @@
+"""
+Admission control for sandbox executions.
+
+- Each user has a token bucket (rate per second, burst); a request costs one token per run
+  (the caller can weight that, e.g. by timeout) and is rejected, with the time until enough
+  tokens are back, if the bucket holds fewer. A batch is charged for all of its runs at once.
+- At most max_concurrency executions hold a slot at once (sized to the CPU cores).
+- Requests waiting for a slot are served by self-clocked weighted fair queuing: each gets a
+  virtual finish tag max(V, user's last tag) + cost / weight and the smallest tag goes next,
+  so a user with many queued runs only delays their own later runs.
+- When the queue (overall or the user's share of it) is full, requests are rejected at once
+  with an estimated retry-after instead of waiting until they time out.
+
+Queue length at each enqueue and time spent waiting are recorded as histograms.
+"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Sequence
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+QUEUE_LENGTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+WAIT_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class AdmissionError(Exception):
+    """Raised when a request is not admitted; retry_after is in seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimitedError(AdmissionError):
+    """The user's token bucket is empty"""
+
+
+class QueueFullError(AdmissionError):
+    """Too many requests are already waiting for a slot"""
+
+
+class Histogram:
+    """Cumulative bucket counts, in the same shape Prometheus histograms use"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = list(itertools.accumulate(self.counts))
+        buckets = {str(bound): cumulative[i] for i, bound in enumerate(self.buckets)}
+        buckets["+Inf"] = cumulative[-1]
+        return {"buckets": buckets, "count": self.count, "sum": round(self.sum, 6)}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int, rate: float = 2.0, burst: float = 10.0, max_queue: int = 256,
+                 max_queued_per_user: int = 8, max_tracked_users: int = 10000):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.max_tracked_users = max_tracked_users
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._active = 0
+        # Entries are [finish tag, sequence, user, future]; the sequence keeps equal tags FIFO.
+        # Cancelled entries stay in the heap until popped or compacted; _waiting counts the live ones
+        self._queue: List[list] = []
+        self._waiting = 0
+        self._queued_per_user: Dict[str, int] = {}
+        self._last_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        # Smoothed slot hold time, used to estimate Retry-After
+        self._service_time = 1.0
+
+        self.queue_length = Histogram(QUEUE_LENGTH_BUCKETS)
+        self.wait_time = Histogram(WAIT_TIME_BUCKETS)
+        self.stats_counters = {"admitted": 0, "rate_limited": 0, "queue_full": 0}
+
+    def check_rate(self, user: str, tokens: float = 1.0):
+        """Spend the user's tokens for one request or raise RateLimitedError"""
+        self.check_rates({user: tokens})
+
+    def check_rates(self, costs: Dict[str, float]):
+        """Spend each user's tokens, or none at all and raise RateLimitedError if any of them can't pay"""
+        now = time.monotonic()
+        buckets = {}
+        for user in costs:
+            bucket = self._buckets.get(user)
+            if bucket is None:
+                if len(self._buckets) >= self.max_tracked_users:
+                    self._prune_buckets(now)
+                bucket = self._buckets[user] = TokenBucket(self.burst, now)
+            bucket.refill(self.rate, self.burst, now)
+            buckets[user] = bucket
+        for user, tokens in costs.items():
+            if buckets[user].tokens < tokens:
+                self.stats_counters["rate_limited"] += 1
+                raise RateLimitedError(f"Rate limit exceeded for user {user}",
+                                       (tokens - buckets[user].tokens) / self.rate)
+        for user, tokens in costs.items():
+            buckets[user].tokens -= tokens
+
+    def _prune_buckets(self, now: float):
+        """Forget buckets that have refilled completely; they behave exactly like new ones"""
+        refill_time = self.burst / self.rate
+        for user in [u for u, b in self._buckets.items() if now - b.updated >= refill_time]:
+            del self._buckets[user]
+
+    def _estimated_wait(self) -> float:
+        return self._service_time * (self._waiting / self.max_concurrency + 1)
+
+    @asynccontextmanager
+    async def slot(self, user: str, cost: float = 1.0, weight: float = 1.0) -> AsyncIterator[None]:
+        """Hold one of max_concurrency execution slots; cost is the run's expected length (its timeout)"""
+        await self._acquire(user, cost, weight)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - started)
+            self._release()
+
+    async def _acquire(self, user: str, cost: float, weight: float):
+        if self._active < self.max_concurrency and not self._waiting:
+            self._active += 1
+            self.stats_counters["admitted"] += 1
+            self.wait_time.observe(0.0)
+            return
+
+        if self._waiting >= self.max_queue or self._queued_per_user.get(user, 0) >= self.max_queued_per_user:
+            self.stats_counters["queue_full"] += 1
+            raise QueueFullError("Execution queue is full", self._estimated_wait())
+
+        finish = max(self._virtual_time, self._last_finish.get(user, 0.0)) + cost / weight
+        self._last_finish[user] = finish
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [finish, next(self._sequence), user, future])
+        self._queued_per_user[user] = self._queued_per_user.get(user, 0) + 1
+        self._waiting += 1
+        self.queue_length.observe(self._waiting)
+
+        enqueued = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the caller gave up: pass it on
+                self._release()
+            else:
+                future.cancel()
+                self._dequeued(user)
+                self._compact()
+            raise
+        self.stats_counters["admitted"] += 1
+        self.wait_time.observe(time.monotonic() - enqueued)
+
+    def _compact(self):
+        """Drop cancelled entries once they make up half the heap, so they can't pile up"""
+        if len(self._queue) > 2 * self._waiting:
+            self._queue = [entry for entry in self._queue if not entry[3].cancelled()]
+            heapq.heapify(self._queue)
+
+    def _dequeued(self, user: str):
+        self._waiting -= 1
+        remaining = self._queued_per_user.get(user, 1) - 1
+        if remaining:
+            self._queued_per_user[user] = remaining
+        else:
+            self._queued_per_user.pop(user, None)
+
+    def _release(self):
+        self._active -= 1
+        while self._queue:
+            finish, _, user, future = heapq.heappop(self._queue)
+            if future.cancelled():
+                continue
+            self._dequeued(user)
+            self._virtual_time = finish
+            self._active += 1
+            future.set_result(None)
+            break
+        if not self._waiting and len(self._last_finish) > self.max_tracked_users:
+            # Tags at or behind the virtual clock no longer affect anyone's position
+            self._last_finish = {u: f for u, f in self._last_finish.items() if f > self._virtual_time}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_counters,
+            "active": self._active,
+            "queued": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "queue_length": self.queue_length.snapshot(),
+            "wait_time_seconds": self.wait_time.snapshot()
+        }
@@ -0,0 +1,102 @@
+"""
+Benchmark: AST security validator vs the original substring deny-list.
+
+Reports throughput for the legacy scan, the validator without its cache (first run of a
+submission) and with a warm cache (re-runs), then where each one gets the verdict wrong on
+a corpus of labelled submissions.
+
+Run from this directory:  python bench_security.py [iterations]
+"""
+import sys
+import time
+
+from security import CodeValidator, check_code
+
+# (submission, should be allowed)
+CORPUS = [
+    ("for i in range(1, 11):\n    print(i)\n", True),
+    ("def celsius_to_fahrenheit(celsius):\n    return (celsius * 9/5) + 32\n", True),
+    ("def is_palindrome(text):\n    cleaned = ''.join(c.lower() for c in text if c.isalnum())\n"
+     "    return cleaned == cleaned[::-1]\n", True),
+    ("def sum_numbers(numbers):\n    total = 0\n    for n in numbers:\n        total += n\n    return total\n", True),
+    ("def swap_variables(a, b):\n    a, b = b, a\n    return a, b\n", True),
+    ("name = 'Alice'\nage = 25\nfavorite_color = 'blue'\nprint(f'{name} is {age} and likes {favorite_color}')\n", True),
+    ("profile = {'name': 'Sam', 'level': 3}\nfor key, value in profile.items():\n    print(key, value)\n", True),
+    ("def evaluate(expression_parts):\n    return sum(expression_parts)\nprint(evaluate([1, 2, 3]))\n", True),
+    ("filename = 'notes.txt'\nprint(filename.upper())\n", True),
+    ("openings = ['e4', 'd4', 'c4']\nprint(len(openings))\n", True),
+    ("executor_count = 3\nprint(executor_count * 2)\n", True),
+    ("import math\nprint(math.sqrt(16))\n", True),
+    ("from collections import Counter\nprint(Counter('mississippi').most_common(2))\n", True),
+    ("class Stack:\n    def __init__(self):\n        self.items = []\n    def push(self, x):\n        self.items.append(x)\n"
+     "    def pop(self):\n        return self.items.pop()\ns = Stack()\ns.push(1)\nprint(s.pop())\n", True),
+    ("try:\n    x = int('abc')\nexcept ValueError as e:\n    print('bad input:', e)\n", True),
+    ("if __name__ == '__main__':\n    print([n * n for n in range(10) if n % 2 == 0])\n", True),
+    ("import os\nos.system('ls /')\n", False),
+    ("import importlib\nimportlib.import_module('o' + 's').system('id')\n", False),
+    ("getattr(__builtins__, 'op' + 'en')('/etc/passwd').read()\n", False),
+    ("print(().__class__.__bases__[0].__subclasses__())\n", False),
+    ("b = print.__self__\nb.exec('import os')\n", False),
+    ("f = lambda: 0\nprint(f.__globals__)\n", False),
+    ("import subprocess\nsubprocess.run(['ls'])\n", False),
+    ("from socket import socket\nsocket().connect(('example.com', 80))\n", False),
+    ("data = input('Enter a number: ')\n", False),
+    ("eval(\"__imp\" + \"ort__('os')\")\n", False),
+    ("import sys\nsys.modules['os'].system('id')\n", False),
+    ("x = vars()\nprint(x)\n", False),
+]
+
+DANGEROUS_PATTERNS = [
+    'import os', 'import sys', 'import subprocess', 'import shutil',
+    '__import__', 'eval', 'exec', 'open', 'file', 'input',
+    'import requests', 'import urllib', 'import socket',
+    'import ftplib', 'import smtplib', 'import poplib', 'import imaplib'
+]
+
+
+def legacy_allowed(code: str) -> bool:
+    """The original lowercase substring scan from execute_code"""
+    code_lower = code.lower()
+    for pattern in DANGEROUS_PATTERNS:
+        if pattern in code_lower:
+            return False
+    return True
+
+
+def bench(label: str, fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for code, _ in CORPUS:
+            fn(code)
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / (iterations * len(CORPUS))
+    print(f"{label:<12} {1 / per_call:>12,.0f} checks/s  {per_call * 1e6:7.2f} us/check")
+    return per_call
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(f"{len(CORPUS)} submissions x {iterations} iterations")
+
+    validator = CodeValidator()
+    for code, _ in CORPUS:
+        validator.validate(code)
+
+    bench("legacy", legacy_allowed, iterations)
+    bench("ast", check_code, iterations)
+    bench("ast cached", validator.validate, iterations)
+
+    print("\nWrong verdicts (expected allowed/blocked):")
+    errors = {"legacy": 0, "ast": 0}
+    for code, expected in CORPUS:
+        verdicts = {"legacy": legacy_allowed(code), "ast": check_code(code).ok}
+        for name, allowed in verdicts.items():
+            if allowed != expected:
+                errors[name] += 1
+                kind = "false positive" if expected else "missed"
+                print(f"  {name:<7} {kind:<14} {code.splitlines()[0][:60]!r}")
+    print(f"\nlegacy: {errors['legacy']} wrong, ast: {errors['ast']} wrong, out of {len(CORPUS)}")
+
+
+if __name__ == "__main__":
+    main()
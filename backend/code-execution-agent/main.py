@@ -1,21 +1,95 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import subprocess
+import asyncio
+import json
 import tempfile
 import os
-import signal
 import time
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 import logging
+from sandbox_pool import SandboxPool, PoolSaturatedError, OutputCallback
+from security import CodeValidator, ValidationResult
+from result_cache import ResultCache, cacheable
+from admission import AdmissionController, AdmissionError
 
 app = FastAPI(title="Code Execution Agent", version="1.0.0")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Warm sandbox workers; each run forks from a pre-imported interpreter instead of starting a new one
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", 4))
+SANDBOX_MAX_QUEUE = int(os.getenv("SANDBOX_MAX_QUEUE", 64))
+SANDBOX_MAX_RUNS_PER_WORKER = int(os.getenv("SANDBOX_MAX_RUNS_PER_WORKER", 100))
+
+# Upper bounds on what a request may ask for; requests above them are clamped
+DEFAULT_TIMEOUT = 5
+MAX_TIMEOUT = int(os.getenv("MAX_EXECUTION_TIMEOUT", 30))
+MAX_MEMORY_LIMIT_MB = int(os.getenv("MAX_MEMORY_LIMIT_MB", 256))
+MAX_OUTPUT_BYTES = int(os.getenv("MAX_OUTPUT_BYTES", 1024 * 1024))
+# Stop a program as soon as it passes MAX_OUTPUT_BYTES instead of discarding the rest until it exits
+KILL_ON_OUTPUT_LIMIT = os.getenv("KILL_ON_OUTPUT_LIMIT", "true").lower() == "true"
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 500))
+# Items of one batch running at once; defaults to the pool size so a batch keeps every worker busy
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", SANDBOX_POOL_SIZE))
+
+# Admission: executions holding a sandbox at once (at most one per core), per-user request rate
+# and burst, and how many may wait for a slot in total and per user before getting a 429
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", min(os.cpu_count() or 1, SANDBOX_POOL_SIZE)))
+ADMISSION_RATE_PER_SECOND = float(os.getenv("ADMISSION_RATE_PER_SECOND", 2.0))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", 10))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", SANDBOX_MAX_QUEUE))
+ADMISSION_MAX_QUEUED_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUED_PER_USER", 8))
+
+admission = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    rate=ADMISSION_RATE_PER_SECOND,
+    burst=ADMISSION_BURST,
+    max_queue=ADMISSION_MAX_QUEUE,
+    max_queued_per_user=ADMISSION_MAX_QUEUED_PER_USER
+)
+
+# Static checks are cached by code hash; students re-run unchanged code a lot
+code_validator = CodeValidator(max_entries=int(os.getenv("SECURITY_CACHE_SIZE", 4096)))
+
+# Results of deterministic programs, so re-running unchanged code skips the sandbox
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 10000)),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+)
+
+def sandbox_env() -> dict:
+    """Minimal environment for sandbox workers; nothing from the service's own (secrets included) is passed on"""
+    return {
+        "PATH": os.environ.get("PATH", os.defpath),
+        # Same str hashes (and so set iteration order) in every worker, so cached output matches a fresh run
+        "PYTHONHASHSEED": "0",
+        "LANG": "C.UTF-8",
+    }
+
+sandbox_pool = SandboxPool(
+    size=SANDBOX_POOL_SIZE,
+    max_queue=SANDBOX_MAX_QUEUE,
+    max_runs=SANDBOX_MAX_RUNS_PER_WORKER,
+    max_output=MAX_OUTPUT_BYTES,
+    kill_on_overflow=KILL_ON_OUTPUT_LIMIT,
+    env=sandbox_env(),
+    cwd=tempfile.gettempdir()  # Restrict working directory
+)
+
+@app.on_event("startup")
+async def startup():
+    await sandbox_pool.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await sandbox_pool.close()
+
 class CodeExecutionRequest(BaseModel):
     code: str
     user_id: str
-    timeout: int = 5  # seconds
+    timeout: int = DEFAULT_TIMEOUT  # seconds
     memory_limit: int = 50  # MB
 
 class CodeExecutionResponse(BaseModel):
@@ -23,89 +97,271 @@ class CodeExecutionResponse(BaseModel):
     error: Optional[str] = None
     execution_time: float
     success: bool
+    peak_memory_kb: Optional[int] = None
+    cpu_time: Optional[float] = None
+    output_truncated: bool = False
+    security_issues: Optional[List[Dict[str, Any]]] = None
+    cached: bool = False
 
-@app.post("/execute", response_model=CodeExecutionResponse)
-async def execute_code(request: CodeExecutionRequest):
+class BatchExecutionRequest(BaseModel):
+    items: List[CodeExecutionRequest]
+
+def security_rejection(validation: ValidationResult, start_time: float) -> CodeExecutionResponse:
+    """Response for code the static validator rejected, with line/column for each issue"""
+    return CodeExecutionResponse(
+        output="",
+        error=validation.error_message(),
+        execution_time=time.time() - start_time,
+        success=False,
+        security_issues=[issue._asdict() for issue in validation.issues]
+    )
+
+def execution_limits(request: CodeExecutionRequest) -> Tuple[int, int]:
+    """Requested timeout (s) and memory limit (MB), clamped to the agent's maximums"""
+    return max(1, min(request.timeout, MAX_TIMEOUT)), max(1, min(request.memory_limit, MAX_MEMORY_LIMIT_MB))
+
+def rate_cost(request: CodeExecutionRequest) -> float:
+    """Tokens a run takes from the user's bucket: one at the default timeout, more for longer runs"""
+    return execution_limits(request)[0] / DEFAULT_TIMEOUT
+
+async def run_code(user_id: str, code: str, validation: ValidationResult, timeout: int, memory_limit: int,
+                   on_output: Optional[OutputCallback] = None) -> Tuple[Dict[str, Any], bool]:
     """
-    Securely execute Python code in a sandboxed environment
-    Following the security requirements: 5s timeout, 50MB memory, no file/network access
+    Run code in the sandbox, or replay a cached result for deterministic programs. Returns (result, cached).
+    Sandbox runs wait for an admission slot in fair-queue order first; cache hits don't need one.
     """
-    start_time = time.time()
+    key = None
+    if validation.deterministic:
+        key = result_cache.key(code, timeout=timeout, memory_limit=memory_limit,
+                               max_output=MAX_OUTPUT_BYTES, kill_on_overflow=KILL_ON_OUTPUT_LIMIT)
+        result = result_cache.get(key)
+        if result is not None:
+            if on_output:
+                for stream in ("stdout", "stderr"):
+                    if result[stream]:
+                        on_output(stream, result[stream])
+            return result, True
 
-    # Validate code for dangerous operations
-    dangerous_patterns = [
-        'import os', 'import sys', 'import subprocess', 'import shutil',
-        '__import__', 'eval', 'exec', 'open', 'file', 'input',
-        'import requests', 'import urllib', 'import socket',
-        'import ftplib', 'import smtplib', 'import poplib', 'import imaplib'
-    ]
-
-    code_lower = request.code.lower()
-    for pattern in dangerous_patterns:
-        if pattern in code_lower:
-            return CodeExecutionResponse(
-                output="",
-                error=f"Security violation: {pattern} is not allowed",
-                execution_time=time.time() - start_time,
-                success=False
-            )
-
-    # Create a temporary file for the code
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-        f.write(request.code)
-        temp_file = f.name
+    # A run's cost in the fair queue is its timeout, so long runs use up a user's share faster
+    async with admission.slot(user_id, cost=timeout):
+        result = await sandbox_pool.run(code, timeout=timeout, memory_limit=memory_limit, on_output=on_output)
+    if key is not None and cacheable(result):
+        result_cache.set(key, result)
+    return result, False
 
-    try:
-        # Execute the code with timeout and memory limits
-        # Note: This is a simplified approach. In production, you'd want to use
-        # proper sandboxing technologies like Docker containers or specialized tools
-
-        # Set environment to restrict file access
-        env = os.environ.copy()
-        # Remove potentially dangerous environment variables
-        env.pop('PYTHONPATH', None)
-
-        # Execute with timeout
-        result = subprocess.run(
-            ['python', temp_file],
-            capture_output=True,
-            text=True,
-            timeout=request.timeout,
-            env=env,
-            cwd=tempfile.gettempdir()  # Restrict working directory
-        )
+def build_execution_response(result: Dict[str, Any], execution_time: float, memory_limit: int,
+                             cached: bool = False) -> CodeExecutionResponse:
+    """Turn a sandbox worker result into the API response"""
+    usage = {
+        "peak_memory_kb": result["peak_memory_kb"],
+        "cpu_time": result["cpu_time"],
+        "output_truncated": result["truncated"],
+        "cached": cached
+    }
 
-        execution_time = time.time() - start_time
+    if result["timed_out"]:
+        return CodeExecutionResponse(
+            output="",
+            error="Code execution timed out",
+            execution_time=execution_time,
+            success=False,
+            **usage
+        )
 
+    if result["violation"]:
         return CodeExecutionResponse(
-            output=result.stdout,
-            error=result.stderr if result.stderr else None,
+            output=result["stdout"],
+            error=f"Security violation: {result['violation']} is not allowed",
             execution_time=execution_time,
-            success=result.returncode == 0
+            success=False,
+            **usage
         )
 
-    except subprocess.TimeoutExpired:
-        execution_time = time.time() - start_time
+    limit_errors = {
+        "memory": f"Memory limit exceeded ({memory_limit} MB)",
+        "cpu": "CPU time limit exceeded",
+        "output": f"Output limit exceeded ({MAX_OUTPUT_BYTES} bytes), program stopped"
+    }
+    if result["limit_exceeded"] in limit_errors:
         return CodeExecutionResponse(
-            output="",
-            error="Code execution timed out",
+            output=result["stdout"],
+            error=limit_errors[result["limit_exceeded"]],
             execution_time=execution_time,
-            success=False
+            success=False,
+            **usage
         )
+
+    return CodeExecutionResponse(
+        output=result["stdout"],
+        error=result["stderr"] if result["stderr"] else None,
+        execution_time=execution_time,
+        success=result["exit_code"] == 0,
+        **usage
+    )
+
+@app.post("/execute", response_model=CodeExecutionResponse)
+async def execute_code(request: CodeExecutionRequest):
+    """
+    Securely execute Python code in a sandboxed environment
+    Following the security requirements: 5s timeout, 50MB memory, no file/network access
+    """
+    try:
+        return await execute_request(request)
+    except AdmissionError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header()})
+    except PoolSaturatedError:
+        raise HTTPException(status_code=503, detail="Too many executions queued, please retry shortly")
+
+async def execute_request(request: CodeExecutionRequest, check_rate: bool = True) -> CodeExecutionResponse:
+    """Validate and run one request; AdmissionError and PoolSaturatedError are left to the caller"""
+    start_time = time.time()
+    if check_rate:
+        admission.check_rate(request.user_id, rate_cost(request))
+
+    # Validate code for dangerous operations
+    validation = code_validator.validate(request.code)
+    if not validation.ok:
+        return security_rejection(validation, start_time)
+
+    timeout, memory_limit = execution_limits(request)
+    try:
+        result, cached = await run_code(request.user_id, request.code, validation, timeout, memory_limit)
+    except (AdmissionError, PoolSaturatedError):
+        raise
     except Exception as e:
-        execution_time = time.time() - start_time
+        logger.error(f"Sandbox execution failed: {e}")
         return CodeExecutionResponse(
             output="",
             error=str(e),
-            execution_time=execution_time,
+            execution_time=time.time() - start_time,
             success=False
         )
+
+    return build_execution_response(result, time.time() - start_time, memory_limit, cached)
+
+async def stream_batch(batch: BatchExecutionRequest) -> AsyncIterator[str]:
+    """Run the items with bounded parallelism and yield one NDJSON line per item as it finishes"""
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_item(index: int, request: CodeExecutionRequest) -> Tuple[int, CodeExecutionResponse]:
+        async with semaphore:
+            try:
+                # Every item was charged when the batch was accepted
+                return index, await execute_request(request, check_rate=False)
+            except AdmissionError as e:
+                return index, CodeExecutionResponse(
+                    output="",
+                    error=f"{e}, retry after {e.retry_after_header()}s",
+                    execution_time=0.0,
+                    success=False
+                )
+            except PoolSaturatedError:
+                return index, CodeExecutionResponse(
+                    output="",
+                    error="Too many executions queued, please retry shortly",
+                    execution_time=0.0,
+                    success=False
+                )
+
+    tasks = [asyncio.ensure_future(run_item(index, item)) for index, item in enumerate(batch.items)]
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, response = await next_done
+            succeeded += response.success
+            yield json.dumps({"index": index, "result": response.model_dump()}) + "\n"
+        yield json.dumps({"done": True, "count": len(tasks), "succeeded": succeeded,
+                          "elapsed": time.time() - start_time}) + "\n"
     finally:
-        # Clean up the temporary file
+        # Client went away: don't keep running the rest of its batch
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_execution(request: CodeExecutionRequest) -> AsyncIterator[str]:
+    """Yield output events as the program writes, then a done event with the full response"""
+    start_time = time.time()
+
+    validation = code_validator.validate(request.code)
+    if not validation.ok:
+        yield sse_event("done", security_rejection(validation, start_time).model_dump())
+        return
+
+    # Output chunks arrive through the callback; None marks the end of the run
+    chunks: asyncio.Queue = asyncio.Queue()
+    timeout, memory_limit = execution_limits(request)
+    run = asyncio.ensure_future(run_code(
+        request.user_id, request.code, validation, timeout, memory_limit,
+        on_output=lambda stream, data: chunks.put_nowait((stream, data))
+    ))
+    run.add_done_callback(lambda _: chunks.put_nowait(None))
+
+    try:
+        while (chunk := await chunks.get()) is not None:
+            yield sse_event("output", {"stream": chunk[0], "data": chunk[1]})
+
         try:
-            os.unlink(temp_file)
-        except:
-            pass
+            result, cached = run.result()
+        except AdmissionError as e:
+            yield sse_event("error", {"error": str(e), "retry_after": e.retry_after_header()})
+            return
+        except PoolSaturatedError:
+            yield sse_event("error", {"error": "Too many executions queued, please retry shortly"})
+            return
+        except Exception as e:
+            logger.error(f"Sandbox execution failed: {e}")
+            response = CodeExecutionResponse(output="", error=str(e), execution_time=time.time() - start_time, success=False)
+            yield sse_event("done", response.model_dump())
+            return
+
+        response = build_execution_response(result, time.time() - start_time, memory_limit, cached)
+        yield sse_event("done", response.model_dump())
+    finally:
+        # Client went away mid-run: stop the program (the pool kills the child and replaces the worker)
+        if not run.done():
+            run.cancel()
+
+@app.post("/execute/stream")
+async def execute_code_stream(request: CodeExecutionRequest):
+    """Execute code and stream its output as Server-Sent Events"""
+    # Checked before the stream starts so an over-budget client gets a real 429
+    try:
+        admission.check_rate(request.user_id, rate_cost(request))
+    except AdmissionError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header()})
+    return StreamingResponse(
+        stream_execution(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/execute/batch")
+async def execute_batch(batch: BatchExecutionRequest):
+    """Run many snippets across the sandbox pool, streaming NDJSON results in completion order"""
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: at most {BATCH_MAX_ITEMS} items per call")
+    # Each item is charged like a single run, all up front; the items then share the fair queue
+    # with everyone else's runs
+    costs: Dict[str, float] = {}
+    for item in batch.items:
+        costs[item.user_id] = costs.get(item.user_id, 0.0) + rate_cost(item)
+    if any(cost > admission.burst for cost in costs.values()):
+        raise HTTPException(status_code=413, detail="Batch exceeds the per-user rate limit burst; split it into smaller batches")
+    try:
+        admission.check_rates(costs)
+    except AdmissionError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header()})
+    logger.info(f"Execution batch of {len(batch.items)} items")
+    return StreamingResponse(
+        stream_batch(batch),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/health")
 async def health_check():
@@ -117,10 +373,22 @@ async def root():
         "message": "Code Execution Agent - Secure Python code execution service",
         "endpoints": {
             "/execute": "POST - Execute Python code securely",
-            "/health": "GET - Health check"
+            "/execute/stream": "POST - Execute code and stream its output as Server-Sent Events",
+            "/execute/batch": "POST - Execute many snippets, streaming NDJSON results as each completes",
+            "/health": "GET - Health check",
+            "/metrics": "GET - Sandbox pool, admission queue and cache statistics"
         }
     }
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "sandbox_pool": sandbox_pool.stats(),
+        "admission": admission.stats(),
+        "security_cache": code_validator.stats(),
+        "result_cache": result_cache.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8006)
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Content-addressed cache of sandbox results for deterministic programs.
+
+Entries are keyed on a hash of the normalized source, the interpreter version and the
+limits the program ran under, and evicted least-recently-used once the entry count or the
+byte budget is exceeded. Only programs the security validator classifies as deterministic
+should be stored; a hit is served without taking a sandbox worker.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import re
+import sys
+
+# Default reprs of objects, functions, generators, iterators...: "<Foo object at 0x7f3a...>"
+ADDRESS_PATTERN = re.compile(r"\bat 0x[0-9a-fA-F]+")
+
+
+def normalize_code(code: str) -> str:
+    """Unify line endings and trailing blank lines; anything else could change what the program prints"""
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip("\n") + "\n"
+
+
+def cacheable(result: Dict[str, Any]) -> bool:
+    """
+    Timeouts and CPU-limit kills depend on machine load, and violations recycle the worker: don't reuse those.
+    Nor output showing a memory address, which the static check can't rule out and differs on every run.
+    """
+    if result.get("timed_out") or result.get("violation") or result.get("limit_exceeded") == "cpu":
+        return False
+    return not any(ADDRESS_PATTERN.search(result.get(stream) or "") for stream in ("stdout", "stderr"))
+
+
+class ResultCache:
+    """LRU cache of worker result dicts with an entry cap and a byte budget"""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 interpreter: str = sys.version):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.interpreter = interpreter
+
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self.stats_counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def key(self, code: str, **limits: Any) -> bytes:
+        scope = "|".join(f"{name}={limits[name]}" for name in sorted(limits))
+        material = f"{self.interpreter}\0{scope}\0{normalize_code(code)}"
+        return hashlib.sha256(material.encode("utf-8", "surrogatepass")).digest()
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats_counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats_counters["hits"] += 1
+        return entry[0]
+
+    def set(self, key: bytes, result: Dict[str, Any]):
+        # Output dominates; 256 is a rough allowance for the rest of the dict
+        size = len(result.get("stdout", "")) + len(result.get("stderr", "")) + 256
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.stats_counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.stats_counters["hits"] + self.stats_counters["misses"]
+        return {
+            **self.stats_counters,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hit_rate": self.stats_counters["hits"] / lookups if lookups else 0.0
+        }
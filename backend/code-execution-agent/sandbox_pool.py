@@ -0,0 +1,240 @@
+"""
+Pool of warm sandbox worker processes (see sandbox_worker.py).
+
+Workers are started once and reused, and each run still happens in a freshly forked child
+inside the worker, so a run costs a fork instead of a full interpreter start. A worker is
+replaced after max_runs runs, after any run that tripped the sandbox audit hook, and whenever
+it stops answering. Replacing a worker mid-run (timeout, crash, or the caller being cancelled)
+also kills the process group of the child it was running, which killing the worker alone
+would leave behind. Callers wait for a free worker in FIFO order. When max_queue callers are
+already waiting, run() raises PoolSaturatedError immediately instead of queueing more.
+"""
+from typing import Any, Callable, Dict, Optional, Set
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import sys
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+# Time allowed on top of a run's own timeout for forking, collecting output and replying
+WORKER_GRACE_SECONDS = 2.0
+WORKER_START_TIMEOUT = 10.0
+# Largest single protocol line (one run's JSON-encoded output) the pool will read
+READ_LIMIT = 64 * 1024 * 1024
+
+
+# Receives (stream name, text) for each chunk of output while a run is in progress
+OutputCallback = Callable[[str, str], None]
+
+
+class PoolSaturatedError(Exception):
+    """Raised when too many callers are already waiting for a worker"""
+
+
+class SandboxError(Exception):
+    """Raised when a worker crashes, hangs or cannot be started"""
+
+
+class SandboxWorker:
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.runs = 0
+        # Process group of the child running the current request, until its response arrives
+        self.child_pgid: Optional[int] = None
+
+    @classmethod
+    async def start(cls, python: str, env: Dict[str, str], cwd: Optional[str]) -> "SandboxWorker":
+        process = await asyncio.create_subprocess_exec(
+            python, "-s", "-B", WORKER_SCRIPT,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            env=env, cwd=cwd, limit=READ_LIMIT
+        )
+        worker = cls(process)
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), WORKER_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            line = b""
+        if not line:
+            await worker.kill()
+            raise SandboxError("Sandbox worker failed to start")
+        return worker
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    async def run(self, request: Dict[str, Any], timeout: float,
+                  on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
+        """Send one request and wait for its final response, passing streamed output lines to on_output"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            self.process.stdin.write(json.dumps(request).encode() + b"\n")
+            await self.process.stdin.drain()
+            while True:
+                line = await asyncio.wait_for(self.process.stdout.readline(), max(0.0, deadline - loop.time()))
+                if not line:
+                    break
+                message = json.loads(line)
+                if "child" in message:
+                    self.child_pgid = message["child"]
+                    continue
+                if "stream" not in message:
+                    # The worker has reaped the child, so its group id may be reused from here on
+                    self.child_pgid = None
+                    self.runs += 1
+                    return message
+                if on_output:
+                    on_output(message["stream"], message["data"])
+        except asyncio.TimeoutError:
+            raise SandboxError(f"Sandbox worker {self.pid} stopped responding")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        raise SandboxError(f"Sandbox worker {self.pid} exited unexpectedly")
+
+    def kill_child(self):
+        """Kill the process group of a run still in progress"""
+        if self.child_pgid is not None:
+            try:
+                os.killpg(self.child_pgid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            self.child_pgid = None
+
+    async def kill(self):
+        # The child is in its own process group, so killing the worker alone would orphan it
+        self.kill_child()
+        if self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+        await self.process.wait()
+
+
+class SandboxPool:
+    def __init__(self, size: int = 4, max_queue: int = 64, max_runs: int = 100, max_output: int = 1024 * 1024,
+                 kill_on_overflow: bool = True, python: str = sys.executable, env: Optional[Dict[str, str]] = None,
+                 cwd: Optional[str] = None):
+        self.size = size
+        self.max_queue = max_queue
+        self.max_runs = max_runs
+        self.max_output = max_output
+        self.kill_on_overflow = kill_on_overflow
+        self.python = python
+        self.env = env if env is not None else dict(os.environ)
+        self.cwd = cwd
+
+        self._idle: "asyncio.Queue[SandboxWorker]" = asyncio.Queue()
+        self._workers: Set[SandboxWorker] = set()
+        # Replaced workers not yet confirmed dead
+        self._retiring: Set[SandboxWorker] = set()
+        self._respawns: Set[asyncio.Task] = set()
+        self._waiting = 0
+        self._ids = itertools.count(1)
+        self._closed = False
+        self.stats_counters = {"runs": 0, "rejected": 0, "recycled": 0, "violations": 0, "worker_failures": 0}
+
+    async def start(self):
+        workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+        for worker in workers:
+            self._idle.put_nowait(worker)
+        logger.info(f"Sandbox pool started with {self.size} workers")
+
+    async def _spawn(self) -> SandboxWorker:
+        worker = await SandboxWorker.start(self.python, self.env, self.cwd)
+        self._workers.add(worker)
+        return worker
+
+    async def run(self, code: str, timeout: float, memory_limit: float,
+                  on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
+        """
+        Run code in a warm worker with a wall-clock timeout (s) and memory limit (MB) and return the
+        worker response. If on_output is given, output chunks are passed to it as they are produced.
+        """
+        if self._closed:
+            raise SandboxError("Sandbox pool is shut down")
+        if self._idle.empty() and self._waiting >= self.max_queue:
+            self.stats_counters["rejected"] += 1
+            raise PoolSaturatedError(f"{self._waiting} executions already waiting")
+
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        # Anything other than a clean reply (including cancellation mid-run) leaves the
+        # worker's protocol stream in an unknown state, so it is replaced
+        recycle = True
+        try:
+            request = {
+                "id": next(self._ids),
+                "code": code,
+                "timeout": timeout,
+                "memory_limit": memory_limit,
+                "max_output": self.max_output,
+                "kill_on_overflow": self.kill_on_overflow,
+                "stream": on_output is not None
+            }
+            result = await worker.run(request, timeout + WORKER_GRACE_SECONDS, on_output)
+            if "error" in result:
+                raise SandboxError(result["error"])
+            self.stats_counters["runs"] += 1
+            if result.get("violation"):
+                self.stats_counters["violations"] += 1
+                logger.warning(f"Sandbox violation ({result['violation']}) in worker {worker.pid}, recycling it")
+            recycle = bool(result.get("violation")) or worker.runs >= self.max_runs
+            return result
+        except SandboxError:
+            self.stats_counters["worker_failures"] += 1
+            raise
+        finally:
+            if recycle:
+                self._replace(worker)
+            else:
+                self._idle.put_nowait(worker)
+
+    def _replace(self, worker: SandboxWorker):
+        self._workers.discard(worker)
+        self._retiring.add(worker)
+        # Right away rather than in _respawn, which may be cancelled before it runs
+        worker.kill_child()
+        self.stats_counters["recycled"] += 1
+        task = asyncio.ensure_future(self._respawn(worker))
+        self._respawns.add(task)
+        task.add_done_callback(self._respawns.discard)
+
+    async def _respawn(self, old: SandboxWorker):
+        await old.kill()
+        self._retiring.discard(old)
+        while not self._closed:
+            try:
+                self._idle.put_nowait(await self._spawn())
+                return
+            except Exception as e:
+                logger.error(f"Could not start replacement sandbox worker: {e}")
+                await asyncio.sleep(1.0)
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._respawns):
+            task.cancel()
+        workers = self._workers | self._retiring
+        await asyncio.gather(*(worker.kill() for worker in workers), return_exceptions=True)
+        self._workers.clear()
+        self._retiring.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "workers": len(self._workers),
+            "idle": self._idle.qsize(),
+            "waiting": self._waiting,
+            **self.stats_counters
+        }
@@ -0,0 +1,375 @@
+"""
+Warm sandbox worker for the code execution agent.
+
+SandboxPool starts this script with stdin/stdout as a JSON-lines channel. Commonly used
+modules are imported once here. For each request the worker forks a child, which inherits
+the warm interpreter, installs an audit hook that blocks process, network,
+directory-listing and filesystem-modification events and any open() outside the standard
+library, and runs the submitted code with stdout/stderr on pipes.
+User code only ever runs in the child, so nothing it does carries over to the next run.
+
+Before running anything the child also sets resource limits, so one submission can't take the
+pod down: address space and data segment (memory_limit MB on top of the inherited interpreter),
+CPU seconds, no new processes, a small number of file descriptors and no file writes. The worker
+reports the child's peak RSS and CPU time from wait4().
+
+Output is read incrementally and at most max_output bytes of each stream are kept; with
+kill_on_overflow the child is killed as soon as a stream passes the cap. With "stream": true
+the worker also writes {"id": 1, "stream": "stdout", "data": "..."} lines as output arrives,
+before the final response.
+
+Each child runs in its own process group, so killing the worker does not reach it. The worker
+therefore reports {"id": 1, "child": <pid>} as soon as it forks (the pid is also the group id),
+and the pool kills that group if it abandons a run. As a backstop the child asks the kernel for
+SIGKILL when the worker dies (PR_SET_PDEATHSIG).
+
+Request:  {"id": 1, "code": "print(1)", "timeout": 5, "memory_limit": 50, "max_output": 1048576,
+           "kill_on_overflow": true, "stream": false}
+Response: {"id": 1, "stdout": "1\n", "stderr": "", "exit_code": 0, "timed_out": false,
+           "violation": null, "limit_exceeded": null, "truncated": false,
+           "peak_memory_kb": 9120, "cpu_time": 0.001, "duration": 0.002}
+"""
+import builtins
+import codecs
+import ctypes
+import json
+import linecache
+import os
+import resource
+import selectors
+import signal
+import sys
+import sysconfig
+import time
+import traceback
+
+# Pre-imported so student code gets them from sys.modules instead of loading them per run
+import bisect, collections, copy, dataclasses, datetime, decimal, enum, fractions, functools  # noqa: E401,F401
+import heapq, itertools, math, operator, random, re, statistics, string, textwrap, typing  # noqa: E401,F401
+
+SOURCE_NAME = "solution.py"
+STATUS_FD = 3
+VIOLATION_EXIT_CODE = 99
+MEMORY_EXIT_CODE = 98
+CHILD_ERROR_EXIT_CODE = 70
+
+DEFAULT_MEMORY_LIMIT_MB = 50
+DEFAULT_MAX_OUTPUT_BYTES = 1024 * 1024
+MAX_OPEN_FILES = 32
+
+# Audit events that student code has no business raising
+BLOCKED_EVENTS = {
+    "os.system", "os.exec", "os.posix_spawn", "os.spawn", "os.fork", "os.forkpty", "os.kill", "os.killpg",
+    "subprocess.Popen", "pty.spawn",
+    "socket.__new__", "socket.connect", "socket.bind", "socket.getaddrinfo", "socket.gethostbyname",
+    "ctypes.dlopen", "ctypes.dlsym", "ctypes.cdata",
+    "os.remove", "os.rename", "os.rmdir", "os.mkdir", "os.chmod", "os.chown", "os.symlink", "os.link",
+    "os.truncate", "os.chdir", "os.putenv", "os.unsetenv", "shutil.rmtree", "webbrowser.open",
+    "os.listdir", "os.scandir", "glob.glob",
+}
+
+# Imports of modules that were not pre-imported still need to read the standard library; nothing
+# else may be opened
+READABLE_ROOTS = tuple(sorted({
+    os.path.realpath(p) + os.sep
+    for name in ("stdlib", "platstdlib")
+    for p in [sysconfig.get_paths().get(name)] if p
+}))
+
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND
+
+PR_SET_PDEATHSIG = 1
+# Loaded before any fork; the child can't dlopen once its audit hook is in
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+except OSError:
+    _libc = None
+
+
+def _open_allowed(args) -> bool:
+    path, mode, flags = (tuple(args) + (None, None, None))[:3]
+    if mode is not None:
+        if any(c in mode for c in "wax+"):
+            return False
+    elif flags and flags & WRITE_FLAGS:
+        return False
+    if isinstance(path, int):
+        return True
+    if isinstance(path, bytes):
+        path = path.decode(errors="replace")
+    # realpath, so a symlink inside the standard library can't lead outside it
+    return os.path.realpath(path).startswith(READABLE_ROOTS)
+
+
+def audit_hook(event: str, args):
+    if event == "open":
+        if _open_allowed(args):
+            return
+    elif event not in BLOCKED_EVENTS:
+        return
+    # Report through a pipe the worker reads, so catching the exception doesn't hide the attempt
+    try:
+        os.write(STATUS_FD, event.encode() + b"\n")
+    except OSError:
+        os._exit(VIOLATION_EXIT_CODE)
+    raise PermissionError(f"{event} is not allowed in the sandbox")
+
+
+def apply_limits(memory_limit_mb: float, cpu_seconds: float):
+    """Set the child's rlimits; memory is counted on top of what the forked interpreter already maps"""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    with open("/proc/self/statm") as f:
+        fields = f.read().split()
+    vm_size, data_size = int(fields[0]) * page_size, int(fields[5]) * page_size
+    extra = int(memory_limit_mb * 1024 * 1024)
+
+    cpu = max(1, math.ceil(cpu_seconds))
+    limits = [
+        (resource.RLIMIT_AS, vm_size + extra),
+        (resource.RLIMIT_DATA, data_size + extra),
+        # SIGXCPU at the soft limit, SIGKILL one second later if it is ignored
+        (resource.RLIMIT_CPU, (cpu, cpu + 1)),
+        (resource.RLIMIT_NPROC, 0),
+        (resource.RLIMIT_NOFILE, MAX_OPEN_FILES),
+        (resource.RLIMIT_FSIZE, 0),
+        (resource.RLIMIT_CORE, 0),
+    ]
+    for limit, value in limits:
+        soft, hard = value if isinstance(value, tuple) else (value, value)
+        _, current_hard = resource.getrlimit(limit)
+        if current_hard != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current_hard), min(hard, current_hard)
+        resource.setrlimit(limit, (soft, hard))
+
+
+def die_with_parent(parent_pid: int):
+    """Have the kernel SIGKILL this process when the worker that forked it exits (Linux only)"""
+    if _libc is not None and hasattr(_libc, "prctl"):
+        _libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+    # The worker may already have died between fork() and prctl()
+    if os.getppid() != parent_pid:
+        os._exit(CHILD_ERROR_EXIT_CODE)
+
+
+def run_child(code: str, out_w: int, err_w: int, status_w: int, memory_limit_mb: float, cpu_seconds: float,
+              parent_pid: int):
+    """Runs in the forked child; never returns"""
+    exit_code = CHILD_ERROR_EXIT_CODE
+    try:
+        die_with_parent(parent_pid)
+        os.setpgid(0, 0)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        os.dup2(status_w, STATUS_FD)
+        os.closerange(STATUS_FD + 1, os.sysconf("SC_OPEN_MAX"))
+        apply_limits(memory_limit_mb, cpu_seconds)
+
+        # The worker's random state was copied by fork; every run must get its own
+        random.seed()
+        # Tracebacks show the submitted source without touching the filesystem
+        linecache.cache[SOURCE_NAME] = (len(code), None, code.splitlines(True), SOURCE_NAME)
+
+        exit_code = 0
+        try:
+            # Compiled before the hook goes in: the parser opens the source file to report SyntaxErrors
+            program = compile(code, SOURCE_NAME, "exec")
+            sys.addaudithook(audit_hook)
+            exec(program, {"__name__": "__main__", "__builtins__": builtins})
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                exit_code = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except MemoryError as e:
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            exit_code = MEMORY_EXIT_CODE
+        except BaseException as e:
+            # Drop this module's frame so the traceback starts at the student's code
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except BaseException:
+            pass
+        os._exit(exit_code)
+
+
+def kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def emit(message: dict):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def collect(pid: int, streams, deadline: float, max_output: int, kill_on_overflow: bool = False, on_chunk=None):
+    """
+    Read the child's pipes until they close or the deadline passes, keeping at most max_output
+    bytes per pipe and passing each kept chunk to on_chunk(fd, data) as it arrives.
+    Returns (chunks per fd, fds that were truncated, killed for overflow, timed_out).
+    """
+    chunks = {fd: [] for fd in streams}
+    kept = {fd: 0 for fd in streams}
+    truncated = set()
+    overflow_killed = False
+    selector = selectors.DefaultSelector()
+    for fd in streams:
+        selector.register(fd, selectors.EVENT_READ)
+    timed_out = False
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                kill_group(pid)
+                break
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, 65536)
+                if not data:
+                    selector.unregister(key.fd)
+                    continue
+                room = max_output - kept[key.fd]
+                if len(data) > room:
+                    truncated.add(key.fd)
+                    data = data[:room]
+                if data:
+                    chunks[key.fd].append(data)
+                    kept[key.fd] += len(data)
+                    if on_chunk:
+                        on_chunk(key.fd, data)
+                if key.fd in truncated and kill_on_overflow:
+                    overflow_killed = True
+                    kill_group(pid)
+                    return chunks, truncated, overflow_killed, timed_out
+                # Otherwise keep draining past the cap so the child doesn't block on a full pipe
+    finally:
+        selector.close()
+        for fd in streams:
+            os.close(fd)
+    return chunks, truncated, overflow_killed, timed_out
+
+
+def wait_child(pid: int, deadline: float):
+    """Wait for the child to exit (it may have closed its pipes early), killing it at the deadline"""
+    timed_out = False
+    while os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+        if time.monotonic() >= deadline:
+            timed_out = True
+            kill_group(pid)
+            break
+        time.sleep(0.002)
+    # Not reaped yet, so the group id can't have been reused: clear out anything the child left behind
+    kill_group(pid)
+    _, wait_status, usage = os.wait4(pid, 0)
+    return wait_status, usage, timed_out
+
+
+def run_request(request: dict) -> dict:
+    code = request["code"]
+    timeout = float(request.get("timeout", 5))
+    memory_limit = float(request.get("memory_limit", DEFAULT_MEMORY_LIMIT_MB))
+    max_output = int(request.get("max_output", DEFAULT_MAX_OUTPUT_BYTES))
+    kill_on_overflow = bool(request.get("kill_on_overflow", True))
+
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    status_r, status_w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    start = time.monotonic()
+    parent_pid = os.getpid()
+    pid = os.fork()
+    if pid == 0:
+        for fd in (out_r, err_r, status_r):
+            os.close(fd)
+        run_child(code, out_w, err_w, status_w, memory_limit, timeout, parent_pid)
+
+    # Set the group from both sides so a timeout kill can't race the child's own setpgid
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+    for fd in (out_w, err_w, status_w):
+        os.close(fd)
+    # Tells the pool which group to kill if it gives up on this run
+    emit({"id": request.get("id"), "child": pid})
+
+    on_chunk = None
+    if request.get("stream"):
+        # Incremental decoders so a multi-byte character split across reads comes out whole
+        names = {out_r: "stdout", err_r: "stderr"}
+        decoders = {fd: codecs.getincrementaldecoder("utf-8")(errors="replace") for fd in names}
+
+        def on_chunk(fd: int, data: bytes):
+            if fd in names:
+                text = decoders[fd].decode(data)
+                if text:
+                    emit({"id": request.get("id"), "stream": names[fd], "data": text})
+
+    deadline = start + timeout
+    chunks, truncated, overflow_killed, timed_out = collect(
+        pid, (out_r, err_r, status_r), deadline, max_output, kill_on_overflow, on_chunk
+    )
+    wait_status, usage, wait_timed_out = wait_child(pid, deadline)
+    timed_out = timed_out or wait_timed_out
+    exit_code = os.waitstatus_to_exitcode(wait_status)
+
+    limit_exceeded = None
+    if exit_code == MEMORY_EXIT_CODE:
+        limit_exceeded = "memory"
+    elif overflow_killed:
+        limit_exceeded = "output"
+    elif exit_code == -signal.SIGXCPU or (exit_code == -signal.SIGKILL and not timed_out):
+        limit_exceeded = "cpu"
+
+    status_lines = b"".join(chunks[status_r]).decode(errors="replace").split()
+    violation = status_lines[0] if status_lines else None
+    if violation is None and exit_code == VIOLATION_EXIT_CODE:
+        violation = "unknown"
+
+    return {
+        "id": request.get("id"),
+        "stdout": b"".join(chunks[out_r]).decode(errors="replace"),
+        "stderr": b"".join(chunks[err_r]).decode(errors="replace"),
+        "exit_code": exit_code,
+        "timed_out": timed_out,
+        "violation": violation,
+        "limit_exceeded": limit_exceeded,
+        "truncated": bool(truncated & {out_r, err_r}),
+        # ru_maxrss is in KiB on Linux and includes pages shared with the worker that the child touched
+        "peak_memory_kb": usage.ru_maxrss,
+        "cpu_time": round(usage.ru_utime + usage.ru_stime, 4),
+        "duration": time.monotonic() - start
+    }
+
+
+def main():
+    # Ctrl-C on the agent reaches the whole process group; the pool stops workers by closing stdin instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    emit({"ready": True, "pid": os.getpid()})
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        try:
+            response = run_request(request)
+        except Exception as e:
+            response = {"id": request.get("id"), "error": f"{type(e).__name__}: {e}"}
+        emit(response)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Static security check for submitted code, run before anything reaches the sandbox.
+
+One pass of an ast.NodeVisitor checks the code against an allow-list of importable modules
+and of builtins, and rejects names and attributes that lead back to the interpreter
+internals (__builtins__, __subclasses__, __globals__, frame and code objects). Attributes
+starting with an underscore are rejected altogether, since allowed modules keep other modules
+there (random._os), and so are the public attributes through which an allowed module reaches
+one that isn't (calendar.sys, dataclasses.inspect); that set is worked out from the allowed
+modules at import. Each issue carries the line and column it was found at. Because it works on names rather than substrings,
+identifiers such as `profile` or `evaluate` are no longer rejected.
+
+Some allowed modules reach attributes by name from a string, which the AST never sees as an
+attribute: operator.attrgetter and methodcaller, string.Formatter and str.format ("{0.__globals__}"),
+and typing.get_type_hints, which evals string annotations (so does functools.singledispatch).
+The first three are rejected by name; str.format and format_map are only allowed on a string
+literal whose fields don't reach underscored names; string annotations are parsed and checked
+like the rest of the code; and string constants that name a dunder (other than "__main__") are
+rejected outright, as are underscored attributes in match class patterns.
+
+The same pass classifies the program as deterministic or not, erring towards "not": code that
+imports random, time or datetime or reaches them through another module (statistics.random),
+that uses id, hash, input or object, or that puts instances of its own classes in sets (whose
+order then follows their addresses) can print something different on each run, so its results
+must not be reused. Neither may those of code with any issue at all. Default reprs that show an address are caught after the run instead (see
+result_cache.cacheable).
+
+Results are cached by a hash of the source, since students re-run the same code a lot.
+This is a first filter; the sandbox audit hook and rlimits still apply to anything that
+gets through.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+import ast
+import builtins
+import hashlib
+import importlib
+import re
+import string
+import types
+
+ALLOWED_IMPORTS = {
+    "abc", "array", "bisect", "calendar", "collections", "copy", "dataclasses", "datetime", "decimal", "enum",
+    "fractions", "functools", "heapq", "itertools", "json", "math", "numbers", "operator", "pprint", "random",
+    "re", "statistics", "string", "textwrap", "time", "typing",
+}
+
+ALLOWED_BUILTINS = {
+    "abs", "all", "any", "ascii", "bin", "bool", "bytearray", "bytes", "callable", "chr", "classmethod", "complex",
+    "dict", "dir", "divmod", "enumerate", "filter", "float", "format", "frozenset", "hasattr", "hash", "hex", "id",
+    "int", "isinstance", "issubclass", "iter", "len", "list", "map", "max", "min", "next", "object", "oct", "ord",
+    "pow", "print", "property", "range", "repr", "reversed", "round", "set", "slice", "sorted", "staticmethod",
+    "str", "sum", "super", "tuple", "type", "zip", "aiter", "anext",
+    "True", "False", "None", "NotImplemented", "Ellipsis", "__name__", "__doc__",
+}
+# Exception classes are harmless to raise and catch
+ALLOWED_BUILTINS |= {name for name, value in vars(builtins).items()
+                     if isinstance(value, type) and issubclass(value, BaseException)}
+
+BUILTIN_NAMES = set(dir(builtins))
+
+# Allowed, but their output changes from run to run
+NONDETERMINISTIC_MODULES = {"random", "time", "datetime"}
+NONDETERMINISTIC_BUILTINS = {"id", "hash", "input", "object"}
+SET_BUILTINS = {"set", "frozenset"}
+
+# Attributes that lead from ordinary objects to modules, frames, code and the builtins
+BLOCKED_ATTRIBUTES = {
+    "__bases__", "__base__", "__builtins__", "__class__", "__closure__", "__code__", "__dict__", "__func__",
+    "__getattribute__", "__globals__", "__import__", "__loader__", "__mro__", "__reduce__", "__reduce_ex__",
+    "__self__", "__spec__", "__subclasses__", "__traceback__",
+    "f_back", "f_builtins", "f_code", "f_globals", "f_locals", "gi_code", "gi_frame", "cr_code", "cr_frame",
+    "ag_code", "ag_frame", "tb_frame", "tb_next", "co_code", "co_consts",
+}
+
+# Ways to get an attribute, or evaluate a string, by name at run time
+REFLECTION_ATTRIBUTES = {"attrgetter", "methodcaller", "get_type_hints", "ForwardRef", "Formatter"}
+FORMAT_METHODS = {"format", "format_map"}
+ALLOWED_DUNDER_STRINGS = {"__main__"}
+
+# Dunder methods a class may call on super(); nothing else with an underscore gets through
+SUPER_METHODS = {
+    "__init__", "__new__", "__init_subclass__", "__repr__", "__str__", "__format__", "__eq__", "__ne__",
+    "__lt__", "__le__", "__gt__", "__ge__", "__hash__", "__bool__", "__len__", "__iter__", "__next__",
+    "__contains__", "__getitem__", "__setitem__", "__delitem__", "__getattr__", "__setattr__", "__delattr__",
+    "__add__", "__sub__", "__mul__", "__truediv__", "__floordiv__", "__mod__", "__call__", "__enter__", "__exit__",
+}
+
+
+def _module_attributes() -> List[Tuple[str, str]]:
+    """(attribute name, top-level module name) for every public module attribute of the allowed modules, transitively"""
+    found: List[Tuple[str, str]] = []
+    seen: Set[str] = set()
+    queue = [importlib.import_module(name) for name in sorted(ALLOWED_IMPORTS)]
+    while queue:
+        module = queue.pop()
+        if module.__name__ in seen:
+            continue
+        seen.add(module.__name__)
+        for name, value in vars(module).items():
+            if name.startswith("_") or not isinstance(value, types.ModuleType):
+                continue
+            root = value.__name__.split(".")[0]
+            found.append((name, root))
+            if root in ALLOWED_IMPORTS:
+                queue.append(value)
+    return found
+
+
+# Attribute names through which an allowed module reaches a disallowed one (calendar.sys) or a
+# nondeterministic one (statistics.random)
+_MODULE_ATTRIBUTES = _module_attributes()
+MODULE_ESCAPE_ATTRIBUTES = {name for name, root in _MODULE_ATTRIBUTES if root not in ALLOWED_IMPORTS}
+NONDETERMINISTIC_ATTRIBUTES = {name for name, root in _MODULE_ATTRIBUTES if root in NONDETERMINISTIC_MODULES}
+
+
+def _format_reaches_private(template: str) -> bool:
+    """Whether a str.format template has a field like {0.__globals__} or {0[_x]}, nested specs included"""
+    try:
+        fields = list(string.Formatter().parse(template))
+    except ValueError:
+        # str.format raises the same error before looking anything up
+        return False
+    for _, field_name, format_spec, _ in fields:
+        if field_name and any(part.startswith("_") for part in re.split(r"[.\[]", field_name)[1:]):
+            return True
+        if format_spec and _format_reaches_private(format_spec):
+            return True
+    return False
+
+
+def _dunder_string(value: Any) -> bool:
+    return (isinstance(value, str) and value.startswith("__") and value.isidentifier()
+            and value not in ALLOWED_DUNDER_STRINGS)
+
+
+class SecurityIssue(NamedTuple):
+    line: int
+    column: int
+    message: str
+
+    def describe(self) -> str:
+        return f"{self.message} (line {self.line}, column {self.column})"
+
+
+class ValidationResult(NamedTuple):
+    issues: Tuple[SecurityIssue, ...]
+    deterministic: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return not self.issues
+
+    def error_message(self) -> str:
+        return "Security violation: " + "; ".join(issue.describe() for issue in self.issues)
+
+
+class _Checker(ast.NodeVisitor):
+    def __init__(self):
+        self.issues: List[SecurityIssue] = []
+        self.deterministic = True
+        # Instances of the program's own classes hash by address, so sets of them iterate in varying order
+        self.defines_class = False
+        self.uses_sets = False
+
+    def _flag(self, node: ast.AST, message: str, column: Optional[int] = None):
+        column = node.col_offset if column is None else column
+        self.issues.append(SecurityIssue(node.lineno, column + 1, message))
+
+    def _check_module(self, node: ast.AST, name: Optional[str]):
+        root = (name or "").split(".")[0]
+        if root in NONDETERMINISTIC_MODULES:
+            self.deterministic = False
+        if root not in ALLOWED_IMPORTS:
+            self._flag(node, f"import of '{name}' is not allowed")
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self._check_module(node, alias.name)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.level:
+            self._flag(node, "relative imports are not allowed")
+        else:
+            self._check_module(node, node.module)
+        if any(alias.name == "*" for alias in node.names):
+            self._flag(node, "wildcard imports are not allowed")
+        for alias in node.names:
+            if alias.name.startswith("_") or alias.name in MODULE_ESCAPE_ATTRIBUTES or alias.name in REFLECTION_ATTRIBUTES:
+                self._flag(node, f"import of '{alias.name}' from '{node.module}' is not allowed")
+            if alias.name in NONDETERMINISTIC_ATTRIBUTES:
+                self.deterministic = False
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in NONDETERMINISTIC_BUILTINS:
+            self.deterministic = False
+        elif node.id in SET_BUILTINS:
+            self.uses_sets = True
+        # Any read counts, even if the code also assigns the name: `open = open` must not get through
+        if isinstance(node.ctx, ast.Load) and node.id not in ALLOWED_BUILTINS:
+            if node.id.startswith("__") or node.id in BUILTIN_NAMES:
+                self._flag(node, f"'{node.id}' is not allowed")
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.defines_class = True
+        self.generic_visit(node)
+
+    def visit_Set(self, node: ast.Set):
+        self.uses_sets = True
+        self.generic_visit(node)
+
+    def visit_SetComp(self, node: ast.SetComp):
+        self.uses_sets = True
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if node.attr in NONDETERMINISTIC_ATTRIBUTES:
+            self.deterministic = False
+        # Point at the attribute name itself rather than the start of the whole expression
+        column = node.end_col_offset - len(node.attr) if node.end_lineno == node.lineno else None
+        if self._blocked_attribute(node):
+            self._flag(node, f"access to '.{node.attr}' is not allowed", column)
+        elif node.attr in FORMAT_METHODS:
+            template = node.value
+            if not (isinstance(template, ast.Constant) and isinstance(template.value, str)):
+                self._flag(node, f"'.{node.attr}' is only allowed on a string literal", column)
+            elif _format_reaches_private(template.value):
+                self._flag(template, "format fields may not reach names starting with '_'")
+        self.generic_visit(node)
+
+    def visit_Constant(self, node: ast.Constant):
+        if _dunder_string(node.value):
+            self._flag(node, f"the string '{node.value}' is not allowed")
+
+    def visit_MatchClass(self, node: ast.MatchClass):
+        # case C(attr=...) reads the attribute by name
+        for attr in node.kwd_attrs:
+            if attr.startswith("_") or attr in BLOCKED_ATTRIBUTES or attr in MODULE_ESCAPE_ATTRIBUTES:
+                self._flag(node, f"matching on '.{attr}' is not allowed")
+        self.generic_visit(node)
+
+    def _check_annotation(self, annotation: Optional[ast.AST]):
+        """String annotations are code to typing.get_type_hints and singledispatch; check them as code"""
+        if annotation is None:
+            return
+        for node in ast.walk(annotation):
+            if not (isinstance(node, ast.Constant) and isinstance(node.value, str)):
+                continue
+            try:
+                tree = ast.parse(node.value.strip(), mode="eval")
+            except (SyntaxError, ValueError):
+                # Not an expression, so nothing evaluates it
+                continue
+            inner = _Checker()
+            inner.visit(tree)
+            for issue in inner.issues:
+                self._flag(node, f"in annotation: {issue.message}")
+            self.deterministic = self.deterministic and inner.deterministic
+
+    def visit_arg(self, node: ast.arg):
+        self._check_annotation(node.annotation)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        self._check_annotation(node.annotation)
+        self.generic_visit(node)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self._check_annotation(node.returns)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    @staticmethod
+    def _blocked_attribute(node: ast.Attribute) -> bool:
+        attr = node.attr
+        if attr in BLOCKED_ATTRIBUTES or attr in MODULE_ESCAPE_ATTRIBUTES or attr in REFLECTION_ATTRIBUTES:
+            return True
+        if not attr.startswith("_"):
+            return False
+        # super().__init__(...) and friends, from a zero-argument super() only
+        value = node.value
+        is_super = (isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id == "super"
+                    and not value.args and not value.keywords)
+        return not (is_super and attr in SUPER_METHODS)
+
+
+def check_code(code: str) -> ValidationResult:
+    """Validate without caching. Code that doesn't parse passes; the sandbox reports the SyntaxError"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return ValidationResult((), deterministic=True)
+    checker = _Checker()
+    checker.visit(tree)
+    issues = tuple(sorted(checker.issues, key=lambda issue: (issue.line, issue.column)))
+    # Code with any issue doesn't run, but never let a verdict on it be reused as deterministic
+    deterministic = (not issues and checker.deterministic
+                     and not (checker.defines_class and checker.uses_sets))
+    return ValidationResult(issues, deterministic=deterministic)
+
+
+class CodeValidator:
+    """check_code with an LRU cache keyed by a hash of the source"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, ValidationResult]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def validate(self, code: str) -> ValidationResult:
+        key = hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = check_code(code)
+        self._cache[key] = result
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
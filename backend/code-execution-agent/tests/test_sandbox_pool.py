@@ -0,0 +1,76 @@
+"""
+Cancelling a streaming run must not leave the student's program running.
+
+Run from the code-execution-agent directory:  python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sandbox_pool import SandboxPool  # noqa: E402
+
+# Prints its process group id, then runs until killed
+SLEEPER = """
+import os, time
+print(os.getpgid(0), flush=True)
+while True:
+    time.sleep(0.05)
+"""
+
+
+def live_group_members(pgid: int):
+    """Pids of processes in the group that have not exited (zombies don't count)"""
+    members = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Fields after the parenthesised command name: state, ppid, pgrp, ...
+        state, _, pgrp = stat.rsplit(")", 1)[1].split()[:3]
+        if int(pgrp) == pgid and state != "Z":
+            members.append(int(entry))
+    return members
+
+
+def wait_for_group_exit(pgid: int, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while live_group_members(pgid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return live_group_members(pgid)
+
+
+async def cancel_streaming_run(close_pool: bool):
+    pool = SandboxPool(size=1, max_runs=10)
+    await pool.start()
+    try:
+        output: "asyncio.Queue[str]" = asyncio.Queue()
+        run = asyncio.ensure_future(pool.run(SLEEPER, timeout=30, memory_limit=50,
+                                             on_output=lambda stream, data: output.put_nowait(data)))
+        pgid = int((await asyncio.wait_for(output.get(), 10)).strip())
+        assert live_group_members(pgid)
+
+        # What stream_execution does when the client disconnects
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+        if close_pool:
+            await pool.close()
+        return pgid
+    finally:
+        await pool.close()
+
+
+def test_cancelled_stream_kills_child_group():
+    pgid = asyncio.run(cancel_streaming_run(close_pool=False))
+    assert wait_for_group_exit(pgid) == []
+
+
+def test_close_right_after_cancel_kills_child_group():
+    pgid = asyncio.run(cancel_streaming_run(close_pool=True))
+    assert wait_for_group_exit(pgid) == []
@@ -0,0 +1,78 @@
+"""
+The static check must reject code that reaches attributes or evaluates strings by name, and
+never call such code deterministic.
+
+Run from the code-execution-agent directory:  python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from security import check_code  # noqa: E402
+
+ESCAPES = {
+    "attrgetter": (
+        "import operator\n"
+        "def f(): pass\n"
+        "g = operator.attrgetter('__globals__')(f)\n"
+        "imp = operator.attrgetter('__import__')(g['__builtins__'])\n"
+        "print(imp('os').getpid())\n"
+    ),
+    "methodcaller import": "from operator import methodcaller\n",
+    "get_type_hints": (
+        "import typing\n"
+        "def f(x: \"__import__('os').getcwd()\"): pass\n"
+        "print(typing.get_type_hints(f))\n"
+    ),
+    "singledispatch annotation": (
+        "from functools import singledispatch\n"
+        "@singledispatch\n"
+        "def f(x): pass\n"
+        "@f.register\n"
+        "def _(x: \"__import__('os').getcwd()\"): pass\n"
+    ),
+    "format field": "def f(): pass\nprint('{0.__globals__}'.format(f))\n",
+    "nested format spec": "print('{0:{1.__class__}}'.format(1, 2))\n",
+    "format on a variable": "def f(): pass\ns = '{0.__globals__}'\nprint(s.format(f))\n",
+    "unbound str.format": "def f(): pass\nprint(str.format('{0.__globals__}', f))\n",
+    "format_map": "print('{x.__class__}'.format_map({'x': 1}))\n",
+    "Formatter": "import string\nprint(string.Formatter().get_field('0.__globals__', [print], {}))\n",
+    "dunder subscript": "d = {}\nprint(d.get('__builtins__'))\n",
+    "match keyword pattern": "def f(): pass\nmatch f:\n    case object(__globals__=g):\n        print(g)\n",
+}
+
+ALLOWED = {
+    "main guard and format": (
+        "if __name__ == '__main__':\n"
+        "    print('{:.2f} and {name}'.format(3.14159, name='x'))\n"
+    ),
+    "string annotations": (
+        "from typing import List, Optional\n"
+        "def f(xs: List[int], y: 'Optional[int]' = None) -> 'int':\n"
+        "    return len(xs)\n"
+        "print(f([1]))\n"
+    ),
+    "super and dunder prose": (
+        "class A:\n"
+        "    def __init__(self):\n"
+        "        super().__init__()\n"
+        "print('__init__ runs first')\n"
+    ),
+}
+
+
+@pytest.mark.parametrize("code", ESCAPES.values(), ids=ESCAPES.keys())
+def test_reflection_is_rejected_and_not_cacheable(code):
+    result = check_code(code)
+    assert not result.ok
+    assert not result.deterministic
+
+
+@pytest.mark.parametrize("code", ALLOWED.values(), ids=ALLOWED.keys())
+def test_ordinary_code_is_allowed(code):
+    result = check_code(code)
+    assert result.ok, result.error_message()
+    assert result.deterministic
@@ -0,0 +1,157 @@
+"""
+Inverted index over concept names, aliases and related concepts.
+
+Queries are tokenized the same way as the indexed text and ranked with BM25, with
+per-field weights so a hit on a concept's name counts more than a hit on one of its
+related concepts. Query words that are not in the vocabulary are matched to indexed
+words within a small edit distance (symmetric-delete lookup), at a reduced weight.
+
+best_match() only returns the top hit if it clears min_score and covers at least min_coverage
+of the query's terms, so a query sharing one common word with a concept gets "not found"
+rather than a confident wrong answer.
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import math
+import re
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+# Words that carry no information about which concept is meant
+STOPWORDS = {
+    "a", "an", "and", "are", "about", "can", "do", "does", "explain", "how", "i", "in", "is", "it", "me",
+    "of", "on", "please", "python", "tell", "the", "to", "use", "what", "when", "why", "with", "work", "works",
+    "you", "my", "vs", "versus"
+}
+
+FIELD_WEIGHTS = {"name": 3.0, "aliases": 2.0, "related": 0.5}
+
+K1 = 1.2
+B = 0.75
+
+
+def stem(token: str) -> str:
+    """Very light plural stripping so 'loops' and 'loop' share a term"""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _deletes(term: str, max_distance: int) -> Set[str]:
+    """All strings reachable from term by deleting up to max_distance characters"""
+    results = {term}
+    frontier = {term}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def bounded_levenshtein(a: str, b: str, max_distance: int) -> Optional[int]:
+    """Edit distance between a and b, or None if it exceeds max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_distance:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+def max_edit_distance(term: str) -> int:
+    if len(term) <= 3:
+        return 0
+    return 1 if len(term) <= 6 else 2
+
+
+class ConceptMatch(NamedTuple):
+    concept: str
+    score: float
+    # Share of the query's (non-stopword) terms that matched this concept
+    coverage: float
+
+
+class ConceptIndex:
+    def __init__(self, documents: Dict[str, Dict[str, Iterable[str]]], min_score: float = 0.0,
+                 min_coverage: float = 0.0):
+        """
+        documents maps a concept key to its text fields, e.g.
+        {"loops": {"name": ["loops"], "aliases": ["for loop"], "related": ["range() function"]}}
+        """
+        self.min_score = min_score
+        self.min_coverage = min_coverage
+        self._postings: Dict[str, List[Tuple[str, float]]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+
+        for concept, fields in documents.items():
+            weighted_tf: Dict[str, float] = {}
+            for field, texts in fields.items():
+                weight = FIELD_WEIGHTS.get(field, 1.0)
+                for text in texts:
+                    for term in tokenize(text):
+                        weighted_tf[term] = weighted_tf.get(term, 0.0) + weight
+            self._doc_lengths[concept] = sum(weighted_tf.values())
+            for term, tf in weighted_tf.items():
+                self._postings.setdefault(term, []).append((concept, tf))
+
+        n_docs = len(documents)
+        self._avg_length = (sum(self._doc_lengths.values()) / n_docs) if n_docs else 0.0
+        self._idf = {
+            term: math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+        # Symmetric-delete table for fuzzy term lookup
+        self._delete_table: Dict[str, Set[str]] = {}
+        for term in self._postings:
+            for variant in _deletes(term, max_edit_distance(term)):
+                self._delete_table.setdefault(variant, set()).add(term)
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Indexed terms matching a query token, with a weight that decays with edit distance"""
+        if token in self._postings:
+            return [(token, 1.0)]
+        max_distance = max_edit_distance(token)
+        if max_distance == 0:
+            return []
+        candidates: Set[str] = set()
+        for variant in _deletes(token, max_distance):
+            candidates |= self._delete_table.get(variant, set())
+        matches = []
+        for term in candidates:
+            distance = bounded_levenshtein(token, term, max_distance)
+            if distance is not None:
+                matches.append((term, 1.0 / (1 + distance)))
+        return matches
+
+    def search(self, query: str, limit: int = 5) -> List[ConceptMatch]:
+        scores: Dict[str, float] = {}
+        matched: Dict[str, Set[str]] = {}
+        tokens = set(tokenize(query))
+        for token in tokens:
+            for term, weight in self._expand(token):
+                idf = self._idf[term]
+                for concept, tf in self._postings[term]:
+                    norm = K1 * (1 - B + B * self._doc_lengths[concept] / self._avg_length)
+                    scores[concept] = scores.get(concept, 0.0) + weight * idf * tf * (K1 + 1) / (tf + norm)
+                    matched.setdefault(concept, set()).add(token)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [ConceptMatch(concept, round(score, 4), round(len(matched[concept]) / len(tokens), 4))
+                for concept, score in ranked]
+
+    def accepts(self, match: ConceptMatch) -> bool:
+        return match.score >= self.min_score and match.coverage >= self.min_coverage
+
+    def best_match(self, query: str) -> Optional[ConceptMatch]:
+        """The top hit, or None if there is none or it is below min_score or min_coverage"""
+        results = self.search(query, limit=1)
+        return results[0] if results and self.accepts(results[0]) else None
@@ -0,0 +1,148 @@
+"""
+Memory-mapped JSON Lines content store with atomic hot reload.
+
+Each line of the file is one JSON record with a unique key field. The file is mapped
+read-only, so every worker process on a node shares the same page-cache pages; each
+process only keeps a key -> (offset, length) table plus whatever lookup indexes the
+caller builds at load time. Records are decoded on access.
+
+When the file changes (detected by inode, size and mtime, checked at most every
+check_interval seconds) a new snapshot is loaded beside the current one and swapped
+in with a single assignment. Requests already holding the old snapshot finish against
+it; its mapping is released once the last reference goes away. Replace the file with
+an atomic rename (write a temp file, then mv) rather than editing it in place.
+"""
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IndexBuilder = Callable[[Dict[str, Dict[str, Any]]], Dict[str, Any]]
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag for a pre-rendered response body"""
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header already covers etag (weak comparison, as RFC 9110 requires)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class Snapshot:
+    """One immutable, loaded version of the content file"""
+
+    def __init__(self, path: str, key_field: str, build_indexes: Optional[IndexBuilder] = None):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        records: Dict[str, Dict[str, Any]] = {}
+        size = len(self._mm)
+        pos = 0
+        while pos < size:
+            end = self._mm.find(b"\n", pos)
+            if end == -1:
+                end = size
+            line = self._mm[pos:end]
+            if line.strip():
+                record = json.loads(line)
+                key = record[key_field]
+                self._offsets[key] = (pos, end - pos)
+                records[key] = record
+            pos = end + 1
+
+        # Indexes are built from the decoded records once; the records themselves are then dropped
+        self.indexes: Dict[str, Any] = build_indexes(records) if build_indexes else {}
+        self.loaded_at = time.time()
+
+    def raw(self, key: str) -> Optional[bytes]:
+        """Encoded JSON of a record, straight from the mapping"""
+        location = self._offsets.get(key)
+        if location is None:
+            return None
+        offset, length = location
+        return self._mm[offset:offset + length]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.raw(key)
+        return json.loads(raw) if raw is not None else None
+
+    def keys(self) -> Iterator[str]:
+        return iter(self._offsets)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+
+class ContentStore:
+    def __init__(self, path: str, key_field: str, build_indexes: Optional[IndexBuilder] = None,
+                 check_interval: float = 2.0):
+        self.path = path
+        self.key_field = key_field
+        self.build_indexes = build_indexes
+        self.check_interval = check_interval
+        self.reloads = 0
+
+        self._lock = threading.Lock()
+        self._snapshot = Snapshot(path, key_field, build_indexes)
+        self._next_check = time.monotonic() + check_interval
+        logger.info(f"Loaded {len(self._snapshot)} records from {path}")
+
+    @property
+    def snapshot(self) -> Snapshot:
+        """Current snapshot; hold on to it for the duration of a request"""
+        if time.monotonic() >= self._next_check:
+            self.maybe_reload()
+        return self._snapshot
+
+    def maybe_reload(self) -> bool:
+        """Reload if the file changed on disk; on a bad file keep serving the previous snapshot"""
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                stat = os.stat(self.path)
+            except OSError as e:
+                logger.error(f"Cannot stat {self.path}: {e}")
+                return False
+            if (stat.st_ino, stat.st_size, stat.st_mtime_ns) == self._snapshot.signature:
+                return False
+            try:
+                snapshot = Snapshot(self.path, self.key_field, self.build_indexes)
+            except Exception as e:
+                logger.error(f"Reload of {self.path} failed, keeping previous content: {e}")
+                return False
+            self._snapshot = snapshot
+            self.reloads += 1
+            logger.info(f"Reloaded {len(snapshot)} records from {self.path}")
+            return True
+        finally:
+            self._lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "path": self.path,
+            "records": len(snapshot),
+            "reloads": self.reloads,
+            "loaded_at": snapshot.loaded_at
+        }
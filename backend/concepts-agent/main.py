@@ -1,8 +1,10 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
 import logging
 import os
+from concept_index import ConceptIndex
+from content_store import ContentStore, etag_for, etag_matches
 
 app = FastAPI(title="Concepts Agent", description="Explains Python concepts with examples", version="1.0.0")
 logging.basicConfig(level=logging.INFO)
@@ -20,104 +22,57 @@ class ConceptResponse(BaseModel):
     common_mistakes: List[str]
     related_concepts: List[str]
     difficulty: str
+    match_score: Optional[float] = None
 
-# Knowledge base for Python concepts
-CONCEPT_DATABASE = {
-    "loops": {
-        "beginner": {
-            "explanation": "Loops in Python allow you to repeat a block of code multiple times. The two main types are 'for' loops (for iterating over a sequence) and 'while' loops (for repeating until a condition is false).",
-            "examples": [
-                "# For loop example\nfor i in range(5):\n    print(i)  # Prints 0, 1, 2, 3, 4",
-                "# While loop example\ncount = 0\nwhile count < 5:\n    print(count)\n    count += 1",
-                "# Loop through a list\nfruits = ['apple', 'banana', 'cherry']\nfor fruit in fruits:\n    print(fruit)"
-            ],
-            "common_mistakes": [
-                "Off-by-one errors: range(5) gives 0-4, not 1-5",
-                "Infinite loops: forgetting to increment counter in while loops",
-                "Modifying a list while iterating over it"
-            ],
-            "related_concepts": ["range() function", "break and continue statements", "list comprehensions", "enumerate()"]
-        },
-        "intermediate": {
-            "explanation": "Loops in Python provide powerful iteration capabilities. For loops work with iterables (lists, strings, ranges), while loops continue until a condition is False. You can control loop flow with break (exit loop) and continue (skip to next iteration). Nested loops allow iteration over multi-dimensional data.",
-            "examples": [
-                "# Nested loops\nfor i in range(3):\n    for j in range(3):\n        print(f'({i}, {j})', end=' ')\n    print()  # New line after inner loop",
-                "# Loop with enumerate\nfor index, value in enumerate(['a', 'b', 'c']):\n    print(f'Index {index}: {value}')",
-                "# Loop with break and continue\nfor num in range(10):\n    if num == 3:\n        continue  # Skip 3\n    if num == 7:\n        break  # Stop at 7\n    print(num)"
-            ],
-            "common_mistakes": [
-                "Confusion between range(5) and range(0, 5) - they're the same",
-                "Not understanding that 'for' creates a new variable in each iteration",
-                "Forgetting that strings and lists are iterable"
-            ],
-            "related_concepts": ["iterators and generators", "list comprehensions", "while-else construct", "zip() function"]
-        }
-    },
-    "variables": {
-        "beginner": {
-            "explanation": "Variables in Python are containers that store data values. Unlike some languages, you don't need to declare a variable's type - Python figures it out automatically. You create a variable by assigning a value using the equals sign (=).",
-            "examples": [
-                "# Creating variables\nname = 'Alice'  # String\nage = 25  # Integer\nheight = 5.6  # Float\nis_student = True  # Boolean",
-                "# Variables can change type\nx = 5\nprint(x)  # 5\nx = 'hello'\nprint(x)  # hello",
-                "# Multiple assignment\na, b, c = 1, 2, 3\nprint(a, b, c)  # 1 2 3"
-            ],
-            "common_mistakes": [
-                "Using reserved keywords as variable names (like 'class', 'for', 'if')",
-                "Starting variable names with numbers (5x is invalid, x5 is valid)",
-                "Forgetting that variables are case-sensitive (Name ≠ name)"
-            ],
-            "related_concepts": ["data types", "type conversion", "constants", "naming conventions"]
-        }
-    },
-    "functions": {
-        "beginner": {
-            "explanation": "Functions are reusable blocks of code that perform a specific task. They help organize code and avoid repetition. Define a function with 'def', give it a name, specify parameters in parentheses, and indent the code block. Use 'return' to send a value back.",
-            "examples": [
-                "# Simple function\ndef greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('Alice'))  # Hello, Alice!",
-                "# Function with multiple parameters\ndef add(a, b):\n    return a + b\n\nresult = add(5, 3)\nprint(result)  # 8",
-                "# Function with default parameter\ndef greet(name='Guest'):\n    return f'Hello, {name}!'\n\nprint(greet())  # Hello, Guest!\nprint(greet('Bob'))  # Hello, Bob!"
-            ],
-            "common_mistakes": [
-                "Forgetting to call the function with parentheses: greet vs greet()",
-                "Not returning a value when you need one",
-                "Confusing parameters (definition) with arguments (actual values)"
-            ],
-            "related_concepts": ["return statement", "parameters vs arguments", "scope", "lambda functions"]
-        }
-    },
-    "lists": {
-        "beginner": {
-            "explanation": "Lists in Python are ordered, mutable collections that can hold items of different types. They're created with square brackets [] and items are separated by commas. Lists are zero-indexed, meaning the first element is at index 0.",
-            "examples": [
-                "# Creating lists\nfruits = ['apple', 'banana', 'cherry']\nnumbers = [1, 2, 3, 4, 5]\nmixed = [1, 'hello', True, 3.14]",
-                "# Accessing elements\nfruits = ['apple', 'banana', 'cherry']\nprint(fruits[0])  # apple\nprint(fruits[-1])  # cherry (last item)",
-                "# Modifying lists\nfruits.append('date')  # Add to end\nfruits.insert(1, 'blueberry')  # Insert at position\nfruits.remove('apple')  # Remove specific item\nfruits.pop()  # Remove and return last item"
-            ],
-            "common_mistakes": [
-                "Index out of range errors - trying to access an index that doesn't exist",
-                "Forgetting that lists are mutable - changes affect the original",
-                "Confusion between append() (adds one item) and extend() (adds multiple)"
-            ],
-            "related_concepts": ["list slicing", "list comprehensions", "sorting", "tuples"]
-        }
-    },
-    "conditionals": {
-        "beginner": {
-            "explanation": "Conditional statements (if, elif, else) allow your program to make decisions and execute different code based on conditions. Conditions are expressions that evaluate to True or False. Python uses indentation to define code blocks.",
-            "examples": [
-                "# Simple if statement\nage = 18\nif age >= 18:\n    print('You are an adult')",
-                "# if-else\nage = 15\nif age >= 18:\n    print('You are an adult')\nelse:\n    print('You are a minor')",
-                "# if-elif-else\nscore = 85\nif score >= 90:\n    print('Grade: A')\nelif score >= 80:\n    print('Grade: B')\nelif score >= 70:\n    print('Grade: C')\nelse:\n    print('Grade: F')"
-            ],
-            "common_mistakes": [
-                "Using = (assignment) instead of == (comparison)",
-                "Forgetting the colon : after the condition",
-                "Incorrect indentation - Python is strict about this!"
-            ],
-            "related_concepts": ["comparison operators", "logical operators (and, or, not)", "boolean values", "truthiness"]
+# Knowledge base for Python concepts, one JSON record per concept, reloaded when the file changes
+CONCEPTS_DATA_PATH = os.getenv("CONCEPTS_DATA_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "concepts.jsonl"))
+CONTENT_RELOAD_INTERVAL = float(os.getenv("CONTENT_RELOAD_INTERVAL", 2.0))
+DIFFICULTY_LEVELS = ("beginner", "intermediate", "advanced")
+# Below either of these the closest concept is treated as not found (see concept_index)
+CONCEPT_MIN_MATCH_SCORE = float(os.getenv("CONCEPT_MIN_MATCH_SCORE", 1.0))
+CONCEPT_MIN_MATCH_COVERAGE = float(os.getenv("CONCEPT_MIN_MATCH_COVERAGE", 0.5))
+
+def render_concept(key: str, record: Dict[str, Any], difficulty: str) -> Optional[bytes]:
+    """Serialize the /explain response for an exact concept match, with the beginner fallback applied"""
+    concept_data = record["levels"].get(difficulty) or record["levels"].get("beginner")
+    if not concept_data:
+        return None
+    return ConceptResponse(
+        concept=key,
+        explanation=concept_data["explanation"],
+        examples=concept_data["examples"],
+        common_mistakes=concept_data["common_mistakes"],
+        related_concepts=concept_data["related_concepts"],
+        difficulty=difficulty
+    ).model_dump_json().encode()
+
+def build_concept_indexes(records: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Index concept names, aliases and related concepts, and pre-render responses, each time the knowledge base is loaded"""
+    documents = {}
+    rendered = {}
+    for key, record in records.items():
+        for difficulty in DIFFICULTY_LEVELS:
+            body = render_concept(key, record, difficulty)
+            if body:
+                rendered[(key, difficulty)] = (body, etag_for(body))
+        related = {concept for level in record["levels"].values() for concept in level["related_concepts"]}
+        documents[key] = {
+            "name": [key],
+            "aliases": record.get("aliases", []),
+            "related": sorted(related)
         }
-    }
-}
+    search = ConceptIndex(documents, min_score=CONCEPT_MIN_MATCH_SCORE, min_coverage=CONCEPT_MIN_MATCH_COVERAGE)
+    return {"search": search, "rendered": rendered}
+
+def json_bytes_response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    """Serve pre-rendered JSON as-is, or 304 if the client already has this version"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+concept_store = ContentStore(CONCEPTS_DATA_PATH, key_field="concept", build_indexes=build_concept_indexes,
+                             check_interval=CONTENT_RELOAD_INTERVAL)
 
 @app.get("/health")
 async def health_check():
@@ -125,7 +80,7 @@ async def health_check():
     return {"status": "healthy", "service": "concepts-agent"}
 
 @app.post("/explain", response_model=ConceptResponse)
-async def explain_concept(request: ConceptRequest):
+async def explain_concept(request: ConceptRequest, if_none_match: Optional[str] = Header(None)):
     """
     Explain a Python concept with examples and common mistakes
     """
@@ -134,24 +89,36 @@ async def explain_concept(request: ConceptRequest):
 
     logger.info(f"Explaining concept: {concept_key} at {difficulty} level")
 
-    # Find the concept in the database
+    # Pin one snapshot for the whole request so a concurrent reload can't mix versions
+    snapshot = concept_store.snapshot
+
+    # Exact matches are served from bytes rendered at load time, skipping model validation and serialization
+    rendered = snapshot.indexes["rendered"].get((concept_key, difficulty))
+    if rendered:
+        return json_bytes_response(*rendered, if_none_match)
     concept_data = None
+    match_score = None
+
+    # Try exact match first, then the ranked index (BM25 with fuzzy term matching)
+    if concept_key not in snapshot:
+        search = snapshot.indexes["search"]
+        candidates = search.search(concept_key, limit=1)
+        if candidates:
+            match = candidates[0]
+            # Reported either way, so a "not found" shows how close the nearest concept was
+            match_score = match.score
+            if search.accepts(match):
+                logger.info(f"Matched '{concept_key}' to concept '{match.concept}' (score {match.score}, coverage {match.coverage})")
+                concept_key = match.concept
+            else:
+                logger.info(f"Rejected match of '{concept_key}' to '{match.concept}' (score {match.score}, coverage {match.coverage})")
 
-    # Try exact match first
-    if concept_key in CONCEPT_DATABASE:
-        concept_data = CONCEPT_DATABASE[concept_key].get(difficulty)
+    record = snapshot.get(concept_key)
+    if record:
+        concept_data = record["levels"].get(difficulty)
         # Fallback to beginner if requested difficulty not available
         if not concept_data:
-            concept_data = CONCEPT_DATABASE[concept_key].get("beginner")
-    else:
-        # Try partial matching
-        for key in CONCEPT_DATABASE.keys():
-            if key in concept_key or concept_key in key:
-                concept_data = CONCEPT_DATABASE[key].get(difficulty)
-                if not concept_data:
-                    concept_data = CONCEPT_DATABASE[key].get("beginner")
-                concept_key = key
-                break
+            concept_data = record["levels"].get("beginner")
 
     # If still no match, provide a general response
     if not concept_data:
@@ -168,7 +135,8 @@ async def explain_concept(request: ConceptRequest):
                 "Try asking about: loops, variables, functions, lists, conditionals"
             ],
             related_concepts=["Python basics", "data types", "control flow"],
-            difficulty=difficulty
+            difficulty=difficulty,
+            match_score=match_score
         )
 
     return ConceptResponse(
@@ -177,7 +145,8 @@ async def explain_concept(request: ConceptRequest):
         examples=concept_data["examples"],
         common_mistakes=concept_data["common_mistakes"],
         related_concepts=concept_data["related_concepts"],
-        difficulty=difficulty
+        difficulty=difficulty,
+        match_score=match_score
     )
 
 @app.get("/")
@@ -195,9 +164,10 @@ async def root():
 @app.get("/concepts")
 async def list_concepts():
     """List all available concepts"""
+    snapshot = concept_store.snapshot
     return {
-        "concepts": list(CONCEPT_DATABASE.keys()),
-        "count": len(CONCEPT_DATABASE)
+        "concepts": list(snapshot.keys()),
+        "count": len(snapshot)
     }
 
 if __name__ == "__main__":
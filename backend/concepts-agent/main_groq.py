@@ -1,9 +1,16 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import logging
 import os
-from groq import Groq
+import time
+from groq import AsyncGroq
+from response_cache import ResponseCache
+from singleflight import SingleFlight
 
 app = FastAPI(title="Concepts Agent (Groq-Powered)", description="Explains Python concepts with Groq LLM", version="2.0.0")
 logging.basicConfig(level=logging.INFO)
@@ -14,7 +21,62 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     logger.warning("GROQ_API_KEY environment variable not set")
 
-groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+groq_client = AsyncGroq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+
+# Upper bound on concurrent Groq calls; further requests wait on the semaphore
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", 16))
+groq_semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+groq_stats = {"in_flight": 0, "queued": 0, "max_queued": 0, "completed": 0, "failed": 0, "queue_wait_seconds": 0.0}
+
+@asynccontextmanager
+async def groq_slot():
+    """Hold one of the GROQ_MAX_CONCURRENCY slots, recording queue depth and outcome"""
+    groq_stats["queued"] += 1
+    groq_stats["max_queued"] = max(groq_stats["max_queued"], groq_stats["queued"])
+    wait_start = time.perf_counter()
+    try:
+        await groq_semaphore.acquire()
+    finally:
+        groq_stats["queued"] -= 1
+        groq_stats["queue_wait_seconds"] += time.perf_counter() - wait_start
+
+    groq_stats["in_flight"] += 1
+    try:
+        yield
+        groq_stats["completed"] += 1
+    except Exception:
+        groq_stats["failed"] += 1
+        raise
+    finally:
+        groq_stats["in_flight"] -= 1
+        groq_semaphore.release()
+
+async def create_chat_completion(**kwargs):
+    """Run a Groq chat completion without blocking the event loop, under the concurrency limit"""
+    async with groq_slot():
+        return await groq_client.chat.completions.create(**kwargs)
+
+async def stream_chat_completion(**kwargs) -> AsyncIterator[str]:
+    """Stream a Groq chat completion token by token, holding a slot until the stream ends"""
+    async with groq_slot():
+        stream = await groq_client.chat.completions.create(stream=True, **kwargs)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+# Cache of parsed explanations; bump PROMPT_VERSION whenever the system prompt changes
+GROQ_MODEL = "llama-3.3-70b-versatile"
+PROMPT_VERSION = "1"
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024)),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL", 24 * 3600)),
+    db_path=os.getenv("LLM_CACHE_DB") or None,
+    near_duplicate_threshold=float(os.getenv("LLM_CACHE_NEAR_DUPLICATE", 0.0))
+)
+
+# Identical explanations requested at the same time share one Groq call
+groq_inflight = SingleFlight()
 
 class ConceptRequest(BaseModel):
     concept: str
@@ -29,9 +91,20 @@ class ConceptResponse(BaseModel):
     related_concepts: List[str]
     difficulty: str
 
-def generate_concept_explanation(concept: str, difficulty: str) -> Dict[str, Any]:
+async def generate_concept_explanation(concept: str, difficulty: str) -> Dict[str, Any]:
     """Use Groq to generate a comprehensive concept explanation"""
-
+    cached = response_cache.get(concept, GROQ_MODEL, difficulty, PROMPT_VERSION)
+    if cached is not None:
+        logger.info(f"Cache hit for '{concept}' at {difficulty} level")
+        return cached
+
+    # Keyed on the exact prompt sent upstream, so only identical requests share a call
+    messages = build_concept_messages(concept, difficulty)
+    flight_key = f"{GROQ_MODEL}|{json.dumps(messages)}"
+    return await groq_inflight.do(flight_key, lambda: fetch_concept_explanation(concept, difficulty, messages))
+
+def build_concept_messages(concept: str, difficulty: str) -> List[Dict[str, str]]:
+    """System and user prompts for a structured concept explanation"""
     system_prompt = f"""You are an expert Python programming tutor. Your role is to explain Python concepts clearly and provide helpful examples.
 
 When explaining a concept, structure your response EXACTLY as follows:
@@ -52,111 +125,212 @@ Make sure your examples are practical and runnable Python code with comments."""
 
     user_prompt = f"Explain the Python concept: '{concept}' at a {difficulty} level."
 
-    try:
-        chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.7,
-            max_tokens=1500,
-        )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
 
-        response_text = chat_completion.choices[0].message.content
-        logger.info(f"Groq response received: {len(response_text)} characters")
+SECTION_HEADERS = {
+    'EXPLANATION:': 'explanation',
+    'EXAMPLES:': 'examples',
+    'COMMON_MISTAKES:': 'common_mistakes',
+    'RELATED_CONCEPTS:': 'related_concepts',
+}
 
-        # Parse the structured response
-        result = {
+class ConceptSectionParser:
+    """
+    Parse the structured Groq response line by line.
+    Text can be fed incrementally; a section is complete once the next header (or the end of the text) arrives.
+    """
+
+    def __init__(self):
+        self.result = {
             "explanation": "",
             "examples": [],
             "common_mistakes": [],
             "related_concepts": []
         }
-
-        current_section = None
-        lines = response_text.split('\n')
-
+        self.current_section = None
+        self.lines: List[str] = []
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Consume a chunk of text and return the sections it completed"""
+        self._buffer += text
+        *complete_lines, self._buffer = self._buffer.split('\n')
+        completed = []
+        for line in complete_lines:
+            finished = self._parse_line(line)
+            if finished:
+                completed.append(finished)
+        return completed
+
+    def close(self) -> List[str]:
+        """Flush the trailing partial line and return the sections completed by the end of the text"""
+        completed = []
+        if self._buffer:
+            finished = self._parse_line(self._buffer)
+            if finished:
+                completed.append(finished)
+            self._buffer = ""
+        if self.current_section:
+            completed.append(self.current_section)
+            self.current_section = None
+        return completed
+
+    def section_value(self, section: str) -> Any:
+        value = self.result[section]
+        return value.strip() if isinstance(value, str) else value
+
+    def _parse_line(self, raw_line: str):
+        self.lines.append(raw_line)
+        line = raw_line.strip()
+
+        for header, section in SECTION_HEADERS.items():
+            if line.startswith(header):
+                finished = self.current_section
+                self.current_section = section
+                return finished
+
+        result = self.result
+        current_section = self.current_section
+        if current_section == 'explanation' and line:
+            result['explanation'] += line + ' '
+        elif current_section == 'examples' and line and not line.startswith('-'):
+            # Accumulate code examples, skipping ``` fences
+            if not line.startswith('```'):
+                result['examples'].append(line)
+        elif current_section == 'common_mistakes' and line:
+            if line.startswith('-') or line.startswith('•'):
+                result['common_mistakes'].append(line.lstrip('-•').strip())
+            elif line and not line.startswith('RELATED'):
+                result['common_mistakes'].append(line)
+        elif current_section == 'related_concepts' and line:
+            # Split by commas for related concepts
+            concepts = [c.strip().lstrip('-•') for c in line.replace(',', ' ').split() if c.strip()]
+            result['related_concepts'].extend(concepts)
+        return None
+
+def finalize_concept_result(parser: ConceptSectionParser, response_text: str, concept: str) -> Dict[str, Any]:
+    """Clean up a parsed response and fill in fallbacks for missing sections"""
+    result = parser.result
+    lines = parser.lines
+
+    # Clean up and validate
+    result['explanation'] = result['explanation'].strip()
+
+    # If examples weren't parsed well, extract code blocks
+    if len(result['examples']) < 2:
+        code_block = ""
+        in_code_block = False
         for line in lines:
-            line = line.strip()
-
-            if line.startswith('EXPLANATION:'):
-                current_section = 'explanation'
-                continue
-            elif line.startswith('EXAMPLES:'):
-                current_section = 'examples'
-                continue
-            elif line.startswith('COMMON_MISTAKES:'):
-                current_section = 'common_mistakes'
-                continue
-            elif line.startswith('RELATED_CONCEPTS:'):
-                current_section = 'related_concepts'
-                continue
-
-            if current_section == 'explanation' and line:
-                result['explanation'] += line + ' '
-            elif current_section == 'examples' and line and not line.startswith('-'):
-                # Accumulate code examples
-                if line.startswith('```python'):
-                    continue
-                elif line.startswith('```'):
-                    continue
-                else:
+            if '```python' in line or '```' in line:
+                if in_code_block and code_block:
+                    result['examples'].append(code_block.strip())
+                    code_block = ""
+                in_code_block = not in_code_block
+            elif in_code_block:
+                code_block += line + '\n'
+            elif line.strip().startswith('#') or 'def ' in line or 'for ' in line or '=' in line:
+                if not in_code_block:
                     result['examples'].append(line)
-            elif current_section == 'common_mistakes' and line:
-                if line.startswith('-') or line.startswith('•'):
-                    result['common_mistakes'].append(line.lstrip('-•').strip())
-                elif line and not line.startswith('RELATED'):
-                    result['common_mistakes'].append(line)
-            elif current_section == 'related_concepts' and line:
-                # Split by commas for related concepts
-                concepts = [c.strip().lstrip('-•') for c in line.replace(',', ' ').split() if c.strip()]
-                result['related_concepts'].extend(concepts)
-
-        # Clean up and validate
-        result['explanation'] = result['explanation'].strip()
-
-        # If examples weren't parsed well, extract code blocks
-        if len(result['examples']) < 2:
-            code_block = ""
-            in_code_block = False
-            for line in lines:
-                if '```python' in line or '```' in line:
-                    if in_code_block and code_block:
-                        result['examples'].append(code_block.strip())
-                        code_block = ""
-                    in_code_block = not in_code_block
-                elif in_code_block:
-                    code_block += line + '\n'
-                elif line.strip().startswith('#') or 'def ' in line or 'for ' in line or '=' in line:
-                    if not in_code_block:
-                        result['examples'].append(line)
-
-        # Ensure we have at least some content
-        if not result['explanation']:
-            result['explanation'] = f"Here's an explanation of {concept} in Python: " + response_text[:500]
-
-        if len(result['examples']) == 0:
-            result['examples'] = [
-                f"# Example of {concept}\nprint('See explanation above')"
-            ]
-
-        if len(result['common_mistakes']) == 0:
-            result['common_mistakes'] = ["Check indentation", "Watch for typos", "Read error messages carefully"]
-
-        if len(result['related_concepts']) == 0:
-            result['related_concepts'] = ["Python basics", "Control flow", "Data structures"]
 
+    # Ensure we have at least some content
+    if not result['explanation']:
+        result['explanation'] = f"Here's an explanation of {concept} in Python: " + response_text[:500]
+
+    if len(result['examples']) == 0:
+        result['examples'] = [
+            f"# Example of {concept}\nprint('See explanation above')"
+        ]
+
+    if len(result['common_mistakes']) == 0:
+        result['common_mistakes'] = ["Check indentation", "Watch for typos", "Read error messages carefully"]
+
+    if len(result['related_concepts']) == 0:
+        result['related_concepts'] = ["Python basics", "Control flow", "Data structures"]
+
+    return result
+
+async def fetch_concept_explanation(concept: str, difficulty: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Call Groq for an explanation and parse the structured response"""
+    try:
+        chat_completion = await create_chat_completion(
+            messages=messages,
+            model=GROQ_MODEL,
+            temperature=0.7,
+            max_tokens=1500,
+        )
+
+        response_text = chat_completion.choices[0].message.content
+        logger.info(f"Groq response received: {len(response_text)} characters")
+
+        # Parse the structured response
+        parser = ConceptSectionParser()
+        parser.feed(response_text)
+        parser.close()
+        result = finalize_concept_result(parser, response_text, concept)
+
+        response_cache.set(concept, GROQ_MODEL, result, difficulty, PROMPT_VERSION)
         return result
 
     except Exception as e:
         logger.error(f"Error calling Groq API: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate explanation: {str(e)}")
 
+def build_concept_response(concept: str, difficulty: str, result: Dict[str, Any]) -> ConceptResponse:
+    return ConceptResponse(
+        concept=concept,
+        explanation=result['explanation'],
+        examples=result['examples'][:3],  # Limit to 3 examples
+        common_mistakes=result['common_mistakes'][:3],  # Limit to 3 mistakes
+        related_concepts=result['related_concepts'][:4],  # Limit to 4 related concepts
+        difficulty=difficulty
+    )
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_concept_explanation(concept: str, difficulty: str) -> AsyncIterator[str]:
+    """Yield SSE events: tokens as they arrive, each section once complete, then the full response"""
+    cached = response_cache.get(concept, GROQ_MODEL, difficulty, PROMPT_VERSION)
+    if cached is not None:
+        for section in SECTION_HEADERS.values():
+            yield sse_event("section", {"section": section, "content": cached[section]})
+        yield sse_event("done", build_concept_response(concept, difficulty, cached).model_dump())
+        return
+
+    parser = ConceptSectionParser()
+    chunks = []
+    try:
+        async for token in stream_chat_completion(
+            messages=build_concept_messages(concept, difficulty),
+            model=GROQ_MODEL,
+            temperature=0.7,
+            max_tokens=1500,
+        ):
+            chunks.append(token)
+            yield sse_event("token", {"text": token})
+            for section in parser.feed(token):
+                yield sse_event("section", {"section": section, "content": parser.section_value(section)})
+
+        for section in parser.close():
+            yield sse_event("section", {"section": section, "content": parser.section_value(section)})
+
+        response_text = "".join(chunks)
+        logger.info(f"Groq stream finished: {len(response_text)} characters")
+        result = finalize_concept_result(parser, response_text, concept)
+        response_cache.set(concept, GROQ_MODEL, result, difficulty, PROMPT_VERSION)
+        yield sse_event("done", build_concept_response(concept, difficulty, result).model_dump())
+    except Exception as e:
+        logger.error(f"Error streaming from Groq API: {str(e)}")
+        yield sse_event("error", {"detail": f"Failed to generate explanation: {str(e)}"})
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "concepts-agent-groq", "model": "llama-3.3-70b-versatile"}
+    return {"status": "healthy", "service": "concepts-agent-groq", "model": GROQ_MODEL}
 
 @app.post("/explain", response_model=ConceptResponse)
 async def explain_concept(request: ConceptRequest):
@@ -169,31 +343,50 @@ async def explain_concept(request: ConceptRequest):
     logger.info(f"Generating explanation for '{concept}' at {difficulty} level using Groq")
 
     try:
-        result = generate_concept_explanation(concept, difficulty)
-
-        return ConceptResponse(
-            concept=concept,
-            explanation=result['explanation'],
-            examples=result['examples'][:3],  # Limit to 3 examples
-            common_mistakes=result['common_mistakes'][:3],  # Limit to 3 mistakes
-            related_concepts=result['related_concepts'][:4],  # Limit to 4 related concepts
-            difficulty=difficulty
-        )
+        result = await generate_concept_explanation(concept, difficulty)
+        return build_concept_response(concept, difficulty, result)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/explain/stream")
+async def explain_concept_stream(request: ConceptRequest):
+    """
+    Stream a Python concept explanation as Server-Sent Events
+    """
+    concept = request.concept.strip()
+    difficulty = request.difficulty_level.lower()
+
+    logger.info(f"Streaming explanation for '{concept}' at {difficulty} level using Groq")
+
+    return StreamingResponse(
+        stream_concept_explanation(concept, difficulty),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """LLM concurrency, queue-depth, cache and coalescing counters"""
+    return {
+        "groq": {**groq_stats, "max_concurrency": GROQ_MAX_CONCURRENCY},
+        "cache": response_cache.stats(),
+        "singleflight": groq_inflight.stats()
+    }
+
 @app.get("/")
 async def root():
     """Root endpoint"""
     return {
         "message": "Concepts Agent - Powered by Groq LLM",
-        "model": "llama-3.3-70b-versatile",
+        "model": GROQ_MODEL,
         "endpoints": {
             "/explain": "POST - Explain any Python concept",
+            "/explain/stream": "POST - Stream an explanation as Server-Sent Events",
             "/health": "GET - Health check",
+            "/metrics": "GET - LLM queue, concurrency and cache metrics",
         }
     }
 
@@ -0,0 +1,232 @@
+"""
+Response cache for LLM answers.
+
+Entries are keyed on the normalized query plus model, difficulty and prompt version,
+and are evicted by TTL first and then least-recently-used once the entry count or
+memory cap is exceeded. An optional SQLite file keeps answers across restarts, and an
+optional near-duplicate lookup matches queries by word-shingle Jaccard similarity.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# Sentence punctuation closing a query ("what is a loop?"), but not the symbols in "c++" or "!="
+_TRAILING_PUNCTUATION_RE = re.compile(r"(?<=\w)[?.!]+$")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Casefold, collapse whitespace and drop closing sentence punctuation. Everything else is kept:
+    symbols carry meaning in programming questions ("==" vs "!=", "c++"), and so does any script.
+    """
+    return _TRAILING_PUNCTUATION_RE.sub("", " ".join(text.casefold().split()))
+
+
+def shingles(normalized: str, size: int = 2) -> Set[str]:
+    """Word shingles of a normalized query; short queries fall back to single words"""
+    words = normalized.split()
+    if len(words) < size:
+        return set(words)
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "scope", "shingles")
+
+    def __init__(self, value: Dict[str, Any], size: int, expires_at: float, scope: str, shingle_set: Set[str]):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.scope = scope
+        self.shingles = shingle_set
+
+
+class ResponseCache:
+    """LRU + TTL cache of JSON-serializable LLM responses"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl_seconds: float = 3600.0,
+                 db_path: Optional[str] = None, near_duplicate_threshold: float = 0.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicate_threshold = near_duplicate_threshold
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        # shingle -> keys of in-memory entries containing it, used for near-duplicate candidates
+        self._shingle_index: Dict[str, Set[str]] = {}
+
+        self.stats_counters = {"hits": 0, "near_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    @staticmethod
+    def _scope(model: str, difficulty: str, prompt_version: str) -> str:
+        return f"{model}|{difficulty}|{prompt_version}"
+
+    @staticmethod
+    def _key(normalized: str, scope: str) -> str:
+        return hashlib.sha256(f"{scope}|{normalized}".encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------ public API
+
+    def get(self, query: str, model: str, difficulty: str = "", prompt_version: str = "1") -> Optional[Dict[str, Any]]:
+        """Return a cached response, or None on a miss"""
+        normalized = normalize_query(query)
+        if not normalized:
+            self.stats_counters["misses"] += 1
+            return None
+        scope = self._scope(model, difficulty, prompt_version)
+        key = self._key(normalized, scope)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.stats_counters["hits"] += 1
+                return entry.value
+            self._remove(key)
+            self.stats_counters["expirations"] += 1
+
+        if self._db is not None:
+            row = self._db_get(key, now)
+            if row is not None:
+                value, expires_at = row
+                self._insert(key, value, scope, normalized, expires_at)
+                self.stats_counters["disk_hits"] += 1
+                return value
+
+        if self.near_duplicate_threshold > 0:
+            value = self._near_duplicate(normalized, scope, now)
+            if value is not None:
+                self.stats_counters["near_hits"] += 1
+                return value
+
+        self.stats_counters["misses"] += 1
+        return None
+
+    def set(self, query: str, model: str, value: Dict[str, Any], difficulty: str = "", prompt_version: str = "1"):
+        """Store a response; blank queries are never cached"""
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        scope = self._scope(model, difficulty, prompt_version)
+        key = self._key(normalized, scope)
+        expires_at = time.time() + self.ttl_seconds
+        self._insert(key, value, scope, normalized, expires_at)
+        if self._db is not None:
+            self._db_set(key, scope, normalized, value, expires_at)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self.stats_counters[k] for k in ("hits", "near_hits", "disk_hits", "misses"))
+        hits = lookups - self.stats_counters["misses"]
+        return {
+            **self.stats_counters,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "persistent": self._db is not None
+        }
+
+    def _insert(self, key: str, value: Dict[str, Any], scope: str, normalized: str, expires_at: float):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+
+        entry = _Entry(value, size, expires_at, scope, shingles(normalized))
+        self._entries[key] = entry
+        self._bytes += size
+        for shingle in entry.shingles:
+            self._shingle_index.setdefault(shingle, set()).add(key)
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats_counters["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for shingle in entry.shingles:
+            keys = self._shingle_index.get(shingle)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._shingle_index[shingle]
+
+    def _near_duplicate(self, normalized: str, scope: str, now: float) -> Optional[Dict[str, Any]]:
+        query_shingles = shingles(normalized)
+        if not query_shingles:
+            return None
+
+        candidates: Set[str] = set()
+        for shingle in query_shingles:
+            candidates |= self._shingle_index.get(shingle, set())
+
+        best_key, best_score = None, 0.0
+        for key in candidates:
+            entry = self._entries[key]
+            if entry.scope != scope or entry.expires_at <= now:
+                continue
+            score = len(query_shingles & entry.shingles) / len(query_shingles | entry.shingles)
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_key is None or best_score < self.near_duplicate_threshold:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key].value
+
+    def _open_db(self, db_path: str):
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # Let SQLite read pages through mmap so repeated lookups avoid read() copies
+        self._db.execute("PRAGMA mmap_size=67108864")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, scope TEXT NOT NULL, normalized TEXT NOT NULL, "
+            "value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        now = time.time()
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+
+        # Warm the memory tier with the freshest entries so near-duplicate lookups work after a restart
+        rows = self._db.execute(
+            "SELECT key, scope, normalized, value, expires_at FROM responses ORDER BY expires_at DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        for key, scope, normalized, value, expires_at in reversed(rows):
+            self._insert(key, json.loads(value), scope, normalized, expires_at)
+        logger.info(f"Response cache loaded {len(rows)} entries from {db_path}")
+
+    def _db_get(self, key: str, now: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        try:
+            row = self._db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Response cache read failed: {e}")
+            return None
+        if row is None or row[1] <= now:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _db_set(self, key: str, scope: str, normalized: str, value: Dict[str, Any], expires_at: float):
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, normalized, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, scope, normalized, json.dumps(value), expires_at)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Response cache write failed: {e}")
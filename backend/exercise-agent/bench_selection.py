@@ -0,0 +1,101 @@
+"""
+Benchmark: SelectionEngine vs a per-request scan of the topic's exercises.
+
+Synthetic banks of growing size (8 topics x 3 difficulties) with a population of students who
+have each already been served part of their topic. The naive selector builds the list of
+unseen candidates and their weights on every call, so its cost grows with the bank; the
+engine works per (topic, difficulty) bucket on bitsets and should stay roughly flat.
+
+Run from this directory:  python bench_selection.py [selections]
+"""
+import random
+import sys
+import time
+
+from selection import DIFFICULTY_ORDER, SeenSets, SelectionEngine
+
+TOPICS = ["variables", "loops", "functions", "data_structures", "classes", "files", "errors", "libraries"]
+DIFFICULTIES = list(DIFFICULTY_ORDER)
+SIZES = [100, 1000, 5000, 10000]
+USERS = 1000
+# Share of their topic each student has already been served
+SEEN_FRACTION = 0.3
+DECAY = 0.25
+
+
+def make_index(size: int):
+    index = {}
+    for i in range(size):
+        key = (TOPICS[i % len(TOPICS)], DIFFICULTIES[(i // len(TOPICS)) % len(DIFFICULTIES)])
+        index.setdefault(key, []).append(f"ex-{i:05d}")
+    return index
+
+
+def make_naive(index):
+    """Per-request scan: every exercise of the topic with its weight, unseen ones only"""
+    by_topic = {}
+    for (topic, difficulty), ids in index.items():
+        by_topic.setdefault(topic, []).extend((exercise_id, DIFFICULTY_ORDER[difficulty]) for exercise_id in ids)
+    seen_sets = {}
+    rng = random.Random(1)
+
+    def select(topic: str, target: int, user_id: str) -> str:
+        seen = seen_sets.setdefault(user_id, set())
+        candidates = [(exercise_id, DECAY ** abs(level - target))
+                      for exercise_id, level in by_topic[topic] if exercise_id not in seen]
+        if not candidates:
+            seen.clear()
+            candidates = [(exercise_id, DECAY ** abs(level - target)) for exercise_id, level in by_topic[topic]]
+        ids, weights = zip(*candidates)
+        chosen = rng.choices(ids, weights)[0]
+        seen.add(chosen)
+        return chosen
+
+    return select
+
+
+def warm_up(select, index, rng):
+    """Serve each student SEEN_FRACTION of one topic before timing"""
+    per_topic = sum(len(ids) for (topic, _), ids in index.items() if topic == TOPICS[0])
+    for user in range(USERS):
+        topic = TOPICS[user % len(TOPICS)]
+        for _ in range(max(1, int(per_topic * SEEN_FRACTION))):
+            select(topic, rng.randrange(3), f"user-{user}")
+
+
+def bench(label: str, select, selections: int, rng) -> float:
+    requests = [(TOPICS[rng.randrange(len(TOPICS))], rng.randrange(3), f"user-{rng.randrange(USERS)}")
+                for _ in range(selections)]
+    start = time.perf_counter()
+    for topic, target, user_id in requests:
+        select(topic, target, user_id)
+    per_call = (time.perf_counter() - start) / selections
+    print(f"  {label:<8} {1 / per_call:>12,.0f} selections/s  {per_call * 1e6:8.2f} us/selection")
+    return per_call
+
+
+def main():
+    selections = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{USERS} students, {SEEN_FRACTION:.0%} of their topic already served, {selections} selections per run")
+
+    for size in SIZES:
+        index = make_index(size)
+        engine = SelectionEngine(SeenSets(), difficulty_decay=DECAY, rng=random.Random(1))
+
+        def engine_select(topic: str, target: int, user_id: str) -> str:
+            return engine.select(index, topic, target, user_id=user_id)
+
+        naive_select = make_naive(index)
+        # Keep the warm-up out of the comparison: both selectors see the same amount of history
+        warm_up(engine_select, index, random.Random(2))
+        warm_up(naive_select, index, random.Random(2))
+
+        print(f"\n{size} exercises ({size // len(TOPICS)} per topic)")
+        engine_cost = bench("engine", engine_select, selections, random.Random(3))
+        naive_cost = bench("naive", naive_select, selections, random.Random(3))
+        print(f"  engine is {naive_cost / engine_cost:.1f}x faster, seen-sets use "
+              f"{engine.seen.stats()['bytes'] / USERS:.0f} bytes per student")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Grading engine: runs submissions in a pool of worker processes instead of the API process.
+
+A submission is compiled and executed once in a worker, then every test case calls into the
+resulting namespace there. The worker never sees the expected results: it sends back each
+return value converted to plain JSON-like data, its str() and what was printed, and the parent
+compares those with what the test expects, so a submission that patches the grader module or
+the builtins in its worker can't pass tests it fails. Each test (and the module-level exec) runs under an interval timer,
+and the timeout is raised as a BaseException so `except Exception` in student code can't
+swallow it. Code that blocks signals or spins inside C code is caught by the total timeout in
+the parent, which replaces the whole pool. Independent submissions are graded in parallel, one
+per worker; submissions wait for a free worker before their total timeout starts.
+
+Workers get an address-space limit and by default are replaced after every submission
+(max_tasks_per_child=1), since any state a submission leaves behind in a worker, patched
+modules included, would otherwise apply to the next user's code.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+import asyncio
+import contextlib
+import io
+import logging
+import math
+import multiprocessing
+import re
+import resource
+import signal
+
+logger = logging.getLogger(__name__)
+
+SOURCE_NAME = "<submission>"
+# exact: return value equals the expected JSON value; float: numbers within the tolerance;
+# regex: str(return value) matches the pattern; stdout: printed output equals or matches
+COMPARISON_MODES = ("exact", "float", "regex", "stdout")
+DEFAULT_TOLERANCE = 1e-6
+# Longest rendering of a result or captured output kept for feedback
+MAX_ACTUAL_CHARS = 500
+
+
+class GradingError(Exception):
+    """Raised when a submission could not be graded (timeout or a crashed worker)"""
+
+
+class TestTimeout(BaseException):
+    """Raised inside a worker when a test runs past its timeout"""
+
+
+def _on_alarm(signum, frame):
+    raise TestTimeout()
+
+
+def _init_worker(memory_limit_mb: int):
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+@contextlib.contextmanager
+def _time_limit(seconds: float):
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class Unrepresentable(Exception):
+    """A return value with no plain-data form, so it can't equal any expected JSON value"""
+
+
+def _plain(value: Any) -> Any:
+    """
+    Worker side: the value as None, bool, int, float, str, list or str-keyed dict, built from
+    those exact types so nothing the submission defined reaches the parent. Tuples become lists,
+    as they would in JSON, so (10, 5) matches an expected [10, 5].
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    # The unbound base methods, so an overriding subclass can't hand back one of its own instances
+    for kind, exact in ((int, int.__int__), (float, float.__float__), (str, str.__str__)):
+        if isinstance(value, kind):
+            return exact(value)
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise Unrepresentable()
+        return {str.__str__(key): _plain(item) for key, item in value.items()}
+    raise Unrepresentable()
+
+
+def _close(actual: Any, expected: Any, tolerance: float) -> bool:
+    if isinstance(expected, list):
+        return (isinstance(actual, list) and len(actual) == len(expected)
+                and all(_close(a, e, tolerance) for a, e in zip(actual, expected)))
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        return (isinstance(actual, (int, float)) and not isinstance(actual, bool)
+                and math.isclose(actual, expected, rel_tol=tolerance, abs_tol=tolerance))
+    return actual == expected
+
+
+def results_match(test_case: Dict[str, Any], run: Dict[str, Any], comparison: str, tolerance: float) -> bool:
+    """Parent side: check a test's return value (or, in stdout mode, its printed output) against what it expects"""
+    expected = test_case.get("expected_output")
+    pattern = test_case.get("expected_output_pattern")
+    if comparison == "stdout":
+        if pattern is not None:
+            # Output spans lines, so let '.' cross them
+            return bool(re.search(pattern, run["output"], re.DOTALL))
+        return run["output"].rstrip() == str(expected).rstrip()
+    if comparison == "regex":
+        return bool(re.search(pattern, run["text"]))
+    if not run["plain"]:
+        return False
+    if comparison == "float":
+        return _close(run["value"], expected, tolerance)
+    return run["value"] == expected
+
+
+def _error(e: BaseException) -> str:
+    return f"Execution error: {str(e) or type(e).__name__}"
+
+
+def _outcome(passed: bool, actual: str = "", error: Optional[str] = None, timed_out: bool = False) -> Dict[str, Any]:
+    return {"passed": passed, "actual": actual[:MAX_ACTUAL_CHARS], "error": error, "timed_out": timed_out}
+
+
+def _run(value: Any = None, plain: bool = False, text: str = "", output: str = "", error: Optional[str] = None,
+         timed_out: bool = False) -> Dict[str, Any]:
+    return {"value": value, "plain": plain, "text": text, "output": output, "error": error, "timed_out": timed_out}
+
+
+def run_tests(code: str, test_args: List[List[Any]], entry_point: Optional[str],
+              test_timeout: float) -> List[Dict[str, Any]]:
+    """
+    Worker side: compile and load the submission once, then call it with each test's arguments and
+    return what each call produced, as plain data. Without an entry point there is one run: what the
+    program itself printed.
+    """
+    stdout = io.StringIO()
+    try:
+        compiled = compile(code, SOURCE_NAME, "exec")
+        namespace: Dict[str, Any] = {}
+        with contextlib.redirect_stdout(stdout), _time_limit(test_timeout):
+            exec(compiled, namespace)
+        if entry_point is None:
+            return [_run(output=str.__str__(stdout.getvalue()))]
+        if not callable(namespace.get(entry_point)):
+            raise Exception(f"Function '{entry_point}' not found in submitted code")
+        func = namespace[entry_point]
+    except TestTimeout:
+        return [_run(error="Execution error: timed out loading the solution", timed_out=True)]
+    except BaseException as e:
+        return [_run(error=_error(e))]
+
+    runs = []
+    for args in test_args:
+        # Only what this call prints counts in stdout mode
+        stdout.seek(0)
+        stdout.truncate()
+        try:
+            with contextlib.redirect_stdout(stdout), _time_limit(test_timeout):
+                result = func(*args)
+                output = str.__str__(stdout.getvalue())
+                text = str.__str__(str(result))
+                try:
+                    value, plain = _plain(result), True
+                except Unrepresentable:
+                    value, plain = None, False
+            runs.append(_run(value, plain, text, output))
+        except TestTimeout:
+            runs.append(_run(error=f"Execution error: timed out after {test_timeout}s", timed_out=True))
+        except BaseException as e:
+            runs.append(_run(error=_error(e)))
+    return runs
+
+
+def score_runs(runs: List[Dict[str, Any]], test_cases: List[Dict[str, Any]], comparison: str,
+               tolerance: float) -> List[Dict[str, Any]]:
+    """Parent side: one outcome per test case from what the worker reported"""
+    if len(runs) != len(test_cases):
+        # A single run: the program's own output, or an error loading it, shared by every test
+        runs = runs[:1] * len(test_cases)
+    outcomes = []
+    for test_case, run in zip(test_cases, runs):
+        if run["error"] is not None:
+            outcomes.append(_outcome(False, error=run["error"], timed_out=run["timed_out"]))
+            continue
+        try:
+            passed = results_match(test_case, run, comparison, tolerance)
+        except Exception as e:
+            # A bad expected pattern in the exercise data
+            outcomes.append(_outcome(False, error=_error(e)))
+            continue
+        outcomes.append(_outcome(passed, run["output"] if comparison == "stdout" else run["text"]))
+    return outcomes
+
+
+class GradingEngine:
+    def __init__(self, workers: int, test_timeout: float = 2.0, total_timeout: float = 10.0,
+                 memory_limit_mb: int = 256, max_tasks_per_child: int = 1):
+        self.workers = workers
+        self.test_timeout = test_timeout
+        self.total_timeout = total_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_child = max_tasks_per_child
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._generation = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.stats_counters = {"graded": 0, "timeouts": 0, "worker_failures": 0, "pool_restarts": 0}
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.workers)
+        self._executor = self._new_executor()
+        logger.info(f"Grading pool started with {self.workers} workers")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # forkserver: workers don't inherit the API process's threads and sockets
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_init_worker,
+            initargs=(self.memory_limit_mb,),
+            max_tasks_per_child=self.max_tasks_per_child
+        )
+
+    def _restart(self, generation: int):
+        """Replace the pool, unless another caller already did since `generation`"""
+        if generation != self._generation:
+            return
+        old = self._executor
+        self._executor = self._new_executor()
+        self._generation += 1
+        self.stats_counters["pool_restarts"] += 1
+        # The executor can't cancel a running call, so stop its processes directly
+        for process in list((getattr(old, "_processes", None) or {}).values()):
+            process.kill()
+        old.shutdown(wait=False, cancel_futures=True)
+
+    async def grade(self, code: str, test_cases: List[Dict[str, Any]], entry_point: Optional[str] = None,
+                    comparison: str = "exact", tolerance: float = DEFAULT_TOLERANCE) -> List[Dict[str, Any]]:
+        """Run all test cases for one submission in a worker; raises GradingError on timeout or crash"""
+        loop = asyncio.get_running_loop()
+        # Only the arguments go to the worker; expected results stay here
+        test_args = [list(test_case.get("args", [])) for test_case in test_cases]
+        async with self._slots:
+            # One retry for a submission whose pool was torn down by someone else's runaway code
+            for attempt in range(2):
+                generation = self._generation
+                try:
+                    runs = await asyncio.wait_for(
+                        loop.run_in_executor(self._executor, run_tests, code, test_args, entry_point,
+                                             self.test_timeout),
+                        self.total_timeout
+                    )
+                    self.stats_counters["graded"] += 1
+                    return score_runs(runs, test_cases, comparison, tolerance)
+                except asyncio.TimeoutError:
+                    self.stats_counters["timeouts"] += 1
+                    self._restart(generation)
+                    raise GradingError(f"Grading timed out after {self.total_timeout}s")
+                except BrokenProcessPool:
+                    if generation != self._generation and attempt == 0:
+                        continue
+                    self.stats_counters["worker_failures"] += 1
+                    self._restart(generation)
+                    raise GradingError("Grading worker crashed (the solution may use too much memory)")
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "generation": self._generation, **self.stats_counters}
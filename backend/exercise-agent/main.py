@@ -1,11 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import logging
 import os
-from typing import Dict, Any, List
-import random
+from typing import AsyncIterator, Dict, Any, List, Literal, Optional, Tuple
 import json
 import re
+from content_store import ContentStore, etag_for, etag_matches
+from grader import GradingEngine, GradingError, DEFAULT_TOLERANCE
+from submission_cache import SubmissionCache
+from grading_jobs import (GradingJobQueue, JobStore, QueueFullError, CallbackURLError, FINISHED, check_callback_url,
+                          public_job)
+from selection import DIFFICULTY_ORDER, MasteryClient, SeenSets, SelectionEngine, level_for_mastery
 
 # Initialize FastAPI app
 app = FastAPI(title="Exercise Agent", description="Generates and auto-grades coding challenges", version="1.0.0")
@@ -16,7 +22,7 @@ logger = logging.getLogger(__name__)
 
 class ExerciseRequest(BaseModel):
     topic: str
-    difficulty: str = "beginner"  # beginner, intermediate, advanced
+    difficulty: str = "beginner"  # beginner, intermediate, advanced, or adaptive/any to follow the student's mastery
     user_context: Dict[str, Any] = {}
 
 class ExerciseSubmission(BaseModel):
@@ -24,6 +30,10 @@ class ExerciseSubmission(BaseModel):
     user_solution: str
     user_context: Dict[str, Any] = {}
 
+class GradingJobRequest(ExerciseSubmission):
+    # Receives the finished job as a JSON POST
+    callback_url: Optional[str] = None
+
 class Exercise(BaseModel):
     id: str
     title: str
@@ -32,6 +42,10 @@ class Exercise(BaseModel):
     difficulty: str
     topic: str
     hints: List[str]
+    # Function the tests call with each case's args; None runs the program and checks what it prints
+    entry_point: Optional[str] = None
+    comparison: Literal["exact", "float", "regex", "stdout"] = "exact"
+    tolerance: float = DEFAULT_TOLERANCE
     test_cases: List[Dict[str, Any]]
 
 class GradeResult(BaseModel):
@@ -45,203 +59,115 @@ class ExerciseResponse(BaseModel):
     exercise: Exercise
     message: str = "Exercise generated successfully"
 
-# Sample exercise database
-EXERCISE_DATABASE = {
-    "variables": [
-        {
-            "id": "var-001",
-            "title": "Variable Assignment Practice",
-            "description": "Create variables to store your name, age, and favorite color. Print a sentence using these variables.",
-            "starter_code": "# TODO: Create variables for name, age, and favorite_color\n# Then print a sentence using these variables\n",
-            "difficulty": "beginner",
-            "topic": "variables",
-            "hints": [
-                "Use meaningful variable names",
-                "Remember to use quotes for string values",
-                "Use f-strings for printing variables in sentences"
-            ],
-            "test_cases": [
-                {"input": "", "expected_output_pattern": r".*Alice.*25.*blue.*"},
-                {"input": "", "expected_output_pattern": r".*[Nn]ame|[Aa]ge|[Cc]olor.*"}
-            ]
-        },
-        {
-            "id": "var-002",
-            "title": "Swap Two Variables",
-            "description": "Write a function that swaps the values of two variables without using a temporary variable.",
-            "starter_code": "def swap_variables(a, b):\n    # TODO: Swap a and b without using a temporary variable\n    pass\n",
-            "difficulty": "intermediate",
-            "topic": "variables",
-            "hints": [
-                "Consider using tuple unpacking",
-                "Python allows multiple assignment in one line"
-            ],
-            "test_cases": [
-                {"input": "(5, 10)", "expected_output": [10, 5]},
-                {"input": "('hello', 'world')", "expected_output": ['world', 'hello']}
-            ]
-        }
-    ],
-    "loops": [
-        {
-            "id": "loop-001",
-            "title": "Simple For Loop",
-            "description": "Write a for loop that prints the numbers 1 through 10.",
-            "starter_code": "# TODO: Write a for loop to print numbers 1 through 10\n",
-            "difficulty": "beginner",
-            "topic": "loops",
-            "hints": [
-                "Use the range() function",
-                "Remember that range is exclusive of the end value"
-            ],
-            "test_cases": [
-                {"expected_output_pattern": r"1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n?"},
-                {"expected_output_pattern": r"(1.*2.*3.*4.*5.*6.*7.*8.*9.*10)"}
-            ]
-        },
-        {
-            "id": "loop-002",
-            "title": "Sum of Numbers",
-            "description": "Write a function that calculates the sum of all numbers in a list using a loop.",
-            "starter_code": "def sum_numbers(numbers):\n    # TODO: Calculate the sum of numbers in the list using a loop\n    total = 0\n    # Your code here\n    return total\n",
-            "difficulty": "intermediate",
-            "topic": "loops",
-            "hints": [
-                "Initialize a variable to store the running total",
-                "Iterate through each number in the list",
-                "Add each number to the running total"
-            ],
-            "test_cases": [
-                {"input": "[1, 2, 3, 4, 5]", "expected_output": 15},
-                {"input": "[10, -5, 3]", "expected_output": 8},
-                {"input": "[]", "expected_output": 0}
-            ]
-        }
-    ],
-    "functions": [
-        {
-            "id": "func-001",
-            "title": "Temperature Converter",
-            "description": "Write a function that converts Celsius to Fahrenheit.",
-            "starter_code": "def celsius_to_fahrenheit(celsius):\n    # TODO: Convert Celsius to Fahrenheit\n    # Formula: (celsius * 9/5) + 32\n    pass\n",
-            "difficulty": "beginner",
-            "topic": "functions",
-            "hints": [
-                "Use the formula: (celsius * 9/5) + 32",
-                "Remember operator precedence"
-            ],
-            "test_cases": [
-                {"input": 0, "expected_output": 32},
-                {"input": 100, "expected_output": 212},
-                {"input": -40, "expected_output": -40}
-            ]
-        },
-        {
-            "id": "func-002",
-            "title": "Palindrome Checker",
-            "description": "Write a function that checks if a string is a palindrome (reads the same forwards and backwards).",
-            "starter_code": "def is_palindrome(text):\n    # TODO: Check if text is a palindrome\n    # Ignore spaces, punctuation, and case\n    pass\n",
-            "difficulty": "intermediate",
-            "topic": "functions",
-            "hints": [
-                "First clean the string: remove non-alphanumeric characters and convert to lowercase",
-                "Compare the string with its reverse",
-                "You can reverse a string with slicing: text[::-1]"
-            ],
-            "test_cases": [
-                {"input": "'racecar'", "expected_output": True},
-                {"input": "'A man a plan a canal Panama'", "expected_output": True},
-                {"input": "'hello'", "expected_output": False}
-            ]
-        }
-    ]
-}
-
-def execute_user_code(code: str, function_name: str, test_input) -> Any:
-    """Execute user code safely and return the result"""
-    try:
-        # Create a local namespace to execute the code
-        local_namespace = {}
-
-        # Execute the user code
-        exec(code, {}, local_namespace)
-
-        # Get the function from the local namespace
-        if function_name in local_namespace:
-            func = local_namespace[function_name]
+# Exercise bank, one JSON record per exercise, reloaded when the file changes
+EXERCISES_DATA_PATH = os.getenv("EXERCISES_DATA_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "exercises.jsonl"))
+CONTENT_RELOAD_INTERVAL = float(os.getenv("CONTENT_RELOAD_INTERVAL", 2.0))
 
-            # Call the function with the test input
-            if isinstance(test_input, tuple):
-                return func(*test_input)
-            else:
-                return func(test_input)
-        else:
-            raise Exception(f"Function '{function_name}' not found in submitted code")
-    except Exception as e:
-        raise Exception(f"Execution error: {str(e)}")
-
-def grade_exercise_solution(exercise_id: str, user_solution: str) -> GradeResult:
+def build_exercise_indexes(records: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Validate every exercise, group ids by topic and by (topic, difficulty), and pre-render each
+    exercise's JSON each time the exercise bank is loaded. Lookup by id is the snapshot's own key table.
+    """
+    by_topic: Dict[str, List[str]] = {}
+    by_topic_difficulty: Dict[Tuple[str, str], List[str]] = {}
+    rendered: Dict[str, bytes] = {}
+    for exercise_id, record in records.items():
+        exercise = Exercise(**record)
+        if exercise.entry_point is None and exercise.comparison != "stdout":
+            raise ValueError(f"Exercise {exercise_id}: '{exercise.comparison}' comparison needs an entry_point")
+        by_topic.setdefault(exercise.topic, []).append(exercise_id)
+        by_topic_difficulty.setdefault((exercise.topic, exercise.difficulty), []).append(exercise_id)
+        rendered[exercise_id] = exercise.model_dump_json().encode()
+    return {"by_topic": by_topic, "by_topic_difficulty": by_topic_difficulty, "rendered": rendered}
+
+def render_exercise_response(exercise_json: bytes, message: str) -> bytes:
+    """Splice a pre-rendered exercise into the ExerciseResponse envelope"""
+    return b'{"exercise":' + exercise_json + b',"message":' + json.dumps(message).encode() + b'}'
+
+def json_bytes_response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    """Serve pre-rendered JSON as-is, or 304 if the client already has this version"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+exercise_store = ContentStore(EXERCISES_DATA_PATH, key_field="id", build_indexes=build_exercise_indexes,
+                              check_interval=CONTENT_RELOAD_INTERVAL)
+
+# Submissions are graded in worker processes, one per core, never in the API process
+grading_engine = GradingEngine(
+    workers=int(os.getenv("GRADER_WORKERS", os.cpu_count() or 1)),
+    test_timeout=float(os.getenv("GRADER_TEST_TIMEOUT", 2.0)),
+    total_timeout=float(os.getenv("GRADER_TOTAL_TIMEOUT", 10.0)),
+    memory_limit_mb=int(os.getenv("GRADER_MEMORY_LIMIT_MB", 256)),
+    max_tasks_per_child=int(os.getenv("GRADER_MAX_TASKS_PER_WORKER", 1))
+)
+
+# Outcomes of graded submissions; identical resubmissions are answered without running anything
+submission_cache = SubmissionCache(max_entries=int(os.getenv("SUBMISSION_CACHE_SIZE", 10000)))
+
+# Exercise selection avoids repeats per user and targets the difficulty their topic mastery suggests
+PROGRESS_AGENT_URL = os.getenv("PROGRESS_AGENT_URL", "http://progress-agent.learnflow.svc.cluster.local:8000")
+selection_engine = SelectionEngine(
+    SeenSets(max_users=int(os.getenv("SELECTION_MAX_USERS", 50000))),
+    difficulty_decay=float(os.getenv("SELECTION_DIFFICULTY_DECAY", 0.25))
+)
+mastery_client = MasteryClient(
+    PROGRESS_AGENT_URL,
+    ttl=float(os.getenv("MASTERY_CACHE_TTL", 60.0)),
+    timeout=float(os.getenv("MASTERY_FETCH_TIMEOUT", 1.0))
+)
+
+@app.on_event("startup")
+async def startup():
+    grading_engine.start()
+    await grading_job_queue.start()
+    await mastery_client.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Jobs cut off here are still marked running and are graded again after the restart
+    await grading_job_queue.close()
+    grading_engine.close()
+    await mastery_client.close()
+
+async def grade_exercise_solution(exercise_id: str, user_solution: str) -> GradeResult:
     """Grade a user's exercise solution"""
     # Find the exercise
-    exercise = None
-    for topic, exercises in EXERCISE_DATABASE.items():
-        for ex in exercises:
-            if ex["id"] == exercise_id:
-                exercise = ex
-                break
-        if exercise:
-            break
+    snapshot = exercise_store.snapshot
+    exercise = snapshot.get(exercise_id)
 
     if not exercise:
         raise HTTPException(status_code=404, detail="Exercise not found")
 
-    # Extract function name from the exercise ID to determine which function to call
-    function_name = ""
-    if "swap_variables" in user_solution:
-        function_name = "swap_variables"
-    elif "sum_numbers" in user_solution:
-        function_name = "sum_numbers"
-    elif "celsius_to_fahrenheit" in user_solution:
-        function_name = "celsius_to_fahrenheit"
-    elif "is_palindrome" in user_solution:
-        function_name = "is_palindrome"
-    elif "temperature" in exercise_id.lower():
-        function_name = "celsius_to_fahrenheit"
-    elif "palindrome" in exercise_id.lower():
-        function_name = "is_palindrome"
-    elif "sum" in exercise_id.lower():
-        function_name = "sum_numbers"
-    elif "swap" in exercise_id.lower():
-        function_name = "swap_variables"
-
     feedback_messages = []
     passed_tests = 0
     total_tests = len(exercise["test_cases"])
 
-    for i, test_case in enumerate(exercise["test_cases"]):
-        try:
+    # The solution is loaded once in a worker and every test case runs there. The key covers the
+    # exercise record's bytes, so changed tests never reuse an old outcome
+    key = submission_cache.key(user_solution, snapshot.raw(exercise_id))
+    try:
+        outcomes = await submission_cache.get_or_grade(key, lambda: grading_engine.grade(
+            user_solution,
+            exercise["test_cases"],
+            entry_point=exercise.get("entry_point"),
+            comparison=exercise.get("comparison", "exact"),
+            tolerance=exercise.get("tolerance", DEFAULT_TOLERANCE)
+        ))
+    except GradingError as e:
+        outcomes = [{"passed": False, "actual": "", "error": str(e)}] * total_tests
+
+    for i, (test_case, outcome) in enumerate(zip(exercise["test_cases"], outcomes)):
+        if outcome["passed"]:
+            passed_tests += 1
+        elif outcome["error"]:
+            feedback_messages.append(f"Test {i+1} caused an error: {outcome['error']}")
+        else:
             expected = test_case.get("expected_output")
             expected_pattern = test_case.get("expected_output_pattern")
-            test_input = test_case.get("input")
-
-            # Execute the user's solution
-            result = execute_user_code(user_solution, function_name, test_input)
-
-            # Check result against expected value or pattern
-            test_passed = False
-            if expected is not None:
-                test_passed = result == expected
-            elif expected_pattern:
-                import re
-                test_passed = bool(re.search(expected_pattern, str(result)))
-
-            if test_passed:
-                passed_tests += 1
-            else:
-                feedback_messages.append(f"Test {i+1} failed: Expected {expected or expected_pattern}, got {result}")
-
-        except Exception as e:
-            feedback_messages.append(f"Test {i+1} caused an error: {str(e)}")
+            shown = expected if expected is not None else expected_pattern
+            feedback_messages.append(f"Test {i+1} failed: Expected {shown}, got {outcome['actual']}")
 
     # Calculate score
     score = passed_tests / total_tests if total_tests > 0 else 0
@@ -270,7 +196,7 @@ async def health_check():
     return {"status": "healthy", "service": "exercise-agent"}
 
 @app.post("/generate", response_model=ExerciseResponse)
-async def generate_exercise(request: ExerciseRequest):
+async def generate_exercise(request: ExerciseRequest, if_none_match: Optional[str] = Header(None)):
     """
     Generate a coding exercise based on topic and difficulty
     """
@@ -279,54 +205,54 @@ async def generate_exercise(request: ExerciseRequest):
 
     logger.info(f"Generating exercise for topic: {topic}, difficulty: {difficulty}")
 
-    # Find exercises matching the topic
-    topic_exercises = EXERCISE_DATABASE.get(topic, [])
-
-    if not topic_exercises:
-        # If no exercises for the specific topic, pick a random one
-        all_exercises = []
-        for exercises in EXERCISE_DATABASE.values():
-            all_exercises.extend(exercises)
-
-        if all_exercises:
-            selected_exercise = random.choice(all_exercises)
-        else:
-            # If no exercises at all, return a default one
-            default_exercise = Exercise(
-                id="default-001",
-                title="Introduction to Python",
-                description="Write a simple program that prints 'Hello, World!'",
-                starter_code="print('')  # Replace with your code\n",
-                difficulty="beginner",
-                topic="introduction",
-                hints=["Use the print() function", "Remember to put text in quotes"],
-                test_cases=[{"expected_output_pattern": r"Hello,? World!?!"}]
-            )
-            return ExerciseResponse(
-                exercise=default_exercise,
-                message="No exercises available for this topic. Here's a basic one to start."
-            )
+    # Candidates come straight from the load-time indexes; no exercise records are decoded
+    snapshot = exercise_store.snapshot
+    indexes = snapshot.indexes
+
+    # Known students get exercises they haven't seen yet, at the level their mastery of the topic suggests.
+    # Mastery is only fetched when it is used: for the level when none was asked for, or to weight
+    # topics when the topic is unknown
+    user_id = request.user_context.get("user_id")
+    needs_mastery = difficulty not in DIFFICULTY_ORDER or topic not in indexes["by_topic"]
+    mastery = await mastery_client.get(str(user_id)) if user_id and needs_mastery else None
+    if difficulty in DIFFICULTY_ORDER:
+        target_level = DIFFICULTY_ORDER[difficulty]
+    elif mastery and topic in mastery:
+        target_level = level_for_mastery(mastery[topic])
     else:
-        # Filter by difficulty if specified
-        if difficulty != "any":
-            difficulty_exercises = [ex for ex in topic_exercises if ex["difficulty"] == difficulty]
-            if difficulty_exercises:
-                selected_exercise = random.choice(difficulty_exercises)
-            else:
-                # If no exercises of requested difficulty, pick from all available for topic
-                selected_exercise = random.choice(topic_exercises)
-        else:
-            selected_exercise = random.choice(topic_exercises)
-
-    # Convert dict to Exercise model
-    exercise = Exercise(**selected_exercise)
-
-    logger.info(f"Generated exercise: {exercise.id}")
+        target_level = None
+    selected_id = selection_engine.select(
+        indexes["by_topic_difficulty"], topic, target_level, mastery,
+        user_id=str(user_id) if user_id else None,
+        strict=difficulty in DIFFICULTY_ORDER
+    )
 
-    return ExerciseResponse(
-        exercise=exercise,
-        message=f"Exercise generated for {topic} at {difficulty} level"
+    if selected_id is None:
+        # If no exercises at all, return a default one
+        default_exercise = Exercise(
+            id="default-001",
+            title="Introduction to Python",
+            description="Write a simple program that prints 'Hello, World!'",
+            starter_code="print('')  # Replace with your code\n",
+            difficulty="beginner",
+            topic="introduction",
+            hints=["Use the print() function", "Remember to put text in quotes"],
+            comparison="stdout",
+            test_cases=[{"expected_output_pattern": r"Hello,? World!?!"}]
+        )
+        return ExerciseResponse(
+            exercise=default_exercise,
+            message="No exercises available for this topic. Here's a basic one to start."
+        )
+
+    logger.info(f"Generated exercise: {selected_id}")
+
+    # The exercise was serialized at load time; only the message is encoded per request
+    body = render_exercise_response(
+        indexes["rendered"][selected_id],
+        f"Exercise generated for {topic} at {difficulty} level"
     )
+    return json_bytes_response(body, etag_for(body), if_none_match)
 
 @app.post("/grade", response_model=GradeResult)
 async def grade_exercise(submission: ExerciseSubmission):
@@ -336,7 +262,7 @@ async def grade_exercise(submission: ExerciseSubmission):
     logger.info(f"Grading submission for exercise: {submission.exercise_id}")
 
     try:
-        result = grade_exercise_solution(submission.exercise_id, submission.user_solution)
+        result = await grade_exercise_solution(submission.exercise_id, submission.user_solution)
         logger.info(f"Grading completed with score: {result.score}")
         return result
     except HTTPException:
@@ -346,20 +272,119 @@ async def grade_exercise(submission: ExerciseSubmission):
         logger.error(f"Grading error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Grading failed: {str(e)}")
 
+# Graded in the background; jobs are persisted so they outlive a restart
+GRADING_JOBS_DB = os.getenv("GRADING_JOBS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "grading_jobs.db"))
+
+async def grade_job(exercise_id: str, user_solution: str) -> Dict[str, Any]:
+    return (await grade_exercise_solution(exercise_id, user_solution)).model_dump()
+
+grading_job_queue = GradingJobQueue(
+    JobStore(GRADING_JOBS_DB),
+    grade_job,
+    workers=int(os.getenv("GRADING_JOB_WORKERS", grading_engine.workers)),
+    max_pending=int(os.getenv("GRADING_JOB_MAX_PENDING", 10000)),
+    retention_seconds=float(os.getenv("GRADING_JOB_RETENTION_SECONDS", 86400)),
+    # Comma-separated hosts (".example.com" for subdomains); if empty, any host with only public addresses
+    callback_allowed_hosts=[host.strip().lower() for host in os.getenv("GRADING_CALLBACK_ALLOWED_HOSTS", "").split(",")
+                            if host.strip()]
+)
+# Longest a GET /grade/jobs/{id}?wait=... request may hold on
+MAX_JOB_WAIT_SECONDS = 30.0
+SSE_KEEPALIVE_SECONDS = 15.0
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/grade/jobs", status_code=202)
+async def submit_grading_job(submission: GradingJobRequest):
+    """Queue a submission for grading and return its job id immediately"""
+    if submission.exercise_id not in exercise_store.snapshot:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    if submission.callback_url:
+        try:
+            await check_callback_url(submission.callback_url, grading_job_queue.callback_allowed_hosts)
+        except CallbackURLError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        job = grading_job_queue.submit(submission.exercise_id, submission.user_solution, submission.callback_url)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Too many grading jobs queued, please retry shortly")
+
+    logger.info(f"Queued grading job {job['id']} for exercise: {submission.exercise_id}")
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/grade/jobs/{job['id']}",
+        "events_url": f"/grade/jobs/{job['id']}/events"
+    }
+
+@app.get("/grade/jobs/{job_id}")
+async def get_grading_job(job_id: str, wait: float = 0):
+    """Job status and, once done, its GradeResult. With ?wait=N, hold on up to N seconds for it to finish"""
+    if wait > 0:
+        job = await grading_job_queue.wait(job_id, min(wait, MAX_JOB_WAIT_SECONDS))
+    else:
+        job = grading_job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+async def stream_job_events(job_id: str) -> AsyncIterator[str]:
+    """A status event now, keep-alive comments while it runs, then a done event with the finished job"""
+    job = grading_job_queue.store.get(job_id)
+    if job is None:
+        # Purged between the 404 check and the stream starting
+        yield sse_event("error", {"error": "Job not found"})
+        return
+    yield sse_event("status", public_job(job))
+    while job["status"] not in FINISHED:
+        job = await grading_job_queue.wait(job_id, SSE_KEEPALIVE_SECONDS)
+        if job is None:
+            yield sse_event("error", {"error": "Job not found"})
+            return
+        if job["status"] not in FINISHED:
+            yield ": keep-alive\n\n"
+    yield sse_event("done", public_job(job))
+
+@app.get("/grade/jobs/{job_id}/events")
+async def grading_job_events(job_id: str):
+    """Server-Sent Events for one grading job"""
+    if grading_job_queue.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        stream_job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/topics")
 async def list_topics():
     """List all available exercise topics"""
-    return {"topics": list(EXERCISE_DATABASE.keys())}
+    return {"topics": list(exercise_store.snapshot.indexes["by_topic"].keys())}
 
 @app.get("/exercises/{topic}")
 async def list_exercises_by_topic(topic: str):
     """List all exercises for a specific topic"""
-    if topic not in EXERCISE_DATABASE:
+    snapshot = exercise_store.snapshot
+    if topic not in snapshot.indexes["by_topic"]:
         raise HTTPException(status_code=404, detail="Topic not found")
 
-    exercises = EXERCISE_DATABASE[topic]
+    exercises = [snapshot.get(exercise_id) for exercise_id in snapshot.indexes["by_topic"][topic]]
     return {"topic": topic, "exercises": exercises, "count": len(exercises)}
 
+@app.get("/metrics")
+async def metrics():
+    """Grading pool, job queue, caches, selection and exercise bank statistics"""
+    return {
+        "grading": grading_engine.stats(),
+        "grading_jobs": grading_job_queue.stats(),
+        "submission_cache": submission_cache.stats(),
+        "selection": selection_engine.stats(),
+        "mastery_cache": mastery_client.stats(),
+        "exercise_store": exercise_store.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8002))
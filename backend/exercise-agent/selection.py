@@ -0,0 +1,242 @@
+"""
+Adaptive exercise selection.
+
+Every exercise id gets a small integer ordinal the first time it is seen (ordinals are never
+reused, so they stay valid across exercise bank reloads), and each user's seen-set is a Python
+int used as a bitset over those ordinals. The bank is grouped into (topic, difficulty) buckets,
+each with a bitmask of its ordinals.
+
+Selection is two-stage, so its cost depends on the number of buckets rather than the number of
+exercises: each bucket gets weight * (number of exercises in it the user hasn't seen), computed
+with one AND and a popcount on the bitsets, a bucket is drawn by weight, then an unseen
+exercise is drawn from it. The weight falls off by difficulty_decay per level away from the
+target difficulty and, when the requested topic has no exercises, favours the topics where the
+student's mastery is lowest. Once a user has seen every candidate their seen-set starts over.
+
+Topic mastery comes from the progress agent's /progress/{user_id}, cached per user for a TTL.
+Failures are cached briefly too, so a progress agent outage costs one timeout per user rather
+than one per request, and selection then carries on without mastery.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTY_ORDER = {"beginner": 0, "intermediate": 1, "advanced": 2}
+# Mastery thresholds between the difficulty levels, as in the progress agent's mastery levels
+MASTERY_LEVEL_THRESHOLDS = (0.4, 0.7)
+# Weakest topics are favoured, but a mastered topic still gets this much weight
+MIN_TOPIC_WEIGHT = 0.1
+# Draws from a bucket before giving up on rejection sampling and listing its unseen exercises
+MAX_REJECTION_DRAWS = 8
+
+
+def level_for_mastery(mastery: float) -> int:
+    """Difficulty level (index into DIFFICULTY_ORDER) suited to a topic mastery between 0 and 1"""
+    return sum(mastery > threshold for threshold in MASTERY_LEVEL_THRESHOLDS)
+
+
+class Bucket(NamedTuple):
+    topic: str
+    difficulty: str
+    ids: List[str]
+    ordinals: List[int]
+    mask: int
+
+
+class SeenSets:
+    """Per-user bitsets of served exercise ordinals, least recently active users evicted first"""
+
+    def __init__(self, max_users: int = 50000):
+        self.max_users = max_users
+        self._sets: "OrderedDict[str, int]" = OrderedDict()
+
+    def get(self, user_id: str) -> int:
+        return self._sets.get(user_id, 0)
+
+    def mark(self, user_id: str, ordinal: int):
+        self._sets[user_id] = self._sets.get(user_id, 0) | (1 << ordinal)
+        self._sets.move_to_end(user_id)
+        if len(self._sets) > self.max_users:
+            self._sets.popitem(last=False)
+
+    def reset(self, user_id: str, mask: int):
+        """Forget the user's seen exercises within `mask`"""
+        if user_id in self._sets:
+            self._sets[user_id] &= ~mask
+
+    def stats(self) -> Dict[str, Any]:
+        return {"users": len(self._sets), "bytes": sum((bits.bit_length() + 7) // 8 for bits in self._sets.values())}
+
+
+class SelectionEngine:
+    def __init__(self, seen: SeenSets, difficulty_decay: float = 0.25, rng: Optional[random.Random] = None):
+        self.seen = seen
+        self.difficulty_decay = difficulty_decay
+        self.rng = rng or random.Random()
+
+        self._ordinals: Dict[str, int] = {}
+        self._index: Optional[Dict[Tuple[str, str], List[str]]] = None
+        self._by_topic: Dict[str, List[Bucket]] = {}
+        self._all: List[Bucket] = []
+        self.stats_counters = {"selections": 0, "resets": 0}
+
+    def _ordinal(self, exercise_id: str) -> int:
+        ordinal = self._ordinals.get(exercise_id)
+        if ordinal is None:
+            ordinal = self._ordinals[exercise_id] = len(self._ordinals)
+        return ordinal
+
+    def _catalog(self, index: Dict[Tuple[str, str], List[str]]):
+        """Rebuild the buckets when the exercise bank (and so its index object) has changed"""
+        if index is self._index:
+            return
+        by_topic: Dict[str, List[Bucket]] = {}
+        for (topic, difficulty), ids in index.items():
+            ordinals = [self._ordinal(exercise_id) for exercise_id in ids]
+            mask = 0
+            for ordinal in ordinals:
+                mask |= 1 << ordinal
+            by_topic.setdefault(topic, []).append(Bucket(topic, difficulty, list(ids), ordinals, mask))
+        self._by_topic = by_topic
+        self._all = [bucket for buckets in by_topic.values() for bucket in buckets]
+        self._index = index
+
+    def _weight(self, bucket: Bucket, target_level: Optional[int], topic_weights: Optional[Dict[str, float]]) -> float:
+        weight = 1.0
+        if target_level is not None:
+            weight *= self.difficulty_decay ** abs(DIFFICULTY_ORDER.get(bucket.difficulty, 0) - target_level)
+        if topic_weights is not None:
+            weight *= topic_weights.get(bucket.topic, 1.0)
+        return weight
+
+    def _bucket_weights(self, buckets: List[Bucket], seen: int, target_level: Optional[int],
+                        topic_weights: Optional[Dict[str, float]]) -> List[float]:
+        """
+        Each bucket's weight times its number of unseen exercises. If every weight comes out zero
+        with unseen exercises left (a difficulty_decay of 0 and nothing at the target level), every
+        unseen exercise is equally likely instead.
+        """
+        unseen = [(bucket.mask & ~seen).bit_count() for bucket in buckets]
+        weights = [self._weight(bucket, target_level, topic_weights) * count for bucket, count in zip(buckets, unseen)]
+        return weights if any(weights) else unseen
+
+    def _pick_unseen(self, bucket: Bucket, seen: int) -> int:
+        """Position in the bucket of a random exercise the user hasn't seen (at least one must exist)"""
+        for _ in range(MAX_REJECTION_DRAWS):
+            position = self.rng.randrange(len(bucket.ids))
+            if not seen >> bucket.ordinals[position] & 1:
+                return position
+        # Mostly seen: list what's left
+        return self.rng.choice([i for i, ordinal in enumerate(bucket.ordinals) if not seen >> ordinal & 1])
+
+    def select(self, index: Dict[Tuple[str, str], List[str]], topic: str, target_level: Optional[int] = None,
+               mastery: Optional[Dict[str, float]] = None, user_id: Optional[str] = None,
+               strict: bool = False) -> Optional[str]:
+        """
+        Pick an exercise id from a (topic, difficulty) -> ids index, or None if it is empty.
+        An unknown topic draws from every topic, weighted toward the ones with the lowest mastery.
+        With strict, only the target level is drawn from (its seen-set starting over once it has all
+        been served), and nearby levels only if there are no exercises at that level at all.
+        """
+        self._catalog(index)
+        buckets = self._by_topic.get(topic)
+        topic_weights = None
+        if not buckets:
+            buckets = self._all
+            if mastery:
+                topic_weights = {t: max(MIN_TOPIC_WEIGHT, 1.0 - m) for t, m in mastery.items()}
+        if not buckets:
+            return None
+        if strict and target_level is not None:
+            exact = [bucket for bucket in buckets if DIFFICULTY_ORDER.get(bucket.difficulty) == target_level]
+            if exact:
+                buckets = exact
+
+        seen = self.seen.get(user_id) if user_id else 0
+        weights = self._bucket_weights(buckets, seen, target_level, topic_weights)
+        if not any(weights):
+            # Everything here has been served to this user: start over on these candidates
+            for bucket in buckets:
+                self.seen.reset(user_id, bucket.mask)
+            seen = self.seen.get(user_id)
+            weights = self._bucket_weights(buckets, seen, target_level, topic_weights)
+            self.stats_counters["resets"] += 1
+
+        bucket = self.rng.choices(buckets, weights)[0]
+        position = self._pick_unseen(bucket, seen)
+        if user_id:
+            self.seen.mark(user_id, bucket.ordinals[position])
+        self.stats_counters["selections"] += 1
+        return bucket.ids[position]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.stats_counters, "exercises_tracked": len(self._ordinals), "seen_sets": self.seen.stats()}
+
+
+class MasteryClient:
+    """Per-user topic mastery from the progress agent, cached for ttl seconds"""
+
+    def __init__(self, base_url: str, ttl: float = 60.0, failure_ttl: float = 5.0, timeout: float = 1.0,
+                 max_users: int = 50000):
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.timeout = timeout
+        self.max_users = max_users
+
+        self._cache: "OrderedDict[str, Tuple[float, Optional[Dict[str, float]]]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._http: Optional[httpx.AsyncClient] = None
+        self.stats_counters = {"hits": 0, "fetches": 0, "failures": 0}
+
+    async def start(self):
+        self._http = httpx.AsyncClient(timeout=self.timeout)
+
+    async def close(self):
+        if self._http:
+            await self._http.aclose()
+
+    async def get(self, user_id: str) -> Optional[Dict[str, float]]:
+        """Topic -> mastery (0 to 1), or None if the progress agent couldn't be reached"""
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._cache.move_to_end(user_id)
+            self.stats_counters["hits"] += 1
+            return entry[1]
+
+        # Concurrent requests for one user share a single fetch
+        pending = self._in_flight.get(user_id)
+        if pending is None:
+            pending = self._in_flight[user_id] = asyncio.ensure_future(self._fetch(user_id))
+            pending.add_done_callback(lambda _: self._in_flight.pop(user_id, None))
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, user_id: str) -> Optional[Dict[str, float]]:
+        self.stats_counters["fetches"] += 1
+        try:
+            # Quoted whole, so a user id can't add path segments or a query string
+            response = await self._http.get(f"{self.base_url}/progress/{quote(user_id, safe='')}")
+            response.raise_for_status()
+            mastery = {topic: float(value) for topic, value in response.json()["topic_mastery"].items()}
+            expires = time.monotonic() + self.ttl
+        except (httpx.HTTPError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Could not fetch mastery for {user_id} from the progress agent: {e}")
+            self.stats_counters["failures"] += 1
+            mastery, expires = None, time.monotonic() + self.failure_ttl
+
+        self._cache[user_id] = (expires, mastery)
+        self._cache.move_to_end(user_id)
+        if len(self._cache) > self.max_users:
+            self._cache.popitem(last=False)
+        return mastery
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.stats_counters, "cached_users": len(self._cache)}
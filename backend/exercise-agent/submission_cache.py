@@ -0,0 +1,93 @@
+"""
+Cache of grading outcomes for submissions, so identical resubmissions don't run again.
+
+Entries are keyed on a hash of the normalized source and the exercise record's raw bytes, so
+editing an exercise's tests invalidates its entries without any bookkeeping. Eviction is
+least-recently-used. Identical submissions that arrive while the first one is still being
+graded wait for that result instead of taking their own worker, which is what happens in the
+rush before a deadline.
+
+Only complete results are stored: a submission that hit a timeout or could not be graded is
+run again next time, since that depends on load as much as on the code.
+"""
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+
+Outcomes = List[Dict[str, Any]]
+
+
+def normalize_code(code: str) -> str:
+    """Unify line endings and trailing blank lines; anything else could change what the solution does"""
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip("\n") + "\n"
+
+
+def cacheable(outcomes: Outcomes) -> bool:
+    return not any(outcome.get("timed_out") for outcome in outcomes)
+
+
+class SubmissionCache:
+    """LRU cache of per-test outcomes with in-flight deduplication"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Outcomes]" = OrderedDict()
+        self._in_flight: Dict[bytes, asyncio.Future] = {}
+        self.stats_counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def key(self, code: str, exercise: bytes) -> bytes:
+        digest = hashlib.sha256(exercise)
+        digest.update(b"\0")
+        digest.update(normalize_code(code).encode("utf-8", "surrogatepass"))
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[Outcomes]:
+        outcomes = self._entries.get(key)
+        if outcomes is not None:
+            self._entries.move_to_end(key)
+        return outcomes
+
+    def set(self, key: bytes, outcomes: Outcomes):
+        self._entries[key] = outcomes
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats_counters["evictions"] += 1
+
+    async def get_or_grade(self, key: bytes, grade: Callable[[], Awaitable[Outcomes]]) -> Outcomes:
+        """Cached outcomes, the outcome of an identical submission already in progress, or grade() now"""
+        outcomes = self.get(key)
+        if outcomes is not None:
+            self.stats_counters["hits"] += 1
+            return outcomes
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.stats_counters["coalesced"] += 1
+            # shield: one waiter disconnecting must not cancel the grading the others wait on
+            return await asyncio.shield(pending)
+
+        self.stats_counters["misses"] += 1
+
+        async def grade_and_store() -> Outcomes:
+            outcomes = await grade()
+            if cacheable(outcomes):
+                self.set(key, outcomes)
+            return outcomes
+
+        # Runs to completion (and fills the cache) even if every caller waiting on it goes away
+        future = asyncio.ensure_future(grade_and_store())
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.stats_counters["hits"] + self.stats_counters["coalesced"] + self.stats_counters["misses"]
+        served = self.stats_counters["hits"] + self.stats_counters["coalesced"]
+        return {
+            **self.stats_counters,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hit_rate": served / lookups if lookups else 0.0
+        }
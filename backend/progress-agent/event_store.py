@@ -0,0 +1,254 @@
+"""
+Event-sourced storage for per-user state, on SQLite in WAL mode.
+
+Every change is an event appended to the events table. The current state of each user is kept
+in memory, so reads never touch the database. Writes go through one writer task that commits
+whatever has queued up while the previous commit was being fsynced, so under load many events
+share one transaction and one fsync (group commit) instead of paying for one each. Events are
+applied to the in-memory state only once their batch has committed, in sequence order, and
+append() returns after that: readers never see an event that isn't on disk, and an event whose
+commit failed leaves no trace. Before anything is queued, append() round-trips the event through
+JSON, so it is applied live exactly as replay will see it, and runs the optional check on it
+against the user's current state; an event that fails either is refused with InvalidEventError
+instead of being logged and then failing to apply, now and on every replay.
+
+Every checkpoint_interval seconds, after flushing any pending events, the states of users
+changed since the last checkpoint are written to the snapshots table together with the sequence
+number they include. Recovery loads the snapshots and replays only the events after that
+sequence number, so restart time depends on the checkpoint interval rather than on the length
+of the history. The event log itself is kept in full.
+
+A single process owns the database file; replicas need their own files or a shared database
+server.
+"""
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_user_id ON events (user_id, seq);
+CREATE TABLE IF NOT EXISTS snapshots (
+    user_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_seq INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# (current state or None, event) -> new state, or None to remove the user
+Reducer = Callable[[Optional[Any], Dict[str, Any]], Optional[Any]]
+# (current state or None, event) -> None, raising if the event can't be applied; must not change the state
+Check = Callable[[Optional[Any], Dict[str, Any]], None]
+
+
+class InvalidEventError(ValueError):
+    """Raised by append() for an event that can't be logged or applied; nothing is recorded"""
+
+
+class EventStore:
+    def __init__(self, path: str, apply: Reducer, dump: Callable[[Any], str], load: Callable[[str], Any],
+                 checkpoint_interval: float = 30.0, max_batch: int = 1000, check: Optional[Check] = None):
+        self.path = path
+        self.apply = apply
+        self.check = check
+        self.dump = dump
+        self.load = load
+        self.checkpoint_interval = checkpoint_interval
+        self.max_batch = max_batch
+
+        # Used only by the writer (under _write_lock) once started, from worker threads
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # FULL: every commit is fsynced; group commit is what keeps that affordable
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+
+        self.states: Dict[str, Any] = {}
+        # Last sequence number handed out, and last one committed and applied to states
+        self._seq = 0
+        self._committed_seq = 0
+        self._checkpointed_seq = 0
+        self._dirty: Set[str] = set()
+        self._pending: List[Tuple[int, str, Dict[str, Any], str, float, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats_counters = {"appended": 0, "commits": 0, "checkpoints": 0, "replayed": 0}
+
+    def recover(self):
+        """Load the last checkpoint and replay the events recorded after it"""
+        started = time.monotonic()
+        row = self._db.execute("SELECT last_seq FROM checkpoint WHERE id = 1").fetchone()
+        self._checkpointed_seq = row[0] if row else 0
+        for user_id, state in self._db.execute("SELECT user_id, state FROM snapshots"):
+            self.states[user_id] = self.load(state)
+
+        replayed = 0
+        self._seq = self._checkpointed_seq
+        cursor = self._db.execute("SELECT seq, user_id, event FROM events WHERE seq > ? ORDER BY seq",
+                                  (self._checkpointed_seq,))
+        for seq, user_id, event in cursor:
+            self._apply(seq, user_id, json.loads(event))
+            self._seq = seq
+            replayed += 1
+        self._committed_seq = self._seq
+        self.stats_counters["replayed"] = replayed
+        logger.info(f"Recovered {len(self.states)} users from checkpoint at event {self._checkpointed_seq} "
+                    f"and replayed {replayed} events in {time.monotonic() - started:.3f}s")
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._checkpointer())]
+
+    def _apply(self, seq: int, user_id: str, event: Dict[str, Any]):
+        """
+        Apply a committed event. append() has checked it already; should it still fail (against a
+        state that changed since), live and replay both skip it, so they stay the same.
+        """
+        try:
+            state = self.apply(self.states.get(user_id), event)
+        except Exception as e:
+            logger.error(f"Could not apply event {seq} for {user_id}: {e}")
+            return
+        if state is None:
+            self.states.pop(user_id, None)
+        else:
+            self.states[user_id] = state
+        self._dirty.add(user_id)
+
+    async def append(self, user_id: str, event: Dict[str, Any]) -> int:
+        """
+        Return the event's sequence number once it is on disk and applied to the user's state.
+        Raises InvalidEventError, recording nothing, for an event that isn't JSON or fails the check.
+        """
+        try:
+            record = json.dumps(event)
+            event = json.loads(record)
+            if self.check is not None:
+                self.check(self.states.get(user_id), event)
+        except Exception as e:
+            raise InvalidEventError(str(e) or type(e).__name__) from e
+        self._seq += 1
+        seq = self._seq
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((seq, user_id, event, record, time.time(), future))
+        self._wakeup.set()
+        self.stats_counters["appended"] += 1
+        await future
+        return seq
+
+    def _take_pending(self, limit: Optional[int] = None) -> List[Tuple[int, str, Dict[str, Any], str, float, asyncio.Future]]:
+        batch = self._pending[:limit] if limit else self._pending
+        self._pending = self._pending[len(batch):]
+        return batch
+
+    def _commit_events(self, rows: List[Tuple[int, str, str, float]]):
+        """One transaction, and so one fsync, for a batch of events"""
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT INTO events (seq, user_id, event, recorded_at) VALUES (?, ?, ?, ?)", rows)
+
+    def _commit_checkpoint(self, snapshots: List[Tuple[str, Optional[str]]], checkpoint_seq: int):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT OR REPLACE INTO snapshots (user_id, state) VALUES (?, ?)",
+                                 [(user_id, state) for user_id, state in snapshots if state is not None])
+            self._db.executemany("DELETE FROM snapshots WHERE user_id = ?",
+                                 [(user_id,) for user_id, state in snapshots if state is None])
+            self._db.execute("INSERT OR REPLACE INTO checkpoint (id, last_seq, created_at) VALUES (1, ?, ?)",
+                             (checkpoint_seq, time.time()))
+
+    async def _flush(self, batch):
+        """Commit a batch of pending events, then apply them in order and release their callers"""
+        rows = [(seq, user_id, record, recorded_at) for seq, user_id, _, record, recorded_at, _ in batch]
+        try:
+            await asyncio.to_thread(self._commit_events, rows)
+        except Exception as e:
+            logger.error(f"Event store commit failed: {e}")
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        self.stats_counters["commits"] += 1
+        for seq, user_id, event, _, _, future in batch:
+            self._apply(seq, user_id, event)
+            self._committed_seq = seq
+            if not future.done():
+                future.set_result(None)
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                async with self._write_lock:
+                    batch = self._take_pending(self.max_batch)
+                    if batch:
+                        try:
+                            await self._flush(batch)
+                        except Exception:
+                            # Nothing was applied; the callers got the error
+                            pass
+
+    async def checkpoint(self):
+        """Flush pending events, then write the changed users' states and the sequence number they cover"""
+        async with self._write_lock:
+            if self._pending:
+                await self._flush(self._take_pending())
+            if not self._dirty:
+                return
+            # No await between here and the snapshot dump, so the states are exactly those at _committed_seq
+            dirty, self._dirty = self._dirty, set()
+            snapshots = [(user_id, self.dump(self.states[user_id]) if user_id in self.states else None)
+                         for user_id in dirty]
+            seq = self._committed_seq
+            try:
+                await asyncio.to_thread(self._commit_checkpoint, snapshots, seq)
+            except Exception:
+                self._dirty |= dirty
+                raise
+            self._checkpointed_seq = seq
+            self.stats_counters["checkpoints"] += 1
+
+    async def _checkpointer(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.error(f"Checkpoint failed: {e}")
+
+    async def close(self):
+        # Under the lock, so no commit is left running in a worker thread
+        async with self._write_lock:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        # A final checkpoint makes the next startup replay nothing
+        await self.checkpoint()
+        self._db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_counters,
+            "users": len(self.states),
+            "last_seq": self._committed_seq,
+            "checkpointed_seq": self._checkpointed_seq,
+            "events_since_checkpoint": self._committed_seq - self._checkpointed_seq,
+            "pending": len(self._pending)
+        }
@@ -1,12 +1,14 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 import logging
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import datetime
 import uuid
 from enum import Enum
 
+from event_store import EventStore, InvalidEventError
+
 # Initialize FastAPI app
 app = FastAPI(title="Progress Agent", description="Tracks student mastery and progress", version="1.0.0")
 
@@ -39,10 +41,19 @@ class ProgressEvent(BaseModel):
     user_id: str
     topic: Topic
     event_type: str  # exercise_completed, quiz_taken, code_submitted, concept_learned
-    score: float = None  # 0.0 to 1.0
-    timestamp: datetime.datetime = datetime.datetime.now()
+    score: Optional[float] = Field(None, ge=0.0, le=1.0)  # 0.0 to 1.0; NaN is rejected too
+    # Stamped per event: streaks and replay depend on it
+    timestamp: datetime.datetime = Field(default_factory=datetime.datetime.now)
     metadata: Dict[str, Any] = {}
 
+    @field_validator("timestamp")
+    @classmethod
+    def local_naive_timestamp(cls, value: datetime.datetime) -> datetime.datetime:
+        """Progress keeps naive local times; "...Z" or "+02:00" timestamps are converted to one"""
+        if value.tzinfo is not None:
+            return value.astimezone().replace(tzinfo=None)
+        return value
+
 class ProgressUpdate(BaseModel):
     user_id: str
     topic: Topic
@@ -67,9 +78,6 @@ class ProgressResponse(BaseModel):
     message: str
     progress: StudentProgress
 
-# In-memory storage for progress data (would be replaced by database in production)
-student_progress_db: Dict[str, StudentProgress] = {}
-
 def calculate_mastery_score(progress: ProgressUpdate) -> float:
     """
     Calculate overall mastery based on the formula:
@@ -108,7 +116,7 @@ def get_mastery_level(score: float) -> MasteryLevel:
     else:
         return MasteryLevel.BEGINNER_LEVEL  # Default fallback
 
-def initialize_student_progress(user_id: str) -> StudentProgress:
+def initialize_student_progress(user_id: str, last_active: Optional[datetime.datetime] = None) -> StudentProgress:
     """Initialize progress data for a new student"""
     return StudentProgress(
         user_id=user_id,
@@ -127,7 +135,7 @@ def initialize_student_progress(user_id: str) -> StudentProgress:
         quizzes_taken=0,
         code_quality_average=0.0,
         consistency_streak=0,
-        last_active=datetime.datetime.now(),
+        last_active=last_active or datetime.datetime.now(),
         mastery_levels={
             Topic.VARIABLES: MasteryLevel.BEGINNER_LEVEL,
             Topic.LOOPS: MasteryLevel.BEGINNER_LEVEL,
@@ -145,16 +153,21 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "progress-agent"}
 
-@app.post("/event")
-async def record_progress_event(event: ProgressEvent):
-    """Record a progress event and update student's progress"""
-    logger.info(f"Recording event for user {event.user_id}: {event.event_type}")
+RESET_EVENT = "reset"
 
-    # Get or initialize student progress
-    if event.user_id not in student_progress_db:
-        student_progress_db[event.user_id] = initialize_student_progress(event.user_id)
+def apply_progress_event(progress: Optional[StudentProgress], record: Dict[str, Any]) -> Optional[StudentProgress]:
+    """
+    Apply one logged event to a student's progress and return the new progress (None once reset).
+    Used both for live events and for replay after a restart, so it must depend only on the record.
+    """
+    if record["event_type"] == RESET_EVENT:
+        if progress is not None:
+            return None
+        return initialize_student_progress(record["user_id"], datetime.datetime.fromisoformat(record["timestamp"]))
 
-    progress = student_progress_db[event.user_id]
+    event = ProgressEvent(**record)
+    if progress is None:
+        progress = initialize_student_progress(event.user_id, event.timestamp)
 
     # Update progress based on event type
     if event.event_type == "exercise_completed":
@@ -186,6 +199,15 @@ async def record_progress_event(event: ProgressEvent):
         if progress.consistency_streak > 0:
             progress.consistency_streak = max(0, progress.consistency_streak - 1)
 
+    # Update consistency streak from the gap since the previous activity
+    time_since_last_active = event.timestamp - progress.last_active
+    if time_since_last_active.days > 1:
+        # Reset streak if inactive for more than a day
+        progress.consistency_streak = 0
+    elif time_since_last_active.days == 1:
+        # Increment streak if active yesterday
+        progress.consistency_streak += 1
+
     # Update last active timestamp
     progress.last_active = event.timestamp
 
@@ -206,31 +228,65 @@ async def record_progress_event(event: ProgressEvent):
     for topic in Topic:
         progress.mastery_levels[topic] = get_mastery_level(progress.topic_mastery[topic])
 
-    # Update overall mastery level based on overall mastery score
-    overall_mastery_level = get_mastery_level(progress.overall_mastery)
-    # Store in the first topic as a general indicator (in a real system, we'd have a separate field)
+    return progress
+
+def check_progress_event(progress: Optional[StudentProgress], record: Dict[str, Any]):
+    """Apply the event to a copy of the progress, so one that would fail is refused before it is logged"""
+    apply_progress_event(progress.model_copy(deep=True) if progress is not None else None, record)
+
+# Every change to a student's progress is an event in a durable log; the current progress of
+# each student is materialized in memory from it and checkpointed periodically (see event_store)
+PROGRESS_DB = os.getenv("PROGRESS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "progress_events.db"))
+
+progress_store = EventStore(
+    PROGRESS_DB,
+    apply_progress_event,
+    dump=lambda progress: progress.model_dump_json(),
+    load=StudentProgress.model_validate_json,
+    checkpoint_interval=float(os.getenv("PROGRESS_CHECKPOINT_INTERVAL", 30.0)),
+    max_batch=int(os.getenv("PROGRESS_MAX_COMMIT_BATCH", 1000)),
+    check=check_progress_event
+)
+# Materialized progress per student, filled by progress_store.recover() at startup
+student_progress_db: Dict[str, StudentProgress] = progress_store.states
+
+@app.on_event("startup")
+async def startup():
+    progress_store.recover()
+    await progress_store.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await progress_store.close()
 
-    return {"message": f"Event recorded successfully for user {event.user_id}", "event_id": str(uuid.uuid4())}
+@app.post("/event")
+async def record_progress_event(event: ProgressEvent):
+    """Record a progress event and update student's progress"""
+    logger.info(f"Recording event for user {event.user_id}: {event.event_type}")
+
+    event_id = str(uuid.uuid4())
+    # Returns once the event is durable; the student's progress is already updated by then
+    try:
+        await progress_store.append(event.user_id, {**event.model_dump(mode="json"), "event_id": event_id})
+    except InvalidEventError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid progress event: {e}")
+
+    return {"message": f"Event recorded successfully for user {event.user_id}", "event_id": event_id}
 
 @app.get("/progress/{user_id}", response_model=StudentProgress)
 async def get_student_progress(user_id: str):
     """Get progress information for a specific student"""
     logger.info(f"Retrieving progress for user {user_id}")
 
-    if user_id not in student_progress_db:
-        # Initialize if not exists
-        student_progress_db[user_id] = initialize_student_progress(user_id)
+    progress = student_progress_db.get(user_id)
+    if progress is None:
+        # Default values until the student's first event
+        return initialize_student_progress(user_id)
 
-    progress = student_progress_db[user_id]
-
-    # Update consistency streak if it's been more than a day since last activity
-    time_since_last_active = datetime.datetime.now() - progress.last_active
-    if time_since_last_active.days > 1:
-        # Reset streak if inactive for more than a day
-        progress.consistency_streak = 0
-    elif time_since_last_active.days == 1:
-        # Increment streak if active yesterday
-        progress.consistency_streak += 1
+    # Reads don't change the stored progress (only logged events do), but a streak is already
+    # broken once the student has been inactive for more than a day
+    if (datetime.datetime.now() - progress.last_active).days > 1:
+        return progress.model_copy(update={"consistency_streak": 0})
 
     return progress
 
@@ -239,10 +295,7 @@ async def get_topic_mastery(user_id: str, topic: Topic):
     """Get mastery information for a specific topic"""
     logger.info(f"Retrieving {topic} mastery for user {user_id}")
 
-    if user_id not in student_progress_db:
-        student_progress_db[user_id] = initialize_student_progress(user_id)
-
-    progress = student_progress_db[user_id]
+    progress = student_progress_db.get(user_id) or initialize_student_progress(user_id)
 
     mastery_percentage = progress.topic_mastery[topic]
     mastery_level = progress.mastery_levels[topic]
@@ -325,14 +378,23 @@ async def get_leaderboard():
 @app.post("/reset/{user_id}")
 async def reset_student_progress(user_id: str):
     """Reset a student's progress (for testing purposes)"""
-    if user_id in student_progress_db:
-        del student_progress_db[user_id]
+    existed = user_id in student_progress_db
+    await progress_store.append(user_id, {
+        "event_type": RESET_EVENT,
+        "user_id": user_id,
+        "timestamp": datetime.datetime.now().isoformat(),
+        "event_id": str(uuid.uuid4())
+    })
+    if existed:
         return {"message": f"Progress for user {user_id} has been reset"}
     else:
-        # Initialize with default values
-        student_progress_db[user_id] = initialize_student_progress(user_id)
         return {"message": f"Initialized progress for user {user_id}"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Event log and checkpoint statistics"""
+    return {"event_store": progress_store.stats()}
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8003))
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark: compiled KeywordRouter vs the original substring keyword scans.
+
+The legacy scans cost grows with the number of keywords; the compiled trie regex
+stays roughly flat, and also reports per-agent scores.
+
+Run from this directory:  python bench_router.py [iterations]
+"""
+import json
+import sys
+import time
+
+from router import KeywordRouter, DEFAULT_CONFIG_PATH
+
+# Chat messages of the kind students send to /triage
+CORPUS = [
+    "explain python loops",
+    "what is a list in python",
+    "how does a for loop work",
+    "difference between list and tuple",
+    "give me a practice problem on functions",
+    "can I get a quiz about dictionaries",
+    "how am i doing",
+    "show my progress stats",
+    "what are decorators in python",
+    "tell me about classes and objects",
+    "what is the capital of france",
+    "how do I bake bread",
+    "what is the difference between these two information sources",
+    "give me some information about the weather",
+    "explain recursion with an example function",
+    "I keep getting an IndentationError in my while loop",
+    "what does elif mean",
+    "why is my variable undefined inside the function",
+    "write me a poem about autumn",
+    "explain the concept of inheritance for classes",
+    "challenge me with a string exercise",
+    "track my mastery of loops",
+    "what have I learned so far",
+    "how does import work for modules",
+    "what is a lambda",
+    "difference between == and is",
+    "test my knowledge of booleans",
+    "what is photosynthesis",
+    "platform differences for installing python",
+    "tell me a joke",
+]
+
+
+def make_legacy_router(config: dict):
+    """The original any(keyword in query_lower ...) scans, driven by the same config for comparison"""
+    python_keywords = config["python_keywords"]
+    intents = config["intents"]
+
+    def legacy_determine_agent(query: str) -> str:
+        query_lower = query.lower()
+        is_python_related = any(keyword in query_lower for keyword in python_keywords)
+        if is_python_related and any(word in query_lower for word in intents["concepts"]):
+            return 'concepts'
+        elif is_python_related and any(word in query_lower for word in intents["exercise"]):
+            return 'exercise'
+        elif any(word in query_lower for word in intents["progress"]):
+            return 'progress'
+        elif is_python_related and any(word in query_lower for word in intents["general"]):
+            return 'concepts'
+        return 'groq'
+
+    return legacy_determine_agent
+
+
+def inflate(config: dict, extra: int) -> dict:
+    """Copy of the config with `extra` synthetic Python keywords, to show how each approach scales"""
+    inflated = json.loads(json.dumps(config))
+    inflated["python_keywords"] += [f"kw{i}zz" for i in range(extra)]
+    return inflated
+
+
+def bench(label: str, fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for query in CORPUS:
+            fn(query)
+    elapsed = time.perf_counter() - start
+    per_second = iterations * len(CORPUS) / elapsed
+    print(f"{label:<10} {per_second:>12,.0f} queries/s  {elapsed / (iterations * len(CORPUS)) * 1e6:6.2f} us/query")
+    return per_second
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(DEFAULT_CONFIG_PATH) as f:
+        config = json.load(f)
+
+    print(f"{len(CORPUS)} queries x {iterations} iterations")
+    for extra in (0, 500):
+        cfg = inflate(config, extra)
+        print(f"\n{len(cfg['python_keywords'])} python keywords:")
+        bench("legacy", make_legacy_router(cfg), iterations)
+        bench("compiled", KeywordRouter(cfg).classify, iterations)
+
+    legacy = make_legacy_router(config)
+    router = KeywordRouter(config)
+    print("\nRouting differences (legacy -> compiled):")
+    for query in CORPUS:
+        old_agent = legacy(query)
+        decision = router.classify(query)
+        if old_agent != decision.agent:
+            print(f"  {query!r}: {old_agent} -> {decision.agent} (confidence {decision.confidence})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import logging
+import time
 import httpx
-from typing import Dict, Any, Optional
-from groq import Groq
+from typing import Dict, Any, Optional, List, AsyncIterator
+from groq import AsyncGroq
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from router import KeywordRouter, DEFAULT_CONFIG_PATH
+from resilience import Upstream, CircuitBreaker, CircuitOpenError
+from registry import ServiceRegistry, NoReplicaError
 
 app = FastAPI(title="Triage Agent", version="1.0.0")
 logging.basicConfig(level=logging.INFO)
@@ -24,7 +34,62 @@ if not GROQ_API_KEY:
 if not GROQ_API_KEY:
     logger.warning("GROQ_API_KEY environment variable not set")
 
-groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+groq_client = AsyncGroq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+
+# Upper bound on concurrent Groq calls; further requests wait on the semaphore
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", 16))
+groq_semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+groq_stats = {"in_flight": 0, "queued": 0, "max_queued": 0, "completed": 0, "failed": 0, "queue_wait_seconds": 0.0}
+
+@asynccontextmanager
+async def groq_slot():
+    """Hold one of the GROQ_MAX_CONCURRENCY slots, recording queue depth and outcome"""
+    groq_stats["queued"] += 1
+    groq_stats["max_queued"] = max(groq_stats["max_queued"], groq_stats["queued"])
+    wait_start = time.perf_counter()
+    try:
+        await groq_semaphore.acquire()
+    finally:
+        groq_stats["queued"] -= 1
+        groq_stats["queue_wait_seconds"] += time.perf_counter() - wait_start
+
+    groq_stats["in_flight"] += 1
+    try:
+        yield
+        groq_stats["completed"] += 1
+    except Exception:
+        groq_stats["failed"] += 1
+        raise
+    finally:
+        groq_stats["in_flight"] -= 1
+        groq_semaphore.release()
+
+async def create_chat_completion(**kwargs):
+    """Run a Groq chat completion without blocking the event loop, under the concurrency limit"""
+    async with groq_slot():
+        return await groq_client.chat.completions.create(**kwargs)
+
+async def stream_chat_completion(**kwargs) -> AsyncIterator[str]:
+    """Stream a Groq chat completion token by token, holding a slot until the stream ends"""
+    async with groq_slot():
+        stream = await groq_client.chat.completions.create(stream=True, **kwargs)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+# Cache of general-question answers; bump PROMPT_VERSION whenever the system prompt changes
+GROQ_MODEL = "llama-3.1-8b-instant"
+PROMPT_VERSION = "1"
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024)),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL", 24 * 3600)),
+    db_path=os.getenv("LLM_CACHE_DB") or None,
+    near_duplicate_threshold=float(os.getenv("LLM_CACHE_NEAR_DUPLICATE", 0.0))
+)
+
+# Identical questions asked at the same time share one Groq call
+groq_inflight = SingleFlight()
 
 class TriageRequest(BaseModel):
     query: str
@@ -35,86 +100,224 @@ class TriageResponse(BaseModel):
     agent: str
     response: Any
     route_reason: str
+    confidence: Optional[float] = None
 
-# Service endpoints mapping
-SERVICE_ENDPOINTS = {
-    'concepts': 'http://localhost:8000/explain',
-    'code-review': 'http://localhost:8001/review',  # Will be implemented later
-    'debug': 'http://localhost:8000/debug',  # Will be implemented later
-    'exercise': 'http://localhost:8002/generate',
-    'progress': 'http://localhost:8003/progress'
-}
-
-def determine_agent(query: str) -> tuple[str, str]:
-    """Determine which agent should handle the query"""
-    query_lower = query.lower()
+class RouteResponse(BaseModel):
+    agent: str
+    route_reason: str
+    scores: Dict[str, float]
+    confidence: float
 
-    # Check if query is related to Python programming
-    python_keywords = ['python', 'code', 'programming', 'function', 'loop', 'variable', 'list', 'dict', 'dictionary',
-                       'class', 'method', 'module', 'import', 'string', 'integer', 'float', 'boolean', 'if', 'else',
-                       'elif', 'for', 'while', 'def', 'class', 'object', 'method', 'attribute', 'parameter', 'argument']
+class BatchTriageRequest(BaseModel):
+    queries: List[TriageRequest]
 
-    is_python_related = any(keyword in query_lower for keyword in python_keywords)
+class BatchTriageItem(BaseModel):
+    index: int
+    agent: str
+    response: Any = None
+    route_reason: str
+    confidence: float
+    error: Optional[str] = None
+
+class BatchTriageResponse(BaseModel):
+    results: List[BatchTriageItem]
+    routed: Dict[str, int]
+
+# Batch limits: maximum queries per call and concurrent downstream calls per target agent
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 1000))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 16))
+
+# Service registry: endpoints and replicas per agent from SERVICE_REGISTRY_FILE / <AGENT>_AGENT_URLS
+service_registry = ServiceRegistry.from_env()
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 5.0))
+health_check_task: Optional[asyncio.Task] = None
+
+# Shared HTTP client for downstream agents. It is created once per process at startup
+# so routed queries reuse pooled keep-alive connections instead of opening a new socket each time.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30.0))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2.0))
+
+# HTTP/2 needs the optional `h2` package (pip install httpx[http2]) and only applies to https upstreams
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+except ImportError:
+    HTTP2_ENABLED = False
+
+def upstream_from_env(name: str, prefix: str) -> Upstream:
+    """Circuit breaker, timeout ceiling (seconds) and hedging settings for one downstream agent"""
+    return Upstream(
+        name,
+        max_timeout=float(os.getenv(f"{prefix}_TIMEOUT", 30.0)),
+        min_timeout=float(os.getenv("UPSTREAM_MIN_TIMEOUT", 1.0)),
+        hedge=os.getenv(f"{prefix}_HEDGE", "false").lower() == "true",
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5)),
+            reset_timeout=float(os.getenv("BREAKER_RESET_TIMEOUT", 10.0))
+        ),
+        # An empty registry is a configuration problem, not the agent failing
+        ignored_errors=(NoReplicaError,)
+    )
+
+UPSTREAMS = {
+    'concepts': upstream_from_env('concepts', 'CONCEPTS'),
+    'exercise': upstream_from_env('exercise', 'EXERCISE'),
+}
 
-    # Concept explanation requests (only if Python-related)
-    if is_python_related and any(word in query_lower for word in ['what is', 'explain', 'how does', 'concept', 'difference between', 'loops', 'functions', 'variables', 'lists', 'conditionals']):
-        return 'concepts', 'Query is asking for Python concept explanation'
+http_client: Optional[httpx.AsyncClient] = None
+
+@app.on_event("startup")
+async def startup():
+    """Create the pooled HTTP client used for all downstream calls and start replica health checks"""
+    global http_client, health_check_task
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(30.0, connect=HTTP_CONNECT_TIMEOUT),
+        http2=HTTP2_ENABLED
+    )
+    logger.info(f"HTTP client ready (max_connections={HTTP_MAX_CONNECTIONS}, http2={HTTP2_ENABLED})")
+    health_check_task = asyncio.create_task(service_registry.run_health_checks(http_client, HEALTH_CHECK_INTERVAL))
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop health checks and close pooled connections on shutdown"""
+    if health_check_task:
+        health_check_task.cancel()
+    if http_client:
+        await http_client.aclose()
+
+# Keyword router compiled once at import from ROUTING_CONFIG (defaults to routing.json)
+router = KeywordRouter.from_file(os.getenv("ROUTING_CONFIG", DEFAULT_CONFIG_PATH))
 
-    # Exercise/quiz requests (only if Python-related)
-    elif is_python_related and any(word in query_lower for word in ['practice', 'exercise', 'quiz', 'test', 'problem', 'challenge', 'give me']):
-        return 'exercise', 'Query is requesting Python practice problems'
+def determine_agent(query: str) -> tuple[str, str]:
+    """Determine which agent should handle the query"""
+    decision = router.classify(query)
+    return decision.agent, decision.reason
 
-    # Progress tracking
-    elif any(word in query_lower for word in ['progress', 'how am i doing', 'stats', 'track', 'mastery', 'learned']):
-        return 'progress', 'Query is about progress tracking'
 
-    # General Python questions
-    elif is_python_related and any(word in query_lower for word in ['what is', 'explain', 'how does', 'what are', 'tell me about']):
-        return 'concepts', 'General Python question routed to concepts agent'
+def groq_fallback(query: str, error: str) -> Dict[str, Any]:
+    return {
+        "message": f"Sorry, I'm having trouble processing your request right now. Could you try rephrasing your question? Original query: {query}",
+        "source": "fallback",
+        "error": error
+    }
 
-    # Default to groq for non-Python related questions
-    else:
-        return 'groq', 'Using Groq for general questions and non-Python topics'
+def build_groq_messages(query: str) -> List[Dict[str, str]]:
+    system_prompt = """You are an expert Python programming tutor. Provide helpful, accurate, and educational responses to students learning Python.
+    If the question is about Python programming, give detailed explanations with code examples.
+    If the question is general, provide the best possible answer."""
 
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query}
+    ]
 
-def get_groq_response(query: str) -> Dict[str, Any]:
+async def get_groq_response(query: str) -> Dict[str, Any]:
     """Get response from Groq for general questions"""
     try:
         # Check if groq_client is initialized
         if not groq_client:
             logger.error("Groq client not initialized - API key missing")
-            return {
-                "message": f"Sorry, I'm having trouble processing your request right now. Could you try rephrasing your question? Original query: {query}",
-                "source": "fallback",
-                "error": "Groq API key not configured"
-            }
+            return groq_fallback(query, "Groq API key not configured")
 
-        system_prompt = """You are an expert Python programming tutor. Provide helpful, accurate, and educational responses to students learning Python.
-        If the question is about Python programming, give detailed explanations with code examples.
-        If the question is general, provide the best possible answer."""
-
-        response = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            model="llama-3.1-8b-instant",  # Updated to current supported model
-            temperature=0.7,
-            max_tokens=1000
-        )
+        cached = response_cache.get(query, GROQ_MODEL, prompt_version=PROMPT_VERSION)
+        if cached is not None:
+            return cached
 
-        return {
-            "message": response.choices[0].message.content,
-            "source": "groq",
-            "model": "llama-3.1-8b-instant"  # Updated to current supported model
-        }
+        # Keyed on the exact prompt sent upstream, so only identical requests share a call
+        messages = build_groq_messages(query)
+        flight_key = f"{GROQ_MODEL}|{json.dumps(messages)}"
+        return await groq_inflight.do(flight_key, lambda: fetch_groq_response(query, messages))
     except Exception as e:
         logger.error(f"Error calling Groq API: {e}")
-        return {
-            "message": f"Sorry, I'm having trouble processing your request right now. Could you try rephrasing your question? Original query: {query}",
-            "source": "fallback",
-            "error": str(e)
-        }
+        return groq_fallback(query, str(e))
+
+async def fetch_groq_response(query: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Call Groq for a general question and cache the answer"""
+    response = await create_chat_completion(
+        messages=messages,
+        model=GROQ_MODEL,
+        temperature=0.7,
+        max_tokens=1000
+    )
+
+    result = {
+        "message": response.choices[0].message.content,
+        "source": "groq",
+        "model": GROQ_MODEL
+    }
+    response_cache.set(query, GROQ_MODEL, result, prompt_version=PROMPT_VERSION)
+    return result
+
+async def forward_to_agent(agent: str, payload: Dict[str, Any], reason: str) -> TriageResponse:
+    """POST a payload to a downstream agent over the shared HTTP client, through its circuit breaker"""
+    upstream = UPSTREAMS[agent]
+
+    async def post(timeout: float) -> httpx.Response:
+        # Each attempt (including a hedge) picks its own replica
+        with service_registry.acquire(agent) as service_url:
+            response = await http_client.post(
+                service_url, json=payload, timeout=httpx.Timeout(timeout, connect=min(HTTP_CONNECT_TIMEOUT, timeout))
+            )
+        # Only 5xx responses count against the breaker; 4xx are raised below
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    try:
+        response = await upstream.call(post)
+        response.raise_for_status()
+        result = response.json()
+
+        return TriageResponse(
+            agent=agent,
+            response=result,
+            route_reason=reason
+        )
+    except CircuitOpenError:
+        logger.warning(f"Circuit open for {agent} agent, failing fast")
+        return TriageResponse(
+            agent=agent,
+            response={
+                "error": f"{agent.capitalize()} agent is temporarily unavailable, please try again shortly",
+                "retry_after": round(upstream.breaker.retry_after(), 1)
+            },
+            route_reason=reason
+        )
+    except NoReplicaError as exc:
+        logger.error(str(exc))
+        return TriageResponse(
+            agent=agent,
+            response={"error": str(exc)},
+            route_reason=reason
+        )
+    except asyncio.TimeoutError:
+        logger.error(f"Timed out waiting for {agent} agent after {upstream.timeout():.1f}s")
+        return TriageResponse(
+            agent=agent,
+            response={"error": f"Timed out waiting for {agent} agent"},
+            route_reason=reason
+        )
+    except httpx.RequestError as exc:
+        logger.error(f"Error contacting {agent} agent: {exc}")
+        return TriageResponse(
+            agent=agent,
+            response={"error": f"Could not contact {agent} agent: {str(exc)}"},
+            route_reason=reason
+        )
+    except httpx.HTTPStatusError as exc:
+        logger.error(f"HTTP error from {agent} agent: {exc}")
+        return TriageResponse(
+            agent=agent,
+            response={"error": f"{agent.capitalize()} agent returned error: {exc.response.status_code}"},
+            route_reason=reason
+        )
 
 @app.post("/triage", response_model=TriageResponse)
 async def triage_request(request: TriageRequest):
@@ -122,12 +325,119 @@ async def triage_request(request: TriageRequest):
     logger.info(f"Triage request: {request.query}")
 
     # Determine which agent to route to
-    agent, reason = determine_agent(request.query)
-    logger.info(f"Routing to agent: {agent}, reason: {reason}")
-
+    decision = router.classify(request.query)
+    logger.info(f"Routing to agent: {decision.agent}, reason: {decision.reason}, confidence: {decision.confidence}")
+
+    result = await dispatch_to_agent(request, decision.agent, decision.reason)
+    result.confidence = decision.confidence
+    return result
+
+@app.post("/triage/batch", response_model=BatchTriageResponse)
+async def triage_batch(batch: BatchTriageRequest):
+    """Route many queries in one pass and dispatch each agent's share concurrently"""
+    if len(batch.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"Batch too large: at most {BATCH_MAX_QUERIES} queries per call")
+
+    decisions = [router.classify(item.query) for item in batch.queries]
+    groups: Dict[str, List[int]] = {}
+    for index, decision in enumerate(decisions):
+        groups.setdefault(decision.agent, []).append(index)
+    logger.info(f"Triage batch of {len(decisions)} queries: " + ", ".join(f"{agent}={len(idx)}" for agent, idx in groups.items()))
+
+    results: List[Optional[BatchTriageItem]] = [None] * len(decisions)
+
+    async def dispatch_one(index: int, semaphore: asyncio.Semaphore):
+        request, decision = batch.queries[index], decisions[index]
+        item = BatchTriageItem(index=index, agent=decision.agent, route_reason=decision.reason, confidence=decision.confidence)
+        try:
+            async with semaphore:
+                result = await dispatch_to_agent(request, decision.agent, decision.reason)
+            item.response = result.response
+            if isinstance(result.response, dict) and result.response.get("error"):
+                item.error = str(result.response["error"])
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {e}")
+            item.error = str(e)
+        results[index] = item
+
+    # One semaphore per target agent so a slow agent cannot use up another agent's share
+    tasks = []
+    for indexes in groups.values():
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        tasks.extend(dispatch_one(index, semaphore) for index in indexes)
+    await asyncio.gather(*tasks)
+
+    return BatchTriageResponse(
+        results=results,
+        routed={agent: len(indexes) for agent, indexes in groups.items()}
+    )
+
+@app.post("/route", response_model=RouteResponse)
+async def route_query(request: TriageRequest):
+    """Classify a query without dispatching it"""
+    decision = router.classify(request.query)
+    return RouteResponse(
+        agent=decision.agent,
+        route_reason=decision.reason,
+        scores=decision.scores,
+        confidence=decision.confidence
+    )
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_triage(request: TriageRequest) -> AsyncIterator[str]:
+    """Yield SSE events: the routing decision first, Groq tokens as they arrive, then the full response"""
+    decision = router.classify(request.query)
+    agent, reason = decision.agent, decision.reason
+    logger.info(f"Streaming to agent: {agent}, reason: {reason}")
+    yield sse_event("route", {"agent": agent, "route_reason": reason, "confidence": decision.confidence})
+
+    if agent != 'groq' or not groq_client:
+        result = await dispatch_to_agent(request, agent, reason)
+        yield sse_event("done", result.model_dump())
+        return
+
+    groq_result = response_cache.get(request.query, GROQ_MODEL, prompt_version=PROMPT_VERSION)
+    if groq_result is None:
+        chunks = []
+        try:
+            async for token in stream_chat_completion(
+                messages=build_groq_messages(request.query),
+                model=GROQ_MODEL,
+                temperature=0.7,
+                max_tokens=1000
+            ):
+                chunks.append(token)
+                yield sse_event("token", {"text": token})
+
+            groq_result = {
+                "message": "".join(chunks),
+                "source": "groq",
+                "model": GROQ_MODEL
+            }
+            response_cache.set(request.query, GROQ_MODEL, groq_result, prompt_version=PROMPT_VERSION)
+        except Exception as e:
+            logger.error(f"Error streaming from Groq API: {e}")
+            groq_result = groq_fallback(request.query, str(e))
+
+    yield sse_event("done", TriageResponse(agent=agent, response=groq_result, route_reason=reason).model_dump())
+
+@app.post("/triage/stream")
+async def triage_stream(request: TriageRequest):
+    """Route the request and stream the answer as Server-Sent Events"""
+    logger.info(f"Triage stream request: {request.query}")
+    return StreamingResponse(
+        stream_triage(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def dispatch_to_agent(request: TriageRequest, agent: str, reason: str) -> TriageResponse:
+    """Build the agent-specific payload and collect that agent's response"""
     # Prepare request data based on agent type
     if agent == 'concepts':
-        service_url = 'http://localhost:8000/explain'
         payload = {
             "concept": request.query,
             "difficulty_level": "beginner",
@@ -138,34 +448,9 @@ async def triage_request(request: TriageRequest):
         }
 
         # Make request to concepts agent
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(service_url, json=payload)
-                response.raise_for_status()
-                result = response.json()
-
-                return TriageResponse(
-                    agent=agent,
-                    response=result,
-                    route_reason=reason
-                )
-            except httpx.RequestError as exc:
-                logger.error(f"Error contacting concepts agent: {exc}")
-                return TriageResponse(
-                    agent=agent,
-                    response={"error": f"Could not contact concepts agent: {str(exc)}"},
-                    route_reason=reason
-                )
-            except httpx.HTTPStatusError as exc:
-                logger.error(f"HTTP error from concepts agent: {exc}")
-                return TriageResponse(
-                    agent=agent,
-                    response={"error": f"Concepts agent returned error: {exc.response.status_code}"},
-                    route_reason=reason
-                )
+        return await forward_to_agent(agent, payload, reason)
 
     elif agent == 'exercise':
-        service_url = 'http://localhost:8002/generate'
         payload = {
             "topic": request.query,
             "difficulty": "beginner",
@@ -176,31 +461,7 @@ async def triage_request(request: TriageRequest):
         }
 
         # Make request to exercise agent
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(service_url, json=payload)
-                response.raise_for_status()
-                result = response.json()
-
-                return TriageResponse(
-                    agent=agent,
-                    response=result,
-                    route_reason=reason
-                )
-            except httpx.RequestError as exc:
-                logger.error(f"Error contacting exercise agent: {exc}")
-                return TriageResponse(
-                    agent=agent,
-                    response={"error": f"Could not contact exercise agent: {str(exc)}"},
-                    route_reason=reason
-                )
-            except httpx.HTTPStatusError as exc:
-                logger.error(f"HTTP error from exercise agent: {exc}")
-                return TriageResponse(
-                    agent=agent,
-                    response={"error": f"Exercise agent returned error: {exc.response.status_code}"},
-                    route_reason=reason
-                )
+        return await forward_to_agent(agent, payload, reason)
 
     elif agent == 'progress':
         # For progress, we'll return a mock response since we need the user ID
@@ -217,7 +478,7 @@ async def triage_request(request: TriageRequest):
 
     elif agent == 'groq':
         # Use Groq for general questions
-        groq_result = get_groq_response(request.query)
+        groq_result = await get_groq_response(request.query)
 
         return TriageResponse(
             agent=agent,
@@ -229,13 +490,28 @@ async def triage_request(request: TriageRequest):
 async def health_check():
     return {"status": "healthy", "service": "triage-agent"}
 
+@app.get("/metrics")
+async def metrics():
+    """LLM concurrency, queue-depth, cache and coalescing counters, plus upstream breaker state"""
+    return {
+        "groq": {**groq_stats, "max_concurrency": GROQ_MAX_CONCURRENCY},
+        "cache": response_cache.stats(),
+        "singleflight": groq_inflight.stats(),
+        "upstreams": {name: upstream.stats() for name, upstream in UPSTREAMS.items()},
+        "replicas": service_registry.stats()
+    }
+
 @app.get("/")
 async def root():
     return {
         "message": "Triage Agent - Routes queries to appropriate AI tutors",
         "endpoints": {
             "/triage": "POST - Route query to appropriate agent",
-            "/health": "GET - Health check"
+            "/triage/stream": "POST - Route query and stream the answer as Server-Sent Events",
+            "/triage/batch": "POST - Route and dispatch many queries in one call",
+            "/route": "POST - Classify a query without dispatching it",
+            "/health": "GET - Health check",
+            "/metrics": "GET - LLM queue, concurrency and cache metrics"
         }
     }
 
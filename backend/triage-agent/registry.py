@@ -0,0 +1,135 @@
+"""
+Service registry for downstream agents.
+
+Each agent has an endpoint path and one or more replica base URLs, loaded from a JSON
+file (SERVICE_REGISTRY_FILE) or from <AGENT>_AGENT_URLS env vars. Requests go to the
+less loaded of two randomly chosen healthy replicas (power-of-two-choices on outstanding
+requests). A background task polls each replica's /health and ejects replicas that fail
+repeatedly until they recover.
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+import asyncio
+import json
+import logging
+import os
+import random
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Default single-replica endpoints for local development
+DEFAULT_SERVICES = {
+    'concepts': {'path': '/explain', 'replicas': ['http://localhost:8000']},
+    'code-review': {'path': '/review', 'replicas': ['http://localhost:8004']},
+    'debug': {'path': '/debug', 'replicas': ['http://localhost:8005']},
+    'exercise': {'path': '/generate', 'replicas': ['http://localhost:8002']},
+    'progress': {'path': '/progress', 'replicas': ['http://localhost:8003']},
+}
+
+
+class NoReplicaError(Exception):
+    """Raised when an agent has no configured replicas"""
+
+
+class Replica:
+    __slots__ = ("base_url", "outstanding", "healthy", "failures", "successes")
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.successes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"url": self.base_url, "healthy": self.healthy, "outstanding": self.outstanding}
+
+
+class ServiceRegistry:
+    def __init__(self, services: Dict[str, Dict[str, Any]], unhealthy_threshold: int = 2, healthy_threshold: int = 1):
+        self.paths: Dict[str, str] = {}
+        self.replicas: Dict[str, List[Replica]] = {}
+        for agent, config in services.items():
+            self.paths[agent] = config['path']
+            self.replicas[agent] = [Replica(url) for url in config['replicas']]
+        self.unhealthy_threshold = unhealthy_threshold
+        self.healthy_threshold = healthy_threshold
+
+    @classmethod
+    def from_env(cls) -> "ServiceRegistry":
+        """Load from SERVICE_REGISTRY_FILE if set, then let <AGENT>_AGENT_URLS override replica lists"""
+        services = json.loads(json.dumps(DEFAULT_SERVICES))
+        registry_file = os.getenv("SERVICE_REGISTRY_FILE")
+        if registry_file:
+            with open(registry_file) as f:
+                services.update(json.load(f))
+
+        for agent, config in services.items():
+            urls = os.getenv(f"{agent.upper().replace('-', '_')}_AGENT_URLS")
+            if urls:
+                config['replicas'] = [url.strip() for url in urls.split(',') if url.strip()]
+
+        return cls(
+            services,
+            unhealthy_threshold=int(os.getenv("HEALTH_UNHEALTHY_THRESHOLD", 2)),
+            healthy_threshold=int(os.getenv("HEALTH_HEALTHY_THRESHOLD", 1))
+        )
+
+    def pick(self, agent: str) -> Replica:
+        """Power-of-two-choices over healthy replicas; falls back to all replicas if none are healthy"""
+        replicas = self.replicas.get(agent)
+        if not replicas:
+            raise NoReplicaError(f"No replicas configured for {agent} agent")
+        candidates = [r for r in replicas if r.healthy] or replicas
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if first.outstanding <= second.outstanding else second
+
+    @contextmanager
+    def acquire(self, agent: str) -> Iterator[str]:
+        """Pick a replica and yield the full endpoint URL, counting the request as outstanding"""
+        replica = self.pick(agent)
+        replica.outstanding += 1
+        try:
+            yield replica.base_url + self.paths[agent]
+        finally:
+            replica.outstanding -= 1
+
+    async def check_health(self, client: httpx.AsyncClient, timeout: float = 2.0):
+        """Probe every replica's /health once and update ejection state"""
+        replicas = [r for group in self.replicas.values() for r in group]
+        results = await asyncio.gather(
+            *(client.get(r.base_url + '/health', timeout=timeout) for r in replicas),
+            return_exceptions=True
+        )
+        for replica, result in zip(replicas, results):
+            ok = not isinstance(result, BaseException) and result.status_code == 200
+            self._record_health(replica, ok)
+
+    def _record_health(self, replica: Replica, ok: bool):
+        if ok:
+            replica.failures = 0
+            replica.successes += 1
+            if not replica.healthy and replica.successes >= self.healthy_threshold:
+                replica.healthy = True
+                logger.info(f"Replica {replica.base_url} is healthy again")
+        else:
+            replica.successes = 0
+            replica.failures += 1
+            if replica.healthy and replica.failures >= self.unhealthy_threshold:
+                replica.healthy = False
+                logger.warning(f"Ejecting replica {replica.base_url} after {replica.failures} failed health checks")
+
+    async def run_health_checks(self, client: httpx.AsyncClient, interval: float):
+        while True:
+            try:
+                await self.check_health(client)
+            except Exception as e:
+                logger.error(f"Health check round failed: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {agent: [r.stats() for r in replicas] for agent, replicas in self.replicas.items()}
@@ -0,0 +1,206 @@
+"""
+Upstream resilience for triage fan-out: circuit breakers, adaptive timeouts and hedged requests.
+
+Each downstream agent gets an Upstream that
+- fails fast with CircuitOpenError while its breaker is open,
+- derives the request timeout from recently observed latency percentiles, and
+- optionally sends a second (hedged) attempt when the first is slower than usual.
+"""
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, Type
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go through; in half-open only a limited number of probes are let in"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+        return False
+
+    def record_success(self):
+        self._consecutive_failures = 0
+        if self._state != CLOSED:
+            logger.info("Circuit closed after successful probe")
+        self._state = CLOSED
+
+    def record_cancelled(self):
+        """A call was abandoned without an outcome; free its half-open probe slot"""
+        if self._state == HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self._state != OPEN:
+                logger.warning(f"Circuit opened after {self._consecutive_failures} consecutive failures")
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+
+class LatencyTracker:
+    """Sliding window of recent successful latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class Upstream:
+    def __init__(self, name: str, max_timeout: float = 30.0, min_timeout: float = 1.0, timeout_multiplier: float = 3.0,
+                 min_samples: int = 20, hedge: bool = False, hedge_percentile: float = 95.0,
+                 breaker: Optional[CircuitBreaker] = None, ignored_errors: Tuple[Type[Exception], ...] = ()):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        # Raised by fn for reasons that say nothing about the upstream's health (e.g. no replica to call)
+        self.ignored_errors = ignored_errors
+        self.latency = LatencyTracker()
+        self.stats_counters = {"calls": 0, "failures": 0, "rejected": 0, "hedged": 0, "hedge_wins": 0}
+
+    def timeout(self) -> float:
+        """p99 latency times a multiplier, clamped to [min_timeout, max_timeout]; max_timeout until warmed up"""
+        p99 = self.latency.percentile(99)
+        if p99 is None or len(self.latency) < self.min_samples:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self.latency) < self.min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def call(self, fn: Callable[[float], Awaitable[Any]]) -> Any:
+        """
+        Run fn(timeout) through the breaker. Any exception raised by fn other than ignored_errors counts
+        as an upstream failure, so fn should only raise for transport errors and 5xx responses.
+        """
+        if not self.breaker.allow():
+            self.stats_counters["rejected"] += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        self.stats_counters["calls"] += 1
+        timeout = self.timeout()
+        start = time.perf_counter()
+        try:
+            hedge_delay = self.hedge_delay() if self.hedge else None
+            if hedge_delay is not None:
+                result = await self._hedged(fn, timeout, hedge_delay)
+            else:
+                result = await asyncio.wait_for(fn(timeout), timeout)
+        except asyncio.CancelledError:
+            self.breaker.record_cancelled()
+            raise
+        except self.ignored_errors:
+            self.breaker.record_cancelled()
+            raise
+        except Exception:
+            self.stats_counters["failures"] += 1
+            self.breaker.record_failure()
+            raise
+        self.latency.record(time.perf_counter() - start)
+        self.breaker.record_success()
+        return result
+
+    async def _hedged(self, fn: Callable[[float], Awaitable[Any]], timeout: float, hedge_delay: float) -> Any:
+        """
+        Start a second attempt if the first has not finished within hedge_delay; first success wins.
+        Both attempts share one deadline, timeout after the first started.
+        """
+        deadline = time.monotonic() + timeout
+        primary = asyncio.ensure_future(fn(timeout))
+        attempts = [primary]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=min(hedge_delay, timeout))
+            remaining = deadline - time.monotonic()
+            if not done and remaining > 0:
+                self.stats_counters["hedged"] += 1
+                attempts.append(asyncio.ensure_future(fn(remaining)))
+
+            pending = set(attempts)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError(f"{self.name} request timed out")
+                winner = None
+                for task in done:
+                    if task.exception() is None:
+                        winner = winner or task
+                    else:
+                        error = error or task.exception()
+                if winner is not None:
+                    if winner is not primary:
+                        self.stats_counters["hedge_wins"] += 1
+                    return winner.result()
+            raise error
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_counters,
+            "state": self.breaker.state,
+            "timeout": round(self.timeout(), 3),
+            "p50": self.latency.percentile(50),
+            "p99": self.latency.percentile(99),
+        }